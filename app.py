@@ -6,22 +6,37 @@ from flask import (
     redirect,
     url_for,
     session,
+    make_response,
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, emit, join_room
 from flask_cors import CORS
+from socketio import PubSubManager
 from datetime import datetime, timedelta, timezone, date
 from zoneinfo import ZoneInfo
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import func, literal, select, union_all, update, insert, bindparam, event, text, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
 from werkzeug.utils import secure_filename
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 import threading
+import queue
+import heapq
 import random
 import time
 import os
 import hashlib
 import secrets
 import re
+import pickle
+import struct
+import signal
+import base64
+import json
+import hmac
+import requests
 
 # ---------------------------------------------------
 # Flask / DB / Socket setup
@@ -50,6 +65,150 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 
+
+# ---------------------------------------------------
+# Socket.IO message queue (multi-worker broadcasting)
+# ---------------------------------------------------
+# SOCKETIO_MESSAGE_QUEUE:
+#   ""                       - no queue, emits reach this process only
+#   "local" / "local://PATH" - LocalSocketManager below, no extra services
+#   anything else            - passed to Flask-SocketIO as message_queue
+#                              (redis://, amqp://, kafka://, zmq+tcp://)
+
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE", "").strip()
+
+
+class LocalSocketManager(PubSubManager):
+    """
+    Pub/sub over a Unix socket shared by every process on this host.
+
+    The first process that takes the lock file hosts a small fan-out broker
+    for as long as it lives; everyone else connects to it. If the host dies
+    the others re-elect on reconnect, so any worker (or engine.py) can go
+    away without breaking broadcasts.
+    """
+
+    name = "localsocket"
+
+    def __init__(self, path, authkey, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.authkey = authkey
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._broker_lock_file = None
+
+    def _try_host_broker(self):
+        import fcntl
+        from multiprocessing.connection import Listener
+
+        if self._broker_lock_file is not None:
+            return True
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # stale socket from a dead host
+        listener = Listener(self.path, family="AF_UNIX", authkey=self.authkey)
+        self._broker_lock_file = lock_file
+        threading.Thread(target=self._run_broker, args=(listener,), daemon=True).start()
+        return True
+
+    def _run_broker(self, listener):
+        from multiprocessing import AuthenticationError
+
+        subscribers = {}  # conn -> send lock
+        subscribers_lock = threading.Lock()
+
+        def _fan_out(conn):
+            while True:
+                try:
+                    raw = conn.recv_bytes()
+                except (EOFError, OSError):
+                    break
+                with subscribers_lock:
+                    targets = list(subscribers.items())
+                for target, lock in targets:
+                    try:
+                        with lock:
+                            target.send_bytes(raw)
+                    except (OSError, ValueError):
+                        with subscribers_lock:
+                            subscribers.pop(target, None)
+            with subscribers_lock:
+                subscribers.pop(conn, None)
+            conn.close()
+
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            with subscribers_lock:
+                subscribers[conn] = threading.Lock()
+            threading.Thread(target=_fan_out, args=(conn,), daemon=True).start()
+
+    def _connect(self):
+        from multiprocessing.connection import Client
+
+        with self._conn_lock:
+            while self._conn is None:
+                try:
+                    self._conn = Client(self.path, family="AF_UNIX", authkey=self.authkey)
+                except (OSError, EOFError):
+                    if not self._try_host_broker():
+                        time.sleep(0.5)
+            return self._conn
+
+    def _drop(self, conn):
+        with self._conn_lock:
+            if self._conn is conn:
+                self._conn = None
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _publish(self, data):
+        raw = pickle.dumps(data)
+        for attempt in range(2):
+            conn = self._connect()
+            try:
+                with self._send_lock:
+                    conn.send_bytes(raw)
+                return
+            except (OSError, ValueError):
+                self._drop(conn)
+        self._get_logger().error("localsocket publish failed, message dropped")
+
+    def _listen(self):
+        while True:
+            conn = self._connect()
+            try:
+                yield pickle.loads(conn.recv_bytes())
+            except (EOFError, OSError):
+                # broker went away; reconnect (and possibly take over)
+                self._drop(conn)
+                time.sleep(0.2)
+
+
+def _socketio_queue_options():
+    url = SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return {}
+    if url == "local" or url.startswith("local://"):
+        path = url[len("local://"):] if url.startswith("local://") else ""
+        path = path or os.path.join(os.path.dirname(__file__), "socketio-queue.sock")
+        authkey = hashlib.sha256(("socketio-queue:" + app.config["SECRET_KEY"]).encode()).digest()
+        return {"client_manager": LocalSocketManager(path, authkey)}
+    return {"message_queue": url}
+
+
 CORS(app, resources={r"/*": {"origins": "*"}})
 socketio = SocketIO(
     app,
@@ -57,6 +216,7 @@ socketio = SocketIO(
     async_mode="threading",
     ping_timeout=60,
     ping_interval=25,
+    **_socketio_queue_options(),
 )
 
 @app.after_request
@@ -82,6 +242,50 @@ IST = ZoneInfo("Asia/Kolkata")
 
 STORE_API_SECRET = os.environ.get("STORE_API_SECRET", "change-this-store-secret-now")
 
+# Optional cart stock holds (POST /api/store/reserve)
+STORE_RESERVATION_TTL_SECONDS = int(os.environ.get("STORE_RESERVATION_TTL_SECONDS", "120"))
+
+# Wallet change webhooks to the store (see StoreWebhookDispatcher); off while
+# STORE_WEBHOOK_URL is empty. Bodies are signed with HMAC-SHA256.
+STORE_WEBHOOK_URL = os.environ.get("STORE_WEBHOOK_URL", "").strip()
+STORE_WEBHOOK_SECRET = os.environ.get("STORE_WEBHOOK_SECRET", STORE_API_SECRET)
+
+# Who runs the game tables (see "Game engine process" below and engine.py):
+#   embedded - default, this process runs the tables (single worker setups)
+#   engine   - this process runs the tables and serves them over a Unix socket
+#   client   - web worker only; bets and table state go through the engine
+GAME_ENGINE_MODE = os.environ.get("GAME_ENGINE_MODE", "embedded").strip().lower()
+GAME_ENGINE_SOCKET = os.environ.get(
+    "GAME_ENGINE_SOCKET", os.path.join(os.path.dirname(__file__), "game-engine.sock")
+)
+
+# Shared table state for multi-worker setups (see TableStateStore):
+#   ""                    - off, tables live only in this process
+#   "sqlite"              - table_state.db next to app.py
+#   "sqlite:///PATH"      - explicit file
+TABLE_STATE_STORE = os.environ.get("TABLE_STATE_STORE", "").strip()
+
+# update_table coalescing: mutations of one table inside the window go out
+# as a single broadcast; with UPDATE_TABLE_DELTAS (default on) only the
+# bets added since the previous version are sent.
+UPDATE_TABLE_WINDOW_MS = int(os.environ.get("UPDATE_TABLE_WINDOW_MS", "75"))
+UPDATE_TABLE_DELTAS = os.environ.get("UPDATE_TABLE_DELTAS", "1") == "1"
+
+# place_bet admission control, checked before any DB work (see PlaceBetGate):
+# token buckets per socket connection and per user (events/second + burst),
+# and a cap on bets being processed at once by this process.
+PLACE_BET_CONN_RATE = float(os.environ.get("PLACE_BET_CONN_RATE", "3"))
+PLACE_BET_CONN_BURST = int(os.environ.get("PLACE_BET_CONN_BURST", "6"))
+PLACE_BET_USER_RATE = float(os.environ.get("PLACE_BET_USER_RATE", "5"))
+PLACE_BET_USER_BURST = int(os.environ.get("PLACE_BET_USER_BURST", "10"))
+PLACE_BET_MAX_IN_FLIGHT = int(os.environ.get("PLACE_BET_MAX_IN_FLIGHT", "64"))
+
+# Open-round journal for warm restarts ("off" disables). Not used when the
+# shared table store is on - the store already survives restarts.
+ROUND_JOURNAL = os.environ.get(
+    "ROUND_JOURNAL", os.path.join(os.path.dirname(__file__), "round_journal.log")
+).strip()
+
 def as_utc(dt: datetime) -> datetime:
     # Treat naive datetimes as UTC (your code uses datetime.utcnow() everywhere)
     if dt is None:
@@ -101,6 +305,7 @@ def fmt_ist(dt: datetime, fmt: str = "%Y-%m-%d %H:%M") -> str:
 
 
 # forced_winners: (game_type, round_code) -> int forced_number
+# (kept in the table state store instead when TABLE_STATE_STORE is set)
 forced_winners = {}
 
 # ---------------------------------------------------
@@ -186,8 +391,11 @@ class User(db.Model):
 class Wallet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
-    balance = db.Column(db.Integer, default=0)
+    # active_history: keep the old value on assignment for the WalletChange feed
+    balance = db.column_property(db.Column(db.Integer, default=0), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bumped with every store webhook event for the user (see _bump_store_versions)
+    store_version = db.Column(db.Integer, default=0)
 
 
 class Ticket(db.Model):
@@ -208,6 +416,11 @@ class Ticket(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     last_reply_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
+    @validates("status")
+    def _normalize_status(self, key, value):
+        # stored upper-case so filters compare the raw (indexed) column
+        return (value or "OPEN").strip().upper()
+
     closed_at = db.Column(db.DateTime)
     closed_by_role = db.Column(db.String(20))
     closed_by_name = db.Column(db.String(120))
@@ -249,6 +462,20 @@ class Transaction(db.Model):
     game_title = db.Column(db.String(100))
     note = db.Column(db.Text)
     datetime = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    client_ref = db.Column(db.String(64))  # place_bet client_bet_id, unique per user
+
+    __table_args__ = (
+        db.Index("ix_transaction_user_client_ref", "user_id", "client_ref", unique=True),
+        # per-user sums/ranges of one kind (agent commission, stats)
+        db.Index("ix_transaction_user_kind_datetime", "user_id", "kind", "datetime"),
+        # per-user ledger pages (wallet history)
+        db.Index("ix_transaction_user_datetime", "user_id", "datetime", "id"),
+    )
+
+    @validates("kind")
+    def _normalize_kind(self, key, value):
+        # stored lower-case so filters compare the raw (indexed) column
+        return (value or "").strip().lower()
 
 class GameRoundHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -270,12 +497,18 @@ class GameRoundBet(db.Model):
     gametype = db.Column(db.String(50), nullable=False, index=True)
     tablenumber = db.Column(db.Integer, nullable=False)
     userid = db.Column(db.String(80))  # keep string because bots are "botXYZ"
+    user_ref = db.Column(db.Integer)  # user.id as an int; NULL for bots
     username = db.Column(db.String(120), nullable=False, index=True)
     number = db.Column(db.Integer, nullable=False)
     betamount = db.Column(db.Integer, default=0)
     isbot = db.Column(db.Boolean, default=False)
     bettime = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
+    # per-user history: index seek on user_ref, already in bet-time order
+    __table_args__ = (
+        db.Index("ix_game_round_bet_user_ref_bettime", "user_ref", "bettime"),
+    )
+
 class SubAdmin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -322,6 +555,14 @@ class UserWinControl(db.Model):
         db.UniqueConstraint("user_id", "game_type", name="uq_user_win_control_user_game"),
     )
 
+class UserWinControlRound(db.Model):
+    """One row per round already counted into user_win_control."""
+    __tablename__ = "user_win_control_round"
+
+    id = db.Column(db.Integer, primary_key=True)
+    round_code = db.Column(db.String(120), unique=True, nullable=False)
+    counted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 class Agent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -364,7 +605,7 @@ class StoreWallet(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, unique=True, index=True)
-    balance = db.Column(db.Integer, default=0, nullable=False)
+    balance = db.column_property(db.Column(db.Integer, default=0, nullable=False), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
@@ -382,6 +623,12 @@ class StoreTransaction(db.Model):
     reference = db.Column(db.String(120), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
+    __table_args__ = (
+        db.Index("ix_store_transaction_user_created", "user_id", "created_at", "id"),
+        # one row per external payment ref; NULL references don't collide
+        db.Index("ix_store_transaction_kind_user_ref", "kind", "user_id", "reference", unique=True),
+    )
+
 
 class Product(db.Model):
     __tablename__ = "product"
@@ -441,6 +688,29 @@ class StoreOrderItem(db.Model):
     line_total = db.Column(db.Integer, nullable=False)
 
 
+class StockReservation(db.Model):
+    """
+    Stock held for a cart for a few minutes (POST /api/store/reserve). The
+    stock is taken off the product when the hold is made; checkout with the
+    token uses it (USED), and an expired or cancelled hold puts it back
+    (RELEASED).
+    """
+    __tablename__ = "stock_reservation"
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(40), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
+    qty = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(10), default="HELD", nullable=False)  # HELD / USED / RELEASED
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_stock_reservation_status_expires", "status", "expires_at"),
+    )
+
+
 class PointCardPurchase(db.Model):
     __tablename__ = "point_card_purchase"
 
@@ -464,6 +734,111 @@ class WalletTransfer(db.Model):
     note = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
+    __table_args__ = (
+        db.Index("ix_wallet_transfer_user_created", "user_id", "created_at", "id"),
+    )
+
+
+class WalletChange(db.Model):
+    """
+    Append-only feed of game/store balance changes, written in the same
+    flush as the change itself (see _record_wallet_changes). `seq` is the
+    sequence number the external store syncs from; it is assigned after
+    commit by _sequence_wallet_changes, because ids can become visible out
+    of order when transactions commit concurrently.
+    """
+    __tablename__ = "wallet_change"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    wallet = db.Column(db.String(10), nullable=False)  # "game" / "store"
+    delta = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    seq = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_wallet_change_seq", "seq", unique=True),
+    )
+
+
+class StoreOutbox(db.Model):
+    """
+    Wallet change notifications for the store, added in the same commit as
+    the change (enqueue_store_event) and sent by StoreWebhookDispatcher.
+    """
+    __tablename__ = "store_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(40), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(300))
+    # dispatcher lease: a batch is sent by whoever claimed it until locked_until
+    locked_by = db.Column(db.String(80), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_store_outbox_pending", "delivered_at", "id"),
+    )
+
+
+class IdempotencyRecord(db.Model):
+    """
+    First response to a money-moving request sent with an Idempotency-Key,
+    replayed to retries (see idempotent()). status_code is NULL while the
+    first request is still running; if it hasn't finished by locked_until
+    (the process died) a retry takes the key over.
+    """
+    __tablename__ = "idempotency_record"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    endpoint = db.Column(db.String(60), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_idempotency_user_endpoint_key", "user_id", "endpoint", "key", unique=True),
+    )
+
+
+@event.listens_for(db.session, "before_flush")
+def _record_wallet_changes(session, flush_context, instances):
+    """Add a WalletChange row for every Wallet/StoreWallet balance being flushed."""
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Wallet):
+            wallet = "game"
+        elif isinstance(obj, StoreWallet):
+            wallet = "store"
+        else:
+            continue
+
+        new_balance = int(obj.balance or 0)
+        if obj in session.new:
+            old_balance = 0
+        else:
+            history = sa_inspect(obj).attrs.balance.history
+            if not history.has_changes():
+                continue
+            old_balance = int(history.deleted[0] or 0) if history.deleted else 0
+
+        if new_balance != old_balance:
+            session.add(WalletChange(
+                user_id=obj.user_id,
+                wallet=wallet,
+                delta=new_balance - old_balance,
+                balance=new_balance,
+            ))
+
 
 
 import sqlite3
@@ -523,6 +898,149 @@ def migrate_ticket_schema():
     conn.commit()
     conn.close()
 
+def _live_columns(conn, table_name):
+    """Column names of `table_name` in the configured database, or None if it doesn't exist."""
+    inspector = sa_inspect(conn)
+    if not inspector.has_table(table_name):
+        return None
+    return {c["name"] for c in inspector.get_columns(table_name)}
+
+
+def _add_missing_columns(conn, model, column_names):
+    """ALTER TABLE ... ADD COLUMN for model columns the live table lacks."""
+    table = model.__table__
+    existing = _live_columns(conn, table.name)
+    if existing is None:
+        return False
+    quote = conn.dialect.identifier_preparer.quote
+    for name in column_names:
+        if name not in existing:
+            column_type = table.c[name].type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(name)} {column_type}"))
+    return True
+
+
+def _create_model_indexes(conn, model, index_names):
+    """Create the model's named indexes if missing (create_all skips existing tables)."""
+    for index in model.__table__.indexes:
+        if index.name in index_names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def migrate_transaction_client_ref():
+    with db.engine.begin() as conn:
+        if not _add_missing_columns(conn, Transaction, ["client_ref"]):
+            return
+        # NULLs don't collide, so only bets that carried a client_bet_id are constrained
+        _create_model_indexes(conn, Transaction, {"ix_transaction_user_client_ref"})
+
+def migrate_kind_status_normalization():
+    with db.engine.begin() as conn:
+        # rows written before kind/status were normalized on write
+        if _live_columns(conn, "transaction") is not None:
+            conn.execute(
+                update(Transaction.__table__)
+                .where(Transaction.__table__.c.kind != func.lower(func.trim(Transaction.__table__.c.kind)))
+                .values(kind=func.lower(func.trim(Transaction.__table__.c.kind)))
+            )
+            _create_model_indexes(conn, Transaction, {"ix_transaction_user_kind_datetime"})
+
+        if _live_columns(conn, "ticket") is not None:
+            conn.execute(
+                update(Ticket.__table__)
+                .where(Ticket.__table__.c.status != func.upper(func.trim(Ticket.__table__.c.status)))
+                .values(status=func.upper(func.trim(Ticket.__table__.c.status)))
+            )
+
+def migrate_wallet_ledger_indexes():
+    with db.engine.begin() as conn:
+        for model, index_name in (
+            (Transaction, "ix_transaction_user_datetime"),
+            (StoreTransaction, "ix_store_transaction_user_created"),
+            (WalletTransfer, "ix_wallet_transfer_user_created"),
+        ):
+            if _live_columns(conn, model.__table__.name) is not None:
+                _create_model_indexes(conn, model, {index_name})
+
+def migrate_store_webhook_columns():
+    with db.engine.begin() as conn:
+        if _add_missing_columns(conn, Wallet, ["store_version"]):
+            table = Wallet.__table__
+            conn.execute(update(table).where(table.c.store_version.is_(None)).values(store_version=0))
+        _add_missing_columns(conn, StoreOutbox, ["locked_by", "locked_until"])
+
+def migrate_idempotency_lease():
+    with db.engine.begin() as conn:
+        # rows reserved before the lease existed have locked_until NULL, which
+        # counts as expired, so keys stuck by a crash free up on the next retry
+        _add_missing_columns(conn, IdempotencyRecord, ["locked_until"])
+
+def migrate_store_transaction_ref_unique():
+    with db.engine.begin() as conn:
+        if _live_columns(conn, "store_transaction") is None:
+            return
+        table = StoreTransaction.__table__
+        duplicates = conn.execute(
+            select(table.c.kind, table.c.user_id, table.c.reference)
+            .where(table.c.reference.isnot(None))
+            .group_by(table.c.kind, table.c.user_id, table.c.reference)
+            .having(func.count() > 1)
+            .limit(5)
+        ).all()
+        if duplicates:
+            # ledger rows aren't ours to delete; leave them for an admin to reconcile
+            print(f"⚠️ store_transaction has duplicate references (e.g. {duplicates}); "
+                  "ix_store_transaction_kind_user_ref not created")
+            return
+        _create_model_indexes(conn, StoreTransaction, {"ix_store_transaction_kind_user_ref"})
+
+def migrate_wallet_change_seq():
+    with db.engine.begin() as conn:
+        if not _add_missing_columns(conn, WalletChange, ["seq"]):
+            return
+        # rows from before `seq` existed keep their old feed position (the id),
+        # so cursors the store already holds stay valid
+        table = WalletChange.__table__
+        conn.execute(update(table).where(table.c.seq.is_(None)).values(seq=table.c.id))
+        _create_model_indexes(conn, WalletChange, {"ix_wallet_change_seq"})
+
+def migrate_game_round_bet_user_ref(batch_size=50000):
+    with db.engine.begin() as conn:
+        if not _add_missing_columns(conn, GameRoundBet, ["user_ref"]):
+            return
+        _create_model_indexes(conn, GameRoundBet, {"ix_game_round_bet_user_ref_bettime"})
+
+    # "userid is all digits", per backend
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        digits_only = "userid <> '' AND userid NOT GLOB '*[^0-9]*'"
+    elif dialect == "postgresql":
+        digits_only = "userid ~ '^[0-9]+$'"
+    else:
+        digits_only = "userid REGEXP '^[0-9]+$'"
+
+    # backfill real users' rows in id ranges, committing each batch so a big
+    # table isn't locked for the whole run
+    with db.engine.connect() as conn:
+        low, high = conn.execute(
+            text("SELECT MIN(id), MAX(id) FROM game_round_bet WHERE user_ref IS NULL")
+        ).one()
+    if low is None:
+        return
+
+    filled = 0
+    backfill = text(
+        "UPDATE game_round_bet SET user_ref = CAST(userid AS INTEGER) "
+        "WHERE id >= :start AND id < :stop AND user_ref IS NULL "
+        "AND (isbot IS NULL OR isbot = :no) "
+        f"AND {digits_only}"
+    )
+    for start in range(low, high + 1, batch_size):
+        with db.engine.begin() as conn:
+            filled += conn.execute(backfill, {"start": start, "stop": start + batch_size, "no": False}).rowcount
+    if filled:
+        print(f"✅ Backfilled user_ref on {filled} game_round_bet rows")
+
 def migrate_subadmin_phone_column():
     conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), "game.db"))
     cur = conn.cursor()
@@ -744,7 +1262,7 @@ def _build_agent_commission_data(agent, from_dt=None, to_dt=None, include_histor
     q = (
         db.session.query(Transaction)
         .filter(tx_user_col.in_(user_ids))
-        .filter(func.lower(Transaction.kind) == "bet")
+        .filter(Transaction.kind == "bet")
     )
 
     if from_dt:
@@ -846,6 +1364,318 @@ def _build_agent_commission_data(agent, from_dt=None, to_dt=None, include_histor
 game_tables = {}
 user_game_history = {}
 
+
+class TableStateStore:
+    """
+    SQLite-backed table state shared by every process on the host.
+
+    - table_state: one row per table, pickled GameTable.get_state() plus a
+      version; writers use compare_and_swap() so a stale copy never wins.
+    - table_lease: per-table lease; only the holder advances the round
+      (bots, phase changes, settlement). Other processes keep a read-only
+      view and take over when the lease expires.
+    - user_history: the user_game_history records, read-modify-write.
+    - forced_winner: super-admin overrides, so the lease owner sees one set
+      through any worker.
+    """
+
+    def __init__(self, path, owner_id, lease_seconds=15):
+        self.path = path
+        self.owner_id = owner_id
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        with self._db() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS table_state (
+                    game_type TEXT NOT NULL,
+                    table_number INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (game_type, table_number)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS table_lease (
+                    game_type TEXT NOT NULL,
+                    table_number INTEGER NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (game_type, table_number)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_history (
+                    user_id TEXT PRIMARY KEY,
+                    records BLOB NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forced_winner (
+                    game_type TEXT NOT NULL,
+                    round_code TEXT NOT NULL,
+                    number INTEGER NOT NULL,
+                    PRIMARY KEY (game_type, round_code)
+                )
+            """)
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    # -- leases (wall clock, since it is compared across processes)
+
+    def acquire_lease(self, game_type, table_number):
+        """Take or renew the lease. True if this process holds it afterwards."""
+        now = time.time()
+        cur = self._db().execute(
+            """
+            INSERT INTO table_lease (game_type, table_number, owner, expires_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (game_type, table_number) DO UPDATE
+            SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE table_lease.owner = excluded.owner OR table_lease.expires_at < ?
+            """,
+            (game_type, table_number, self.owner_id, now + self.lease_seconds, now),
+        )
+        return cur.rowcount == 1
+
+    def release_lease(self, game_type, table_number):
+        self._db().execute(
+            "DELETE FROM table_lease WHERE game_type = ? AND table_number = ? AND owner = ?",
+            (game_type, table_number, self.owner_id),
+        )
+
+    # -- table state
+
+    def load(self, game_type, table_number):
+        """(version, state) or (0, None) if the table is not in the store."""
+        row = self._db().execute(
+            "SELECT version, state FROM table_state WHERE game_type = ? AND table_number = ?",
+            (game_type, table_number),
+        ).fetchone()
+        if not row:
+            return 0, None
+        return row[0], pickle.loads(row[1])
+
+    def load_all(self):
+        """{game_type: [(version, state), ...]} ordered by table number."""
+        out = {}
+        rows = self._db().execute(
+            "SELECT game_type, version, state FROM table_state ORDER BY game_type, table_number"
+        ).fetchall()
+        for game_type, version, raw in rows:
+            out.setdefault(game_type, []).append((version, pickle.loads(raw)))
+        return out
+
+    def insert(self, game_type, table_number, state):
+        """Create the row if missing. Returns 1 on success, None if it already exists."""
+        cur = self._db().execute(
+            """
+            INSERT OR IGNORE INTO table_state (game_type, table_number, version, state, updated_at)
+            VALUES (?, ?, 1, ?, ?)
+            """,
+            (game_type, table_number, pickle.dumps(state), time.time()),
+        )
+        return 1 if cur.rowcount == 1 else None
+
+    def compare_and_swap(self, game_type, table_number, expected_version, state):
+        """Write `state` if the row is still at `expected_version`; returns the new version or None."""
+        cur = self._db().execute(
+            """
+            UPDATE table_state SET version = version + 1, state = ?, updated_at = ?
+            WHERE game_type = ? AND table_number = ? AND version = ?
+            """,
+            (pickle.dumps(state), time.time(), game_type, table_number, expected_version),
+        )
+        return expected_version + 1 if cur.rowcount == 1 else None
+
+    def delete(self, game_type, table_number):
+        conn = self._db()
+        conn.execute("DELETE FROM table_state WHERE game_type = ? AND table_number = ?", (game_type, table_number))
+        conn.execute("DELETE FROM table_lease WHERE game_type = ? AND table_number = ?", (game_type, table_number))
+
+    # -- user history
+
+    def update_user_history(self, user_id, fn):
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT records FROM user_history WHERE user_id = ?", (str(user_id),)).fetchone()
+            records = fn(pickle.loads(row[0]) if row else [])
+            conn.execute(
+                "INSERT OR REPLACE INTO user_history (user_id, records) VALUES (?, ?)",
+                (str(user_id), pickle.dumps(records)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load_user_history(self):
+        out = {}
+        for uid, raw in self._db().execute("SELECT user_id, records FROM user_history").fetchall():
+            out[int(uid) if uid.isdigit() else uid] = pickle.loads(raw)
+        return out
+
+    # -- forced winners
+
+    def set_forced_winner(self, game_type, round_code, number):
+        """number=None clears it."""
+        if number is None:
+            self._db().execute(
+                "DELETE FROM forced_winner WHERE game_type = ? AND round_code = ?", (game_type, round_code)
+            )
+        else:
+            self._db().execute(
+                "INSERT OR REPLACE INTO forced_winner (game_type, round_code, number) VALUES (?, ?, ?)",
+                (game_type, round_code, int(number)),
+            )
+
+    def forced_winner(self, game_type, round_code):
+        row = self._db().execute(
+            "SELECT number FROM forced_winner WHERE game_type = ? AND round_code = ?", (game_type, round_code)
+        ).fetchone()
+        return row[0] if row else None
+
+    def forced_winners(self):
+        rows = self._db().execute("SELECT game_type, round_code, number FROM forced_winner").fetchall()
+        return {(game_type, round_code): number for game_type, round_code, number in rows}
+
+
+def _make_table_state_store():
+    if not TABLE_STATE_STORE:
+        return None
+    if TABLE_STATE_STORE.startswith("sqlite:///"):
+        path = TABLE_STATE_STORE[len("sqlite:///"):]
+    else:
+        path = os.path.join(os.path.dirname(__file__), "table_state.db")
+    owner_id = f"{os.uname().nodename}:{os.getpid()}:{secrets.token_hex(4)}"
+    return TableStateStore(path, owner_id)
+
+
+table_state_store = _make_table_state_store()
+
+
+class RoundJournal:
+    """
+    Append-only log of open-round table state, replayed on startup so a
+    restart resumes in-flight rounds instead of orphaning paid bets.
+
+    Every table mutation appends the table's full state (length-prefixed
+    pickle); the latest frame per table wins on replay and a torn final
+    frame is ignored. Every `compact_every` appends the file is rewritten
+    with one frame per table (fsync + atomic rename).
+    """
+
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, path, compact_every=500):
+        self.path = path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._latest = self._replay()
+        self._appends = 0
+        self._compact()
+
+    def _replay(self):
+        latest = {}
+        if not os.path.exists(self.path):
+            return latest
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(self._HEADER.size)
+                if len(header) < self._HEADER.size:
+                    break
+                (size,) = self._HEADER.unpack(header)
+                raw = f.read(size)
+                if len(raw) < size:
+                    break  # torn write at crash time
+                try:
+                    key, state = pickle.loads(raw)
+                except Exception:
+                    break
+                if state is None:
+                    latest.pop(key, None)
+                else:
+                    latest[key] = state
+        return latest
+
+    def _write_frame(self, f, key, state):
+        raw = pickle.dumps((key, state))
+        f.write(self._HEADER.pack(len(raw)) + raw)
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for key, state in self._latest.items():
+                self._write_frame(f, key, state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "ab")
+        self._appends = 0
+
+    def _append(self, key, state):
+        with self._lock:
+            if state is None:
+                self._latest.pop(key, None)
+            else:
+                self._latest[key] = state
+            self._write_frame(self._file, key, state)
+            self._file.flush()
+            self._appends += 1
+            if self._appends >= self.compact_every:
+                self._file.close()
+                self._compact()
+
+    def record(self, table):
+        # held bets are kept, with their bet_ref: a restart resolves them
+        # against the ledger (see _restore_table)
+        self._append((table.game_type, table.table_number), table.get_state())
+
+    def forget(self, table):
+        self._append((table.game_type, table.table_number), None)
+
+    def load(self):
+        """{(game_type, table_number): state} as of the last write."""
+        with self._lock:
+            return dict(self._latest)
+
+    def sync(self):
+        """Flush and fsync everything written so far (shutdown hand-off)."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+
+def _make_round_journal():
+    if not ROUND_JOURNAL or ROUND_JOURNAL.lower() == "off":
+        return None
+    if table_state_store is not None or GAME_ENGINE_MODE == "client":
+        return None
+    return RoundJournal(ROUND_JOURNAL)
+
+
+round_journal = _make_round_journal()
+
+
+def _journal_table(table):
+    if round_journal is not None:
+        round_journal.record(table)
+
+
+def _update_user_history(user_id, fn):
+    """Apply fn(records) -> records to one user's history, shared store first."""
+    if table_state_store is not None:
+        table_state_store.update_user_history(user_id, fn)
+    else:
+        user_game_history[user_id] = fn(user_game_history.get(user_id, []))
+
 CONTROL_RULES = {
     "silver": {"due_after_losses": 6, "target_real_win_rate": 0.10},
     "gold": {"due_after_losses": 6, "target_real_win_rate": 0.10},
@@ -935,6 +1765,15 @@ def update_user_win_control_after_round(table, result_number):
     if not per_user_numbers:
         return
 
+    # the marker commits with the counters, so a re-settled round
+    # (lease takeover, restart) is counted once
+    db.session.add(UserWinControlRound(round_code=table.round_code))
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return
+
     for uid, numbers in per_user_numbers.items():
         ctrl = get_or_create_user_win_control(uid, table.game_type)
         ctrl.played_rounds = int(ctrl.played_rounds or 0) + 1
@@ -952,6 +1791,7 @@ def update_user_win_control_after_round(table, result_number):
 
 ROUND_SECONDS = 300  # 5 minutes
 ROULETTE_ROUND_SECONDS = 3600  # 2 minutes for roulette (testing)
+BET_RECEIPTS_PER_TABLE = 512  # bet_success replies kept for place_bet retries
 
 
 def _floor_epoch(ts: int, period: int) -> int:
@@ -1024,6 +1864,155 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated
 
+
+# ---------------------------------------------------
+# Idempotency-Key for money-moving endpoints
+# ---------------------------------------------------
+# A request carrying `Idempotency-Key: <up to 100 chars>` runs once per
+# user/endpoint/key: the first response (other than a 5xx) is stored and
+# replayed to retries for IDEMPOTENCY_TTL_HOURS. Completed responses are
+# also kept in an in-process LRU so a retry storm is served from memory.
+# A running request holds the key for IDEMPOTENCY_LEASE_SECONDS; a retry
+# after that (the first process died mid-request) runs it again.
+
+IDEMPOTENCY_TTL_HOURS = 24
+IDEMPOTENCY_CACHE_SIZE = 10000
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+# (user_id, endpoint, key) -> ((hash, status, body), expires_at monotonic)
+_idempotency_cache = OrderedDict()
+_idempotency_lock = threading.Lock()
+_idempotency_last_purge = [0.0]
+
+
+def _idempotency_cache_get(cache_key):
+    with _idempotency_lock:
+        hit = _idempotency_cache.get(cache_key)
+        if hit is None:
+            return None
+        stored, expires_at = hit
+        if expires_at <= time.monotonic():
+            del _idempotency_cache[cache_key]
+            return None
+        _idempotency_cache.move_to_end(cache_key)
+        return stored
+
+
+def _idempotency_cache_put(cache_key, value, created_at=None):
+    """Cache a completed response until its record's TTL runs out."""
+    ttl = IDEMPOTENCY_TTL_HOURS * 3600
+    if created_at is not None:
+        ttl -= (datetime.utcnow() - created_at).total_seconds()
+    if ttl <= 0:
+        return
+    with _idempotency_lock:
+        _idempotency_cache[cache_key] = (value, time.monotonic() + ttl)
+        _idempotency_cache.move_to_end(cache_key)
+        while len(_idempotency_cache) > IDEMPOTENCY_CACHE_SIZE:
+            _idempotency_cache.popitem(last=False)
+
+
+def _idempotent_replay(stored, request_hash):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return jsonify(success=False, message="Idempotency-Key was already used for a different request"), 422
+    resp = make_response(body, status_code)
+    resp.headers["Content-Type"] = "application/json"
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def _purge_idempotency_records():
+    if time.monotonic() - _idempotency_last_purge[0] < 600:
+        return
+    _idempotency_last_purge[0] = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    IdempotencyRecord.query.filter(IdempotencyRecord.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(endpoint):
+    """Honour an Idempotency-Key header on the wrapped view (put it under login_required)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = (request.headers.get("Idempotency-Key") or "").strip()
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > 100:
+                return jsonify(success=False, message="Idempotency-Key too long"), 400
+
+            user_id = int(_get_session_user_id())
+            cache_key = (user_id, endpoint, key)
+            request_hash = hashlib.sha256(request.get_data() or b"").hexdigest()
+
+            stored = _idempotency_cache_get(cache_key)
+            if stored is not None:
+                return _idempotent_replay(stored, request_hash)
+
+            # reserve the key; the unique index makes one request the winner
+            # across threads and processes
+            now_utc = datetime.utcnow()
+            lease = now_utc + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            record = IdempotencyRecord(
+                user_id=user_id, endpoint=endpoint, key=key,
+                request_hash=request_hash, locked_until=lease,
+            )
+            db.session.add(record)
+            try:
+                db.session.commit()
+                record_id = record.id
+            except IntegrityError:
+                db.session.rollback()
+                existing = IdempotencyRecord.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+                if existing is None:
+                    return jsonify(success=False, message="A request with this Idempotency-Key is still in progress"), 409
+                if existing.status_code is not None:
+                    stored = (existing.request_hash, existing.status_code, existing.response)
+                    _idempotency_cache_put(cache_key, stored, existing.created_at)
+                    return _idempotent_replay(stored, request_hash)
+                if existing.request_hash != request_hash:
+                    return jsonify(success=False, message="Idempotency-Key was already used for a different request"), 422
+
+                # still running, unless its lease ran out; then this retry takes over
+                table = IdempotencyRecord.__table__
+                taken = db.session.execute(
+                    update(table)
+                    .where(
+                        table.c.id == existing.id,
+                        table.c.status_code.is_(None),
+                        db.or_(table.c.locked_until.is_(None), table.c.locked_until <= now_utc),
+                    )
+                    .values(locked_until=lease)
+                ).rowcount
+                db.session.commit()
+                if not taken:
+                    return jsonify(success=False, message="A request with this Idempotency-Key is still in progress"), 409
+                record_id = existing.id
+
+            try:
+                resp = make_response(f(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                IdempotencyRecord.query.filter_by(id=record_id).delete()
+                db.session.commit()
+                raise
+
+            if resp.status_code >= 500:
+                # nothing was applied; let a retry run again
+                IdempotencyRecord.query.filter_by(id=record_id).delete()
+            else:
+                body = resp.get_data(as_text=True)
+                IdempotencyRecord.query.filter_by(id=record_id).update(
+                    {"status_code": resp.status_code, "response": body, "locked_until": None}
+                )
+                _idempotency_cache_put(cache_key, (request_hash, resp.status_code, body))
+            db.session.commit()
+            _purge_idempotency_records()
+            return resp
+        return decorated
+    return decorator
+
 from functools import wraps
 from flask import session, redirect, url_for
 
@@ -1151,6 +2140,78 @@ def ensure_wallet_for_user(user: User, starting_balance: int = 10000) -> Wallet:
     return user.wallet
 
 
+def push_balance(user_id, balance, reason, **extra):
+    """
+    Tell the user's open pages their game wallet changed, via the private
+    user:<id> room they join on connect. Call after the commit.
+    """
+    try:
+        socketio.emit(
+            "balance",
+            {"balance": int(balance or 0), "reason": reason, **extra},
+            to=f"user:{user_id}",
+        )
+    except Exception as e:
+        print("push_balance error:", e)
+
+
+def store_outbox_row(event, user_id, game_balance, store_balance=None, **extra):
+    """Column values for one StoreOutbox row (also used for bulk inserts)."""
+    payload = {"userid": user_id, "gamebalance": int(game_balance or 0), **extra}
+    if store_balance is not None:
+        payload["storebalance"] = int(store_balance or 0)
+    now_utc = datetime.utcnow()
+    return {
+        "event": event,
+        "user_id": user_id,
+        "payload": json.dumps(payload),
+        "created_at": now_utc,
+        "next_attempt_at": now_utc,
+    }
+
+
+def _bump_store_versions(counts):
+    """
+    Reserve counts[user_id] store versions per user in the current
+    transaction; returns {user_id: highest version reserved}. The bump holds
+    the wallet row lock until commit, so a user's versions follow the order
+    their balance changes commit in, whatever order the events are sent in.
+    """
+    if not counts:
+        return {}
+    table = Wallet.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("uid"))
+        .values(store_version=func.coalesce(table.c.store_version, 0) + bindparam("n")),
+        [{"uid": uid, "n": n} for uid, n in counts.items()],
+    )
+    versions = {}
+    for chunk in _chunks(sorted(counts)):
+        versions.update(
+            db.session.execute(
+                select(table.c.user_id, func.max(table.c.store_version))
+                .where(table.c.user_id.in_(chunk))
+                .group_by(table.c.user_id)
+            ).all()
+        )
+    return {uid: int(v or 0) for uid, v in versions.items()}
+
+
+def enqueue_store_event(event, user_id, game_balance, store_balance=None, **extra):
+    """
+    Queue a wallet change for the store webhook. Call before the commit of
+    the change itself, so both land or neither does. The payload's `version`
+    grows per user; the store should ignore an event older than one it has.
+    """
+    if not STORE_WEBHOOK_URL:
+        return
+    version = _bump_store_versions({user_id: 1}).get(user_id, 0)
+    db.session.add(StoreOutbox(**store_outbox_row(
+        event, user_id, game_balance, store_balance, version=version, **extra
+    )))
+
+
 def ensure_store_wallet_for_user(user, starting_balance=0):
     if not user:
         return None
@@ -1205,27 +2266,154 @@ def generate_bot_name():
 
 
 # ---------------------------------------------------
-# GameTable class
+# Per-table mailbox (single writer)
 # ---------------------------------------------------
 
+TABLE_CALL_TIMEOUT_SECONDS = 5.0
 
-class GameTable:
-    def __init__(self, game_type, table_number, initial_delay=0):
-        # main attributes
-        self.game_type = game_type
-        self.table_number = table_number
-        self.config = GAME_CONFIGS[game_type]
 
-        # compatibility aliases for older code
-        self.gametype = game_type        # many places use table.gametype
-        self.tablenumber = table_number  # many places use table.tablenumber
-        self.maxplayers = None           # will be set after max_players is computed
+class TableBusy(Exception):
+    """The table's loop didn't run a mailbox call (stopped, or too slow to start it)."""
+
+
+class TableMailbox:
+    """
+    Calls queued for a table's game-loop thread, the only thread allowed to
+    mutate the table. The loop serves the mailbox whenever it would
+    otherwise sleep, so bet admission, phase changes and the round reset
+    happen in one order, with no races and no lock shared between tables.
+    Calls must stay in memory: DB work belongs to the caller, so it can't
+    push back the table's phase deadlines.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.owner = None    # the game-loop thread, set when it starts
+        self.closed = None   # reason, once the loop has exited
+
+    def call(self, fn, *args, timeout=TABLE_CALL_TIMEOUT_SECONDS):
+        """Run fn(*args) on the table's thread and return its result."""
+        if self.owner is threading.current_thread():
+            return fn(*args)
+        if self.closed:
+            raise TableBusy(self.closed)
+
+        future = Future()
+        self._queue.put((future, fn, args))
+        if self.closed:
+            self._fail_pending()
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise TableBusy("table did not answer in time")
+            # already running on the table's thread: its outcome stands, so
+            # wait for it rather than report a failure for work that happens
+            return future.result()
+
+    def serve(self, table, seconds):
+        """Run queued calls (under the table's lock) for `seconds`."""
+        deadline = time.monotonic() + max(0.0, seconds)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                future, fn, args = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue  # caller gave up waiting
+            try:
+                with table._state_lock:
+                    result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def close(self, reason):
+        self.closed = reason
+        self._fail_pending()
+
+    def _fail_pending(self):
+        while True:
+            try:
+                future, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if future.set_running_or_notify_cancel():
+                future.set_exception(TableBusy(self.closed))
+
+
+# ---------------------------------------------------
+# Phase transition lateness
+# ---------------------------------------------------
+
+
+class LatenessHistogram:
+    """Per-phase histogram of how late a deadline-driven transition fired."""
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = {}  # phase -> {"counts": [...], "total_ms": float, "max_ms": float}
+
+    def observe(self, phase, late_seconds):
+        late_ms = max(0.0, late_seconds * 1000.0)
+        with self._lock:
+            row = self._phases.setdefault(
+                phase, {"counts": [0] * (len(self.BUCKETS_MS) + 1), "total_ms": 0.0, "max_ms": 0.0}
+            )
+            idx = next((i for i, edge in enumerate(self.BUCKETS_MS) if late_ms <= edge), len(self.BUCKETS_MS))
+            row["counts"][idx] += 1
+            row["total_ms"] += late_ms
+            row["max_ms"] = max(row["max_ms"], late_ms)
+
+    def snapshot(self):
+        out = {}
+        with self._lock:
+            for phase, row in self._phases.items():
+                count = sum(row["counts"])
+                labels = [f"<={edge}ms" for edge in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+                out[phase] = {
+                    "count": count,
+                    "mean_ms": round(row["total_ms"] / count, 3) if count else 0.0,
+                    "max_ms": round(row["max_ms"], 3),
+                    "buckets": dict(zip(labels, row["counts"])),
+                }
+        return out
+
+
+phase_lateness = LatenessHistogram()
+
+
+# ---------------------------------------------------
+# GameTable class
+# ---------------------------------------------------
+
+
+class GameTable:
+    def __init__(self, game_type, table_number, initial_delay=0):
+        # main attributes
+        self.game_type = game_type
+        self.table_number = table_number
+        self.config = GAME_CONFIGS[game_type]
+
+        # compatibility aliases for older code
+        self.gametype = game_type        # many places use table.gametype
+        self.tablenumber = table_number  # many places use table.tablenumber
+        self.maxplayers = None           # will be set after max_players is computed
 
                       # predictable schedule (roulette uses different duration & no-bet window)
         round_duration = ROULETTE_ROUND_SECONDS if game_type == "roulette" else ROUND_SECONDS
         no_bet_window = 60 if game_type == "roulette" else 15
 
         base = floor_to_period(datetime.utcnow(), round_duration)
+        # stagger offset, reused on every new round; a delay of a whole period
+        # (or more) opens the first round in a later period
+        self.initial_delay = initial_delay % round_duration
         self.start_time = base + timedelta(seconds=initial_delay)
         self.end_time = self.start_time + timedelta(seconds=round_duration)
         self.betting_close_time = self.end_time - timedelta(seconds=no_bet_window)
@@ -1236,6 +2424,7 @@ class GameTable:
         self.result = None
         self.is_betting_closed = False
         self.is_finished = False
+        self.is_settled = False  # payouts committed for this round
         self._spin_emitted = False
 
         # roulette needs 37 unique numbers, other games keep 6
@@ -1243,13 +2432,29 @@ class GameTable:
         self.maxplayers = self.max_players
 
         self.last_bot_added_at = None
+        self.is_retired = False  # set when the elastic pool removes this table
+
+        # shared-store bookkeeping (TABLE_STATE_STORE), see _sync_table_with_store
+        self._state_lock = threading.RLock()
+        self._state_version = 0
+        self._state_base = None
+        self._lease_until = 0.0
+
+        # (user_id, client_bet_id) -> bet_success payload, oldest first
+        self._bet_receipts = OrderedDict()
+        # bet_ref -> (round_code, bet) for held bets the draw kept
+        self._kept_held_bets = OrderedDict()
+        self.mailbox = TableMailbox()
+
+        self.anchor_deadlines()
 
     def get_number_range(self):
         if self.game_type == "roulette":
             return list(range(37))
         return list(range(10))
 
-    def add_bet(self, user_id, username, number, is_bot=False):
+    def add_bet(self, user_id, username, number, is_bot=False, record_history=True, client_bet_id=None,
+                bet_ref=None, held=False):
         try:
             number_int = int(number)
         except (TypeError, ValueError):
@@ -1287,25 +2492,33 @@ class GameTable:
             "bet_amount": self.config["bet_amount"],
             "bet_time": datetime.utcnow(),
         }
+        if client_bet_id:
+            bet_obj["client_bet_id"] = client_bet_id
+        if bet_ref:
+            bet_obj["bet_ref"] = bet_ref  # the bet Transaction's client_ref
+        if held:
+            bet_obj["held"] = True  # seat taken, wallet debit not committed yet
         self.bets.append(bet_obj)
+        table_matchmaker.update(self)
+        open_bet_index.update(self)
 
-        if not is_bot:
-            if user_id_norm not in user_game_history:
-                user_game_history[user_id_norm] = []
-            user_game_history[user_id_norm].append(
-                {
-                    "game_type": self.game_type,
-                    "round_code": self.round_code,
-                    "bet_amount": self.config["bet_amount"],
-                    "number": number,
-                    "bet_time": datetime.utcnow(),
-                    "table_number": self.table_number,
-                    "is_resolved": False,
-                }
-            )
+        if not is_bot and record_history:
+            self.record_user_bet(user_id_norm, number)
 
         return True, "Bet placed successfully"
 
+    def record_user_bet(self, user_id, number):
+        rec = {
+            "game_type": self.game_type,
+            "round_code": self.round_code,
+            "bet_amount": self.config["bet_amount"],
+            "number": number,
+            "bet_time": datetime.utcnow(),
+            "table_number": self.table_number,
+            "is_resolved": False,
+        }
+        _update_user_history(user_id, lambda records: records + [rec])
+
     def add_bot_bet(self):
         if len(self.bets) >= self.max_players:
             return False
@@ -1355,7 +2568,46 @@ class GameTable:
                 )
         return winners
 
+    def anchor_deadlines(self):
+        """
+        Pin this round's start/close/end to time.monotonic() so a wall-clock
+        jump can't move a phase transition. Call whenever the round's
+        start_time / betting_close_time / end_time change.
+        """
+        wall_now = datetime.utcnow()
+        mono_now = time.monotonic()
+        self._mono_start = mono_now + (self.start_time - wall_now).total_seconds()
+        self._mono_close = mono_now + (self.betting_close_time - wall_now).total_seconds()
+        self._mono_end = mono_now + (self.end_time - wall_now).total_seconds()
+
+    def seconds_remaining(self):
+        """Exact seconds until end_time (monotonic), never negative."""
+        return max(0.0, self._mono_end - time.monotonic())
+
+    def betting_open(self):
+        """Bets are refused from the closing instant on, not at the next loop tick."""
+        return (
+            not self.is_betting_closed
+            and not self.is_finished
+            and time.monotonic() < self._mono_close
+        )
+
+    def next_deadline_in(self, cap=1.0):
+        """Seconds to sleep until the next phase deadline (at most `cap`)."""
+        mono = time.monotonic()
+        points = [self._mono_start, self._mono_close, self._mono_end - 2, self._mono_end]
+        if self.game_type == "roulette":
+            points.append(self._mono_end - 15)
+        upcoming = [p - mono for p in points if p > mono]
+        return max(0.0, min([cap] + upcoming))
+
     def get_time_remaining(self):
+        if getattr(self, "_mono_end", None) is not None and getattr(self, "_mono_start", None) is not None:
+            if time.monotonic() < self._mono_start:
+                return int((self.end_time - self.start_time).total_seconds())
+            return int(self.seconds_remaining())
+
+        # read-only views (GameTable.from_state) have no monotonic anchors
         now = datetime.utcnow()
         if now < self.start_time:
             return int((self.end_time - self.start_time).total_seconds())
@@ -1363,10 +2615,78 @@ class GameTable:
             return 0
         return int((self.end_time - now).total_seconds())
 
+    def get_deadlines(self):
+        """Phase deadlines as UTC epoch seconds, for client-side countdowns."""
+        return {
+            "start_ts": as_utc(self.start_time).timestamp(),
+            "betting_close_ts": as_utc(self.betting_close_time).timestamp(),
+            "end_ts": as_utc(self.end_time).timestamp(),
+        }
 
     def get_slots_available(self):
         return self.max_players - len(self.bets)
 
+    def bet_receipt(self, user_id, client_bet_id):
+        """
+        bet_success for a retried place_bet, or None. Falls back to the bets
+        themselves (they carry client_bet_id) for bets admitted by another
+        process or before a restart; those replies have no new_balance.
+        """
+        key = (str(user_id), client_bet_id)
+        receipts = self.__dict__.get("_bet_receipts")
+        if receipts and key in receipts:
+            return receipts[key]
+
+        for bet in self.bets:
+            if bet.get("client_bet_id") == client_bet_id and str(bet["user_id"]) == key[0] and not bet.get("held"):
+                return {
+                    "message": "Bet placed successfully",
+                    "round_code": self.round_code,
+                    "table_number": self.table_number,
+                    "game_type": self.game_type,
+                    "bet": {"user_id": key[0], "username": bet["username"], "number": bet["number"]},
+                    "players": len(self.bets),
+                    "slots_available": self.get_slots_available(),
+                    "client_bet_id": client_bet_id,
+                }
+        return None
+
+    def remember_bet_receipt(self, user_id, client_bet_id, payload):
+        receipts = self.__dict__.setdefault("_bet_receipts", OrderedDict())
+        receipts[(str(user_id), client_bet_id)] = payload
+        while len(receipts) > BET_RECEIPTS_PER_TABLE:
+            receipts.popitem(last=False)
+
+    def kept_held_bet(self, bet_ref):
+        """(round_code, bet) for a held bet _resolve_held_bets kept in the draw, else None."""
+        kept = self.__dict__.get("_kept_held_bets")
+        return kept.get(bet_ref) if kept else None
+
+    def remember_kept_held_bet(self, bet_ref, bet):
+        kept = self.__dict__.setdefault("_kept_held_bets", OrderedDict())
+        kept[bet_ref] = (self.round_code, {k: v for k, v in bet.items() if k != "held"})
+        while len(kept) > BET_RECEIPTS_PER_TABLE:
+            kept.popitem(last=False)
+
+    # process-local bookkeeping, never shipped to other processes
+    LOCAL_ONLY_ATTRS = (
+        "_state_lock", "_state_version", "_state_base", "_lease_until",
+        "_mono_start", "_mono_close", "_mono_end", "_bet_receipts", "_kept_held_bets", "mailbox",
+    )
+
+    def get_state(self):
+        """Plain, picklable copy of the table (IPC snapshots, shared store)."""
+        state = {k: v for k, v in self.__dict__.items() if k not in self.LOCAL_ONLY_ATTRS}
+        state["bets"] = [dict(b) for b in self.bets]
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Read-only view rebuilt from get_state(); not driven by a game thread."""
+        table = cls.__new__(cls)
+        table.__dict__.update(state)
+        return table
+
     def is_started(self):
         return datetime.utcnow() >= self.start_time
 
@@ -1384,9 +2704,365 @@ class GameTable:
             "is_started": self.is_started(),
             "bets": self.bets,
             "result": self.result,
+            **self.get_deadlines(),
         }
 
 
+# ---------------------------------------------------
+# Open-table matchmaking
+# ---------------------------------------------------
+
+
+class TableMatchmaker:
+    """
+    Per-game heap of open tables so place_bet without a round_code can pick
+    the best table in O(log n) instead of always filling table 1 first.
+
+    Ranking: most free slots first (spreads load), then most time remaining,
+    then lowest table number. Entries are invalidated lazily: every update()
+    bumps the table's version and pushes a fresh entry; stale entries are
+    dropped when they reach the top of the heap, and the whole heap is
+    compacted once stale entries outnumber the tables.
+    """
+
+    COMPACT_SLACK = 16  # stale entries tolerated on top of 1 per table
+
+    def __init__(self):
+        self._heaps = {}     # game_type -> [(key..., version, table)]
+        self._versions = {}  # (game_type, table_number) -> int
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_open(table):
+        return table.betting_open() and len(table.bets) < table.max_players
+
+    @staticmethod
+    def _sort_key(table):
+        return (
+            -table.get_slots_available(),
+            -as_utc(table.end_time).timestamp(),
+            table.table_number,
+        )
+
+    def update(self, table):
+        """Call after every bet and phase change of `table`."""
+        vkey = (table.game_type, table.table_number)
+        with self._lock:
+            version = self._versions.get(vkey, 0) + 1
+            self._versions[vkey] = version
+            heap = self._heaps.setdefault(table.game_type, [])
+            if self._is_open(table):
+                heapq.heappush(heap, (*self._sort_key(table), version, table))
+            self._maybe_compact(table.game_type, heap)
+
+    def discard(self, table):
+        """Forget `table` entirely (its heap entries become stale)."""
+        vkey = (table.game_type, table.table_number)
+        with self._lock:
+            self._versions[vkey] = self._versions.get(vkey, 0) + 1
+            self._maybe_compact(table.game_type, self._heaps.get(table.game_type) or [])
+
+    def _maybe_compact(self, game_type, heap):
+        """Drop every stale entry once they outnumber the live tables (lock held)."""
+        tables = sum(1 for g, _ in self._versions if g == game_type)
+        if len(heap) <= 2 * tables + self.COMPACT_SLACK:
+            return
+        heap[:] = [
+            entry for entry in heap
+            if entry[-2] == self._versions.get((entry[-1].game_type, entry[-1].table_number))
+        ]
+        heapq.heapify(heap)
+
+    def best(self, game_type):
+        """Return the best open table for `game_type`, or None."""
+        with self._lock:
+            heap = self._heaps.get(game_type) or []
+            while heap:
+                entry = heap[0]
+                version, table = entry[-2], entry[-1]
+                current = self._versions.get((table.game_type, table.table_number))
+                if version != current:
+                    heapq.heappop(heap)
+                    continue
+                if not self._is_open(table):
+                    heapq.heappop(heap)
+                    continue
+                if entry[:3] != self._sort_key(table):
+                    # table changed without an update(); re-rank it
+                    heapq.heapreplace(heap, (*self._sort_key(table), version, table))
+                    continue
+                return table
+            return None
+
+
+table_matchmaker = TableMatchmaker()
+
+
+class OpenBetIndex:
+    """
+    user id -> tables where that user has a bet in the current round, so
+    "my current games" is a lookup instead of a scan of every table's bets.
+    Updated at the same points as table_matchmaker; readers still re-check
+    the table, since it can move on between an update and the read.
+    """
+
+    def __init__(self):
+        self._by_user = {}   # user_id -> {(game_type, table_number): table}
+        self._by_table = {}  # (game_type, table_number) -> set of user_ids
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _user_ids(table):
+        ids = set()
+        for bet in table.bets or []:
+            if bet.get("is_bot"):
+                continue
+            try:
+                ids.add(int(bet.get("user_id")))
+            except (TypeError, ValueError):
+                pass
+        return ids
+
+    def update(self, table):
+        """Call after every bet and round reset of `table`."""
+        self._set(table, set() if table.is_retired else self._user_ids(table))
+
+    def discard(self, table):
+        self._set(table, set())
+
+    def _set(self, table, user_ids):
+        key = (table.game_type, table.table_number)
+        with self._lock:
+            for uid in self._by_table.get(key, set()) - user_ids:
+                entries = self._by_user.get(uid)
+                if entries is not None:
+                    entries.pop(key, None)
+                    if not entries:
+                        del self._by_user[uid]
+            for uid in user_ids:
+                self._by_user.setdefault(uid, {})[key] = table
+            if user_ids:
+                self._by_table[key] = user_ids
+            else:
+                self._by_table.pop(key, None)
+
+    def tables_for(self, user_id):
+        with self._lock:
+            return list(self._by_user.get(int(user_id), {}).values())
+
+
+open_bet_index = OpenBetIndex()
+
+
+# ---------------------------------------------------
+# Shared table state sync (TABLE_STATE_STORE)
+# ---------------------------------------------------
+# Every process keeps a local GameTable per table and a game thread for it.
+# Each tick the thread pulls the stored state and renews the lease; only the
+# lease holder advances the round and publishes with compare-and-swap. Bet
+# admission from any process is a CAS on the same row.
+
+class TableOwnershipLost(Exception):
+    """The stored table changed under the owner (lease lost or round moved on)."""
+
+
+def _phase_of(state):
+    return (state.get("round_code"), state.get("is_betting_closed"), state.get("is_finished"), state.get("result"))
+
+
+def _apply_table_state(table, version, state):
+    table.__dict__.update(state)
+    table.anchor_deadlines()
+    table._state_version = version
+    table._state_base = _phase_of(state)
+    table_matchmaker.update(table)
+    open_bet_index.update(table)
+
+
+def _table_from_store(version, state):
+    table = GameTable.from_state(state)
+    table._state_lock = threading.RLock()
+    table._lease_until = 0.0
+    table.mailbox = TableMailbox()
+    _apply_table_state(table, version, state)
+    return table
+
+
+def _drop_local_table(table):
+    table.is_retired = True
+    table_matchmaker.discard(table)
+    open_bet_index.discard(table)
+    with _table_pool_lock:
+        tables = game_tables.get(table.game_type, [])
+        if table in tables:
+            game_tables[table.game_type] = [t for t in tables if t is not table]
+
+
+def _sync_table_with_store(table):
+    """
+    Start of every game-loop tick. Pulls the shared state into `table` and
+    takes/renews the lease. True if this process should advance the table
+    (always True without a shared store).
+    """
+    if table_state_store is None:
+        return True
+
+    with table._state_lock:
+        version, state = table_state_store.load(table.game_type, table.table_number)
+        if state is None:
+            # retired by whichever process owned it
+            _drop_local_table(table)
+            return False
+        changed = version != table._state_version
+        if changed:
+            _apply_table_state(table, version, state)
+
+        now = time.time()
+        if now >= table._lease_until - table_state_store.lease_seconds / 2:
+            if not table_state_store.acquire_lease(table.game_type, table.table_number):
+                table._lease_until = 0.0
+                return False
+            table._lease_until = now + table_state_store.lease_seconds
+
+        # bets other processes admitted are broadcast by the owner only,
+        # so clients see one version sequence per table
+        if changed:
+            table_broadcaster.schedule(table)
+        return True
+
+
+def _publish_table_state(table):
+    """
+    Owner-side CAS write of `table`. Bets admitted by other processes since
+    the last sync are merged in (their bets win a number clash with our
+    bots); any other concurrent change means we lost the table, the local
+    copy is reset to the stored one and TableOwnershipLost is raised.
+    """
+    if table_state_store is None:
+        _journal_table(table)
+        table_broadcaster.schedule(table)
+        return
+
+    with table._state_lock:
+        for _ in range(5):
+            new_version = table_state_store.compare_and_swap(
+                table.game_type, table.table_number, table._state_version, table.get_state()
+            )
+            if new_version is not None:
+                table._state_version = new_version
+                table._state_base = _phase_of(table.__dict__)
+                table_broadcaster.schedule(table)
+                return
+
+            version, state = table_state_store.load(table.game_type, table.table_number)
+            if state is None or _phase_of(state) != table._state_base:
+                table._lease_until = 0.0
+                if state is not None:
+                    _apply_table_state(table, version, state)
+                raise TableOwnershipLost(f"{table.game_type} #{table.table_number} changed by another process")
+
+            # only our bots can be missing from the store: player bets are
+            # written there first (a missing one was released)
+            remote_numbers = {b["number"] for b in state["bets"]}
+            extra = [b for b in table.bets if b.get("is_bot") and b["number"] not in remote_numbers]
+            table.bets = list(state["bets"]) + extra[: max(0, table.max_players - len(state["bets"]))]
+            table._state_version = version
+
+        raise TableOwnershipLost(f"{table.game_type} #{table.table_number} too contended")
+
+
+def _admit_bet_shared(table, user_id, username, number, round_code=None, client_bet_id=None, bet_ref=None):
+    """add_bet() of a held bet as a compare-and-swap on the stored table."""
+    for _ in range(5):
+        with table._state_lock:
+            version, state = table_state_store.load(table.game_type, table.table_number)
+            if state is None:
+                return False, "This game round is no longer available. Please join a new game."
+            if version != table._state_version:
+                _apply_table_state(table, version, state)
+
+            if round_code and table.round_code != round_code:
+                return False, "This game round is no longer available. Please join a new game."
+            if not table.betting_open():
+                return False, "Betting is closed for this game"
+
+            success, message = table.add_bet(
+                user_id, username, number, record_history=False, client_bet_id=client_bet_id,
+                bet_ref=bet_ref, held=True,
+            )
+            if not success:
+                return False, message
+
+            new_version = table_state_store.compare_and_swap(
+                table.game_type, table.table_number, version, table.get_state()
+            )
+            if new_version is not None:
+                table._state_version = new_version
+                return True, message
+
+            table._state_version = -1  # lost the race: force a reload
+    return False, "This table is busy, please try again"
+
+
+def _change_table_bets(table, fn):
+    """
+    Replace table.bets with fn(bets) - a compare-and-swap on the stored
+    table when there is a shared store. Runs on the table's thread.
+    """
+    if table_state_store is None:
+        table.bets = fn([dict(b) for b in table.bets])
+    else:
+        for _ in range(5):
+            version, state = table_state_store.load(table.game_type, table.table_number)
+            if state is None:
+                return
+            if version != table._state_version:
+                _apply_table_state(table, version, state)
+            bets = fn([dict(b) for b in table.bets])
+            new_version = table_state_store.compare_and_swap(
+                table.game_type, table.table_number, version, {**table.get_state(), "bets": bets}
+            )
+            if new_version is not None:
+                table.bets = bets
+                table._state_version = new_version
+                break
+            table._state_version = -1  # lost the race: reload
+        else:
+            raise TableBusy("This table is busy, please try again")
+    table_matchmaker.update(table)
+    open_bet_index.update(table)
+    # with a shared store the lease owner broadcasts on its next sync
+    if table_state_store is None or table._lease_until > time.time():
+        table_broadcaster.schedule(table)
+
+
+def _watch_shared_table_pool():
+    """Pick up tables other processes added to the store; drop retired ones."""
+    while True:
+        try:
+            stored = table_state_store.load_all()
+            for game_type, rows in stored.items():
+                local = {t.table_number for t in game_tables.get(game_type, [])}
+                for version, state in rows:
+                    if state["table_number"] in local:
+                        continue
+                    table = _table_from_store(version, state)
+                    with _table_pool_lock:
+                        game_tables[game_type] = sorted(
+                            game_tables.get(game_type, []) + [table], key=lambda t: t.table_number
+                        )
+                    start_game_table_thread(table)
+
+            for game_type, tables in list(game_tables.items()):
+                present = {st["table_number"] for _, st in stored.get(game_type, [])}
+                for t in tables:
+                    if t.table_number not in present:
+                        _drop_local_table(t)
+        except Exception as e:
+            print("shared table pool watch error:", e)
+        time.sleep(5)
+
+
 # ---------------------------------------------------
 # Table initialization
 # ---------------------------------------------------
@@ -1480,7 +3156,7 @@ def api_subadmin_stats():
     total_agents = Agent.query.count()
     
     # Active games (same as admin)
-    active_games = sum(1 for tables in game_tables.values() for t in tables 
+    active_games = sum(1 for tables in _get_game_tables_store().values() for t in tables 
                       if not getattr(t, 'is_finished', False))
     
     return jsonify({
@@ -1564,14 +3240,180 @@ def api_subadmin_referrals():
 
 # Sub-admin tickets/queries
 
+# Elastic pool: TABLES_PER_GAME tables always run; extra tables are added
+# when real-player occupancy of the open tables crosses the scale-up
+# threshold (or nothing is open) and retired after an idle round.
+TABLES_PER_GAME = 6
+MAX_TABLES_PER_GAME = 12
+POOL_SCALE_UP_OCCUPANCY = 0.8
+POOL_SCALE_DOWN_OCCUPANCY = 0.5
+
+_table_pool_lock = threading.Lock()
+
+
+def _restore_table(table, state):
+    """
+    Resume a journaled round on `table`. Rounds whose payouts were already
+    committed start fresh; anything else (even if its end_time passed while
+    we were down) is settled by the game loop as soon as it starts.
+    """
+    if state.get("is_settled"):
+        return False
+    table.__dict__.update({k: v for k, v in state.items() if k not in GameTable.LOCAL_ONLY_ATTRS})
+    table.is_finished = False
+    table.is_retired = False
+    table.anchor_deadlines()
+    for bet in table.bets:
+        if not bet.get("is_bot") and not bet.get("held"):
+            table.record_user_bet(bet["user_id"], bet["number"])
+    # bets held when we went down: keep the ones whose debit committed
+    _resolve_held_bets(table)
+    if table.bets:
+        print(f"{table.game_type} Table {table.table_number}: restored round {table.round_code} ({len(table.bets)} bets)")
+    return True
+
+
 def initialize_game_tables():
+    restored = round_journal.load() if round_journal is not None else {}
+
     for game_type in GAME_CONFIGS.keys():
         game_tables[game_type] = []
-        for i in range(6):
+        for i in range(TABLES_PER_GAME):
             initial_delay = i * 60  # stagger 1 minute each
             table = GameTable(game_type, i + 1, initial_delay)
+            state = restored.pop((game_type, i + 1), None)
+            if state is not None:
+                _restore_table(table, state)
+            if table_state_store is not None and not table_state_store.insert(game_type, i + 1, table.get_state()):
+                # another process already runs this table; adopt its state
+                version, state = table_state_store.load(game_type, i + 1)
+                _apply_table_state(table, version, state)
+            elif table_state_store is not None:
+                table._state_version = 1
+                table._state_base = _phase_of(table.__dict__)
             game_tables[game_type].append(table)
-        print(f"Initialized 6 tables for {game_type}")
+            table_matchmaker.update(table)
+            open_bet_index.update(table)
+            _journal_table(table)
+        print(f"Initialized {TABLES_PER_GAME} tables for {game_type}")
+
+    # extra tables the elastic pool had open when we went down
+    for (game_type, table_number), state in restored.items():
+        if game_type not in GAME_CONFIGS:
+            continue
+        table = GameTable(game_type, table_number, state.get("initial_delay", 0))
+        if not _restore_table(table, state):
+            round_journal.forget(table)
+            continue
+        game_tables[game_type] = sorted(game_tables[game_type] + [table], key=lambda t: t.table_number)
+        table_matchmaker.update(table)
+        open_bet_index.update(table)
+        _journal_table(table)
+
+
+def _real_occupancy(game_type):
+    """Share of open slots taken by real players (bots don't count as demand)."""
+    taken = 0
+    capacity = 0
+    for t in game_tables.get(game_type, []):
+        if t.is_betting_closed or t.is_finished:
+            continue
+        capacity += t.max_players
+        taken += sum(1 for b in t.bets if not b.get("is_bot"))
+    if capacity == 0:
+        return 1.0
+    return taken / capacity
+
+
+def _next_minute_offset(round_duration):
+    """
+    Offset (seconds from the current period start) of the next whole minute.
+    In the period's last minute this is `round_duration` itself, i.e. the
+    start of the next period, never 0 (which would open the table in the past).
+    """
+    now = datetime.utcnow()
+    base = floor_to_period(now, round_duration)
+    elapsed = (now - base).total_seconds()
+    return (int(elapsed // 60) + 1) * 60
+
+
+def scale_up_game_tables(game_type, force=False):
+    """
+    Add one table to `game_type` if demand calls for it.
+    `force` skips the occupancy check (used when no table is open at all).
+    Returns the new table or None.
+    """
+    with _table_pool_lock:
+        tables = game_tables.get(game_type, [])
+        if len(tables) >= MAX_TABLES_PER_GAME:
+            return None
+        if not force and _real_occupancy(game_type) < POOL_SCALE_UP_OCCUPANCY:
+            return None
+
+        # Lowest free number. round_code stays unique because a reused number
+        # always gets a start minute later than the retired table's last round.
+        used = {t.table_number for t in tables}
+        table_number = next(n for n in range(1, MAX_TABLES_PER_GAME + 1) if n not in used)
+
+        round_duration = ROULETTE_ROUND_SECONDS if game_type == "roulette" else ROUND_SECONDS
+        table = GameTable(game_type, table_number, _next_minute_offset(round_duration))
+
+        if table_state_store is not None:
+            if not table_state_store.insert(game_type, table_number, table.get_state()):
+                return None  # another process just added this number
+            table._state_version = 1
+            table._state_base = _phase_of(table.__dict__)
+
+        # copy-on-write so readers iterating the old list are unaffected
+        game_tables[game_type] = sorted(tables + [table], key=lambda t: t.table_number)
+        table_matchmaker.update(table)
+        open_bet_index.update(table)
+        _journal_table(table)
+
+    start_game_table_thread(table)
+    socketio.emit(
+        "tables_changed",
+        {"game_type": game_type, "action": "added", "table_number": table.table_number, "round_code": table.round_code},
+        to=game_type,
+    )
+    print(f"{game_type} Table {table.table_number}: added to pool ({len(game_tables[game_type])} tables)")
+    return table
+
+
+def maybe_retire_game_table(table):
+    """
+    Called by the table's own thread between rounds. Extra tables (beyond
+    TABLES_PER_GAME) that had no real players are dropped when the game is
+    below the scale-down threshold. Returns True if the table was retired.
+    """
+    if table.table_number <= TABLES_PER_GAME:
+        return False
+    if any(not b.get("is_bot") for b in table.bets):
+        return False
+
+    with _table_pool_lock:
+        tables = game_tables.get(table.game_type, [])
+        if len(tables) <= TABLES_PER_GAME:
+            return False
+        if _real_occupancy(table.game_type) >= POOL_SCALE_DOWN_OCCUPANCY:
+            return False
+
+        table.is_retired = True
+        table_matchmaker.discard(table)
+        open_bet_index.discard(table)
+        game_tables[table.game_type] = [t for t in tables if t is not table]
+        if table_state_store is not None:
+            table_state_store.delete(table.game_type, table.table_number)
+        if round_journal is not None:
+            round_journal.forget(table)
+
+    socketio.emit(
+        "tables_changed",
+        {"game_type": table.game_type, "action": "removed", "table_number": table.table_number},
+        to=table.game_type,
+    )
+    print(f"{table.game_type} Table {table.table_number}: retired from pool")
+    return True
 
 
 def manage_game_table(table: GameTable):
@@ -1700,6 +3542,11 @@ def manage_game_table(table: GameTable):
                 _set_first_attr(bet_row, ["table_number", "tablenumber"], table.table_number)
 
                 _set_first_attr(bet_row, ["user_id", "userid"], str(b.get("user_id", "")))
+                if not b.get("is_bot"):
+                    try:
+                        _set_first_attr(bet_row, ["user_ref"], int(b.get("user_id")))
+                    except (TypeError, ValueError):
+                        pass
                 _set_first_attr(bet_row, ["username"], str(b.get("username", "")))
 
                 try:
@@ -1735,50 +3582,213 @@ def manage_game_table(table: GameTable):
             except Exception:
                 pass
 
+    table.mailbox.owner = threading.current_thread()
     with app.app_context():
-        while True:
-            try:
-                now = datetime.utcnow()
+        try:
+            _run_game_loop(table, _save_round_history)
+        finally:
+            table.mailbox.close("This game table has stopped. Please join a new game.")
 
-                if now < table.start_time:
-                    time.sleep(1)
-                    continue
 
-                # Add bots while betting open
-                if (
-                    not table.is_betting_closed
-                    and len(table.bets) < table.max_players
-                    and table.get_time_remaining() > 30
-                ):
-                    if (
-                        table.last_bot_added_at is None
-                        or (now - table.last_bot_added_at).total_seconds() >= 15
-                    ):
-                        if table.add_bot_bet():
-                            table.last_bot_added_at = now
+def _pay_round_winners(table, result):
+    """
+    Credit this round's winners in the current DB transaction. The win
+    Transaction's client_ref is "win:<round_code>" and (user_id, client_ref)
+    is unique, so settling the same round twice (after a lease takeover or a
+    restart) never pays twice. Returns {user_id: wallet} credited now.
+    """
+    ref = f"win:{table.round_code}"
+    paid_wallets = {}
+    for winner in table.get_winners():
+        if Transaction.query.filter_by(user_id=winner["user_id"], client_ref=ref).first():
+            continue  # paid before the takeover
+
+        wallet = Wallet.query.filter_by(user_id=winner["user_id"]).first()
+        if wallet:
+            wallet.balance += winner["payout"]
+            paid_wallets[winner["user_id"]] = wallet
+            enqueue_store_event(
+                "game_win", winner["user_id"], wallet.balance,
+                amount=winner["payout"], round_code=table.round_code,
+            )
 
-                                # Close betting
-                if now >= table.betting_close_time and not table.is_betting_closed:
-                    table.is_betting_closed = True
-                    print(f"{table.game_type} Table {table.table_number}: Betting closed")
+        win_tx = Transaction(
+            user_id=winner["user_id"],
+            kind="win",
+            amount=winner["payout"],
+            balance_after=wallet.balance if wallet else 0,
+            label="Game Won",
+            game_title=table.config["name"],
+            note=f"Hit number {result}",
+            client_ref=ref,
+        )
+        db.session.add(win_tx)
+    return paid_wallets
 
-                # ROULETTE: wheel spin start at 15–2 seconds remaining
-                if (
-                    table.game_type == "roulette"
-                    and not table.is_finished
-                    and table.result is None
-                    and not table._spin_emitted
-                ):
-                    tr = table.get_time_remaining()
-                    if 2 < tr <= 15:
-                        table._spin_emitted = True
-                        socketio.emit(
-                            "roulette_spin_start",
-                            {
-                                "game_type": table.game_type,
-                                "table_number": table.table_number,
+
+def _settle_round(table, _save_round_history, now):
+    """
+    Pay out and record a finished round (is_finished, result set), then
+    publish it as settled. Safe to run again for the same round.
+    """
+    result = table.result
+    print(f"{table.game_type} Table {table.table_number}: Game ended. Winner: {result}")
+
+    try:
+        update_user_win_control_after_round(table, result)
+    except Exception as e:
+        print("UserWinControl update error:", e)
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+
+    # History update (user_game_history)
+    def _resolve(records, bet):
+        for rec in records:
+            if (
+                not rec.get("is_resolved")
+                and rec["game_type"] == table.game_type
+                and rec["round_code"] == table.round_code
+                and rec["number"] == bet["number"]
+            ):
+                rec["winning_number"] = result
+                rec["win"] = bet["number"] == result
+                rec["status"] = "win" if rec["win"] else "lose"
+                rec["amount"] = (
+                    table.config["payout"]
+                    if rec["win"]
+                    else -table.config["bet_amount"]
+                )
+                rec["is_resolved"] = True
+                rec["date_time"] = fmt_ist(now, "%Y-%m-%d %H:%M")
+        return records
+
+    for bet in table.bets:
+        if bet.get("is_bot"):
+            continue
+        _update_user_history(bet["user_id"], lambda records, bet=bet: _resolve(records, bet))
+
+    # Winners payout + transaction log
+    paid_wallets = _pay_round_winners(table, result)
+
+    # Update forced winner history status to 'executed'
+    history_record = ForcedWinnerHistory.query.filter_by(
+        round_code=table.round_code,
+        status="active"
+    ).first()
+    if history_record:
+        history_record.status = "executed"
+        history_record.note = f"Executed. Winner: {result}"
+
+    # Commit payouts + forced-winner history
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another settler committed this round's payouts first
+        db.session.rollback()
+        paid_wallets = {}
+    table.is_settled = True
+    for winner_id, wallet in paid_wallets.items():
+        push_balance(winner_id, wallet.balance, "win", round_code=table.round_code)
+    _publish_table_state(table)
+
+    print("DEBUG before _save_round_history:", table.round_code, result, flush=True)
+    _save_round_history(table, result, now)
+
+    # clear forced winner after round ends (one-round only)
+    set_forced_winner(table.game_type, table.round_code, None)
+
+
+def _start_next_round(table):
+    """Reset a settled table for its next round (predictable schedule)."""
+    table.bets = []
+    table.result = None
+    table.is_betting_closed = False
+    table.is_finished = False
+    table.is_settled = False
+    table._spin_emitted = False  # allow spin event next round
+
+    _round_duration = ROULETTE_ROUND_SECONDS if table.game_type == "roulette" else ROUND_SECONDS
+    _no_bet_window = 60 if table.game_type == "roulette" else 15
+
+    base = floor_to_period(datetime.utcnow(), _round_duration)
+    table.start_time = base + timedelta(seconds=table.initial_delay)
+    table.end_time = table.start_time + timedelta(seconds=_round_duration)
+    table.betting_close_time = table.end_time - timedelta(seconds=_no_bet_window)
+    table.round_code = make_round_code(table.game_type, table.start_time, table.table_number)
+    table.anchor_deadlines()
+
+    table.last_bot_added_at = None
+    table_matchmaker.update(table)
+    open_bet_index.update(table)
+    _publish_table_state(table)
+    print(f"{table.game_type} Table {table.table_number}: New round started - {table.round_code}")
+
+
+def _run_game_loop(table, _save_round_history):
+    mailbox = table.mailbox
+    while True:
+        if _draining.is_set():
+            return  # shutting down; state is handed off by drain_and_hand_off()
+
+        try:
+            if not _sync_table_with_store(table):
+                # standby: another process owns this table (or it was retired)
+                if table.is_retired:
+                    return
+                mailbox.serve(table, 1)
+                continue
+
+            now = datetime.utcnow()
+
+            if time.monotonic() < table._mono_start:
+                mailbox.serve(table, table.next_deadline_in())
+                continue
+
+            with table._state_lock:
+                # Add bots while betting open
+                if (
+                    not table.is_betting_closed
+                    and len(table.bets) < table.max_players
+                    and table.get_time_remaining() > 30
+                ):
+                    if (
+                        table.last_bot_added_at is None
+                        or (now - table.last_bot_added_at).total_seconds() >= 15
+                    ):
+                        if table.add_bot_bet():
+                            table.last_bot_added_at = now
+                            _publish_table_state(table)
+
+                                # Close betting
+                if time.monotonic() >= table._mono_close and not table.is_betting_closed:
+                    phase_lateness.observe("betting_close", time.monotonic() - table._mono_close)
+                    table.is_betting_closed = True
+                    table_matchmaker.update(table)
+                    open_bet_index.update(table)
+                    _publish_table_state(table)
+                    print(f"{table.game_type} Table {table.table_number}: Betting closed")
+
+                # ROULETTE: wheel spin start at 15–2 seconds remaining
+                if (
+                    table.game_type == "roulette"
+                    and not table.is_finished
+                    and table.result is None
+                    and not table._spin_emitted
+                ):
+                    tr = table.seconds_remaining()
+                    if 2 < tr <= 15:
+                        phase_lateness.observe("roulette_spin", 15 - tr)
+                        table._spin_emitted = True
+                        _publish_table_state(table)
+                        socketio.emit(
+                            "roulette_spin_start",
+                            {
+                                "game_type": table.game_type,
+                                "table_number": table.table_number,
                                 "round_code": table.round_code,
-                                "time_remaining": tr,
+                                "time_remaining": int(tr),
                             },
                         )
 
@@ -1787,138 +3797,76 @@ def manage_game_table(table: GameTable):
                     (not table.is_finished)
                     and (table.result is None)
                     and (len(table.bets) > 0)
-                    and (table.get_time_remaining() <= 2)
+                    and (table.seconds_remaining() <= 2)
                 ):
-                    forced = forced_winners.get((table.game_type, table.round_code))
+                    phase_lateness.observe("result_preselect", 2 - table.seconds_remaining())
+                    _resolve_held_bets(table)
+                    forced = get_forced_winner(table.game_type, table.round_code)
                     if forced is not None:
                         bet_numbers = {b.get("number") for b in (table.bets or [])}
                         table.result = forced if forced in bet_numbers else table.calculate_result()
                     else:
                         table.result = table.calculate_result()
 
+                    _publish_table_state(table)
                     print(
                         f"{table.game_type} Table {table.table_number}: "
                         f"Pre-selected winner at <=2s: {table.result}"
                     )
-                    
+                
                 # Finish game at end_time
-                if now >= table.end_time and not table.is_finished:
+                if time.monotonic() >= table._mono_end and not table.is_finished:
+                    phase_lateness.observe("round_end", time.monotonic() - table._mono_end)
                     table.is_finished = True
+                    table_matchmaker.update(table)
+                    open_bet_index.update(table)
 
                     if table.result is None:
-                        forced = forced_winners.get((table.game_type, table.round_code))
+                        _resolve_held_bets(table)
+                        forced = get_forced_winner(table.game_type, table.round_code)
                         if forced is not None:
                             bet_numbers = {b.get("number") for b in (table.bets or [])}
                             table.result = forced if forced in bet_numbers else table.calculate_result()
                         else:
                             table.result = table.calculate_result()
 
-                    result = table.result
-                    winners = table.get_winners()
-                    print(f"{table.game_type} Table {table.table_number}: Game ended. Winner: {result}")
-
-                    try:
-                        update_user_win_control_after_round(table, result)
-                    except Exception as e:
-                        print("UserWinControl update error:", e)
-                        try:
-                            db.session.rollback()
-                        except Exception:
-                            pass
-
-                    # History update (user_game_history)
-                    for bet in table.bets:
-                        if bet.get("is_bot"):
-                            continue
-
-                        uid = bet["user_id"]
-                        for rec in user_game_history.get(uid, []):
-                            if (
-                                not rec.get("is_resolved")
-                                and rec["game_type"] == table.game_type
-                                and rec["round_code"] == table.round_code
-                                and rec["number"] == bet["number"]
-                            ):
-                                rec["winning_number"] = result
-                                rec["win"] = bet["number"] == result
-                                rec["status"] = "win" if rec["win"] else "lose"
-                                rec["amount"] = (
-                                    table.config["payout"]
-                                    if rec["win"]
-                                    else -table.config["bet_amount"]
-                                )
-                                rec["is_resolved"] = True
-                                rec["date_time"] = fmt_ist(now, "%Y-%m-%d %H:%M")
-
-                    # Winners payout + transaction log
-                    for winner in winners:
-                        wallet = Wallet.query.filter_by(user_id=winner["user_id"]).first()
-                        if wallet:
-                            wallet.balance += winner["payout"]
-
-                        win_tx = Transaction(
-                            user_id=winner["user_id"],
-                            kind="win",
-                            amount=winner["payout"],
-                            balance_after=wallet.balance if wallet else 0,
-                            label="Game Won",
-                            game_title=table.config["name"],
-                            note=f"Hit number {result}",
-                        )
-                        db.session.add(win_tx)
-
-                    # Update forced winner history status to 'executed'
-                    history_record = ForcedWinnerHistory.query.filter_by(
-                        round_code=table.round_code,
-                        status="active"
-                    ).first()
-                    if history_record:
-                        history_record.status = "executed"
-                        history_record.note = f"Executed. Winner: {result}"
-
-                    # Commit payouts + forced-winner history
-                    db.session.commit()
-
+                    # claim settlement; raises if another process got there first
+                    _publish_table_state(table)
 
-                    print("DEBUG before _save_round_history:", table.round_code, result, flush=True)
-                    _save_round_history(table, result, now)
+                # also picks up a round a previous owner claimed but didn't
+                # get to pay (it died or lost the lease in between)
+                if table.is_finished and not table.is_settled:
+                    _settle_round(table, _save_round_history, now)
 
-                    # clear forced winner after round ends (one-round only)
-                    forced_winners.pop((table.game_type, table.round_code), None)
+                if table.is_settled:
+                    mailbox.serve(table, 3)
 
-                    time.sleep(3)
+                    if maybe_retire_game_table(table):
+                        return
 
-                    # Reset for new round (predictable)
-                    table.bets = []
-                    table.result = None
-                    table.is_betting_closed = False
-                    table.is_finished = False
-                    table._spin_emitted = False  # allow spin event next round
+                    _start_next_round(table)
 
-                    _round_duration = ROULETTE_ROUND_SECONDS if table.game_type == "roulette" else ROUND_SECONDS
-                    _no_bet_window = 60 if table.game_type == "roulette" else 15
 
-                    base = floor_to_period(datetime.utcnow(), _round_duration)
-                    table.start_time = base + timedelta(seconds=(table.table_number - 1) * 60)
-                    table.end_time = table.start_time + timedelta(seconds=_round_duration)
-                    table.betting_close_time = table.end_time - timedelta(seconds=_no_bet_window)
-                    table.round_code = make_round_code(table.game_type, table.start_time, table.table_number)
+            # serve bets until exactly the next phase deadline (or 1s for bots)
+            mailbox.serve(table, table.next_deadline_in())
 
-                    table.last_bot_added_at = None
-                    print(f"{table.game_type} Table {table.table_number}: New round started - {table.round_code}")
+        except Exception as e:
+            print(f"Error managing table {table.game_type} #{table.table_number}: {e}")
+            mailbox.serve(table, 1)
 
-                
-                time.sleep(1)
 
-            except Exception as e:
-                print(f"Error managing table {table.game_type} #{table.table_number}: {e}")
-                time.sleep(1)
+def start_game_table_thread(table):
+    thread = threading.Thread(target=manage_game_table, args=(table,), daemon=True)
+    _game_threads.append(thread)
+    thread.start()
 
 
 def start_all_game_tables():
     for _, tables in game_tables.items():
         for table in tables:
-            threading.Thread(target=manage_game_table, args=(table,), daemon=True).start()
+            start_game_table_thread(table)
+    if table_state_store is not None:
+        threading.Thread(target=_watch_shared_table_pool, daemon=True).start()
     print("All game table threads started!")
 
 @app.route('/api/subadmin/agents', methods=['GET', 'POST'])
@@ -2005,7 +3953,7 @@ def api_subadmin_agent_users(agentid):
             ).filter(
                 Transaction.user_id == u.id
             ).filter(
-                func.lower(Transaction.kind) == 'bet'
+                Transaction.kind == 'bet'
             ).scalar() or 0
 
             salarygenerated = float(amountplayed) * float(a.salarypercent or 0) / 100.0
@@ -2134,6 +4082,7 @@ def sa_rounds():
 
     now = datetime.utcnow()
     cutoff_time = now + timedelta(minutes=60)  # Only show rounds >60 min away
+    forced = get_forced_winners()
 
     out = []
 
@@ -2146,7 +4095,7 @@ def sa_rounds():
                 if current_time > cutoff_time:
                     minutes_until = int((current_time - now).total_seconds() / 60)
                     round_code = make_round_code(game_type, current_time, table_number)
-                    forced_number = forced_winners.get((game_type, round_code))
+                    forced_number = forced.get((game_type, round_code))
 
                     out.append({
                         "game_type": game_type,
@@ -2218,7 +4167,11 @@ def sa_force_winner():
     
     # Clear forced winner
     if number is None or str(number).strip() == "":
-        forced_winners.pop((game_type, round_code), None)
+        try:
+            set_forced_winner(game_type, round_code, None)
+        except GameEngineUnavailable as e:
+            print("force winner engine error:", e)
+            return jsonify({"success": False, "message": "Game server unavailable, please try again"}), 503
         
         # Update history status to 'cleared'
         history_record = ForcedWinnerHistory.query.filter_by(
@@ -2245,7 +4198,12 @@ def sa_force_winner():
         if n < 0 or n > 9:
             return jsonify({"success": False, "message": "Number must be 0-9"}), 400
     
-    forced_winners[(game_type, round_code)] = n
+    try:
+        set_forced_winner(game_type, round_code, n)
+    except GameEngineUnavailable as e:
+        # nothing was forced, so leave ForcedWinnerHistory alone
+        print("force winner engine error:", e)
+        return jsonify({"success": False, "message": "Game server unavailable, please try again"}), 503
     
     # Save to history
     existing = ForcedWinnerHistory.query.filter_by(
@@ -2316,6 +4274,80 @@ def sa_history():
 # API: tables and history
 # ---------------------------------------------------
 
+def _snapshot_version():
+    """
+    Version stamp for table state read from now on: any update_table with
+    a version at or below it is already reflected in that state.
+    """
+    return int(time.time() * 1000)
+
+
+def _serialize_table(table, version, compact=False):
+    bets_list = []
+    if table.bets:
+        for bet in table.bets:
+            if bet.get("held"):
+                # shown once confirmed, as in the coalesced deltas: a held
+                # bet's debit may still fail, and nothing would take it back
+                continue
+            bets_list.append(
+                {
+                    "user_id": str(bet.get("user_id", "")),
+                    "username": bet.get("username", "Unknown"),
+                    "number": bet.get("number", 0),
+                }
+            )
+
+    out = {
+        "table_number": table.table_number,
+        "game_type": table.game_type,
+        "round_code": table.round_code,
+        "version": version,
+        "players": len(bets_list),
+        "bets": bets_list,
+        "result": table.result,
+        "max_players": table.max_players,
+        "slots_available": table.get_slots_available(),
+        "time_remaining": table.get_time_remaining(),
+        "is_betting_closed": table.is_betting_closed,
+        "is_finished": table.is_finished,
+        "is_started": table.is_started(),
+        **table.get_deadlines(),
+    }
+    if not compact:
+        out.update(
+            {
+                "min_bet": table.config.get("bet_amount", 0),
+                "max_bet": table.config.get("payout", 0),
+                "status": "betting_closed" if table.is_betting_closed else "active",
+            }
+        )
+    return out
+
+
+# Compact per-game snapshots for join_game: a reconnect storm after a network
+# blip costs one serialization per game per TTL instead of an /api/tables and
+# /balance round trip per client. An entry is dropped as soon as a table of
+# that game broadcasts here; elsewhere (client mode, non-owners) it ages out.
+JOIN_SNAPSHOT_TTL_SECONDS = 1.0
+_join_snapshot_cache = {}  # game_type -> (built_at, tables)
+
+
+def _game_snapshot(game_type, fresh=False):
+    cached = _join_snapshot_cache.get(game_type)
+    if cached and not fresh and time.monotonic() - cached[0] < JOIN_SNAPSHOT_TTL_SECONDS:
+        return cached[1]
+
+    version = _snapshot_version()
+    tables = [
+        _serialize_table(t, version, compact=True)
+        for t in _get_game_tables_store().get(game_type, [])
+        if t
+    ]
+    _join_snapshot_cache[game_type] = (time.monotonic(), tables)
+    return tables
+
+
 @app.route("/api/tables/<game_type>")
 def get_game_tables_api(game_type):
     try:
@@ -2323,43 +4355,12 @@ def get_game_tables_api(game_type):
         if game_type not in GAME_CONFIGS:
             return jsonify({"error": "Invalid game type", "tables": []}), 404
 
-        tables_list = game_tables.get(game_type, [])
+        version = _snapshot_version()
+        tables_list = _get_game_tables_store().get(game_type, [])
         if not tables_list:
             return jsonify({"game_type": game_type, "tables": [], "message": "No tables initialized"}), 200
 
-        serialized_tables = []
-        for table in tables_list:
-            if table:
-                bets_list = []
-                if table.bets:
-                    for bet in table.bets:
-                        bets_list.append(
-                            {
-                                "user_id": str(bet.get("user_id", "")),
-                                "username": bet.get("username", "Unknown"),
-                                "number": bet.get("number", 0),
-                            }
-                        )
-
-                serialized_tables.append(
-                    {
-                        "table_number": table.table_number,
-                        "game_type": table.game_type,
-                        "round_code": table.round_code,
-                        "players": len(bets_list),
-                        "bets": bets_list,
-                        "result": table.result,
-                        "max_players": table.max_players,
-                        "slots_available": table.get_slots_available(),
-                        "time_remaining": table.get_time_remaining(),
-                        "is_betting_closed": table.is_betting_closed,
-                        "is_finished": table.is_finished,
-                        "is_started": table.is_started(),
-                        "min_bet": table.config.get("bet_amount", 0),
-                        "max_bet": table.config.get("payout", 0),
-                        "status": "betting_closed" if table.is_betting_closed else "active",
-                    }
-                )
+        serialized_tables = [_serialize_table(table, version) for table in tables_list if table]
 
         return jsonify({"game_type": game_type, "tables": serialized_tables, "total_tables": len(serialized_tables)}), 200
 
@@ -2372,130 +4373,240 @@ def get_game_tables_api(game_type):
 def get_all_tables():
     all_tables = {
         game_type: [table.to_dict() for table in tables]
-        for game_type, tables in game_tables.items()
+        for game_type, tables in _get_game_tables_store().items()
     }
     return jsonify(all_tables)
 
 
+@app.route("/api/admin/broadcast-stats", methods=["GET"])
+@admin_required
+def admin_broadcast_stats():
+    """Table mutations vs. update_table broadcasts actually sent."""
+    if GAME_ENGINE_MODE == "client":
+        try:
+            return jsonify(engine_client.request("broadcast_stats"))
+        except GameEngineUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+    return jsonify(table_broadcaster.stats())
+
+
+@app.route("/api/admin/bet-admission-stats", methods=["GET"])
+@admin_required
+def admin_bet_admission_stats():
+    """place_bet events admitted vs. shed by this worker's rate limits / in-flight cap."""
+    return jsonify(place_bet_gate.stats())
+
+
+@app.route("/api/admin/store-webhook-stats", methods=["GET"])
+@admin_required
+def admin_store_webhook_stats():
+    """Outbox backlog and delivery counters for the store webhook."""
+    if store_webhooks is None:
+        pending = StoreOutbox.query.filter(StoreOutbox.delivered_at.is_(None)).count()
+        return jsonify({"enabled": bool(STORE_WEBHOOK_URL), "pending": pending})
+    return jsonify({"enabled": True, **store_webhooks.stats()})
+
+
+@app.route("/api/admin/phase-jitter", methods=["GET"])
+@admin_required
+def admin_phase_jitter():
+    """How late betting close / result / round end fired vs. their deadlines."""
+    if GAME_ENGINE_MODE == "client":
+        try:
+            return jsonify(engine_client.request("phase_jitter"))
+        except GameEngineUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+    return jsonify(phase_lateness.snapshot())
+
+
 import traceback
 
-@app.route("/api/user-games")
-@login_required
-def user_games_history_api():
-    user_id = request.args.get("user_id", type=int) or _get_session_user_id()
+USER_GAMES_PAGE_SIZE = 20
+USER_GAMES_MAX_PAGE_SIZE = 100
+
 
+def _encode_games_cursor(hist):
+    raw = f"{hist.endedat.isoformat()}|{hist.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_games_cursor(cursor):
+    """(endedat, history id) from an opaque cursor, or None if it's invalid."""
     try:
-        user_id = int(user_id)
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ended, hist_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ended), int(hist_id)
     except Exception:
-        return jsonify({"current_games": [], "game_history": [], "error": "invalid user_id"})
+        return None
 
-    game_history = []
-    current_games = []
 
-    try:
-        rows = (
-            db.session.query(GameRoundBet, GameRoundHistory)
-            .join(GameRoundHistory, GameRoundHistory.roundcode == GameRoundBet.roundcode)
-            .filter(GameRoundBet.userid == str(user_id))
-            .order_by(GameRoundHistory.endedat.desc(), GameRoundBet.bettime.asc())
-            .all()
+def _user_history_page(user_id, limit, cursor=None, since=None):
+    """
+    One page of the user's finished rounds, newest first, grouped per round
+    in SQL. `cursor` pages to older rounds; `since` returns only rounds that
+    ended after it. Returns (games, has_more, first_hist, last_hist).
+    """
+    q = (
+        db.session.query(
+            GameRoundHistory,
+            func.max(GameRoundBet.betamount),
         )
+        .join(GameRoundBet, GameRoundBet.roundcode == GameRoundHistory.roundcode)
+        .filter(GameRoundBet.user_ref == user_id)
+        .group_by(GameRoundHistory.id)
+    )
+    if cursor:
+        ended, hist_id = cursor
+        q = q.filter(db.or_(
+            GameRoundHistory.endedat < ended,
+            db.and_(GameRoundHistory.endedat == ended, GameRoundHistory.id < hist_id),
+        ))
+    if since:
+        ended, hist_id = since
+        q = q.filter(db.or_(
+            GameRoundHistory.endedat > ended,
+            db.and_(GameRoundHistory.endedat == ended, GameRoundHistory.id > hist_id),
+        ))
 
-        grouped = {}
+    rows = (
+        q.order_by(GameRoundHistory.endedat.desc(), GameRoundHistory.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], False, None, None
+
+    # the user's numbers for just this page's rounds
+    numbers = {}
+    for roundcode, number in (
+        db.session.query(GameRoundBet.roundcode, GameRoundBet.number)
+        .filter(
+            GameRoundBet.user_ref == user_id,
+            GameRoundBet.roundcode.in_([hist.roundcode for hist, _ in rows]),
+        )
+    ):
+        numbers.setdefault(roundcode, set()).add(int(number))
+
+    games = []
+    for hist, bet_amount in rows:
+        user_bets = sorted(numbers.get(hist.roundcode, ()))
+        payout_amt = int(GAME_CONFIGS.get(hist.gametype, {}).get("payout", 0) or 0)
+        total_loss = int(bet_amount or 0) * len(user_bets)
+        won = hist.result in user_bets
+
+        games.append({
+            "game_type": hist.gametype,
+            "round_code": hist.roundcode,
+            "bet_amount": int(bet_amount or 0),
+            "user_bets": user_bets,
+            "winning_number": hist.result,
+            "date_time": fmt_ist(hist.endedat, "%Y-%m-%d %H:%M") if hist.endedat else "",
+            "status": "win" if won else "lose",
+            "amount": payout_amt if won else total_loss,
+            "win_amount": payout_amt if won else 0,
+            "loss_amount": 0 if won else total_loss,
+            "time_remaining": None,
+            "table_number": hist.tablenumber,
+        })
+    return games, has_more, rows[0][0], rows[-1][0]
 
-        for bet, hist in rows:
-            key = (hist.gametype, hist.roundcode, hist.tablenumber)
 
-            if key not in grouped:
-                grouped[key] = {
-                    "game_type": hist.gametype,
-                    "round_code": hist.roundcode,
-                    "bet_amount": int(getattr(bet, "betamount", 0) or 0),
-                    "user_bets": [],
-                    "winning_number": hist.result,
-                    "date_time": fmt_ist(hist.endedat, "%Y-%m-%d %H:%M") if hist.endedat else "",
-                    "status": None,
-                    "amount": 0,
-                    "win_amount": 0,
-                    "loss_amount": 0,
-                    "time_remaining": None,
-                    "table_number": hist.tablenumber,
-                }
+def _user_open_games(user_id):
+    """The user's bets in rounds still open for betting (via open_bet_index)."""
+    if GAME_ENGINE_MODE == "client":
+        return engine_client.request("user_open_games", user_id)
 
-            try:
-                grouped[key]["user_bets"].append(int(bet.number))
-            except Exception:
-                pass
+    current_games = []
+    for table in open_bet_index.tables_for(user_id):
+        with table._state_lock:
+            if table.is_finished or table.is_betting_closed:
+                continue
+            user_bets = sorted({
+                int(bet["number"])
+                for bet in table.bets
+                if not bet.get("is_bot") and str(bet.get("user_id")) == str(user_id)
+            })
+            if not user_bets:
+                continue
+            current_games.append({
+                "game_type": table.game_type,
+                "round_code": table.round_code,
+                "bet_amount": int(table.config.get("bet_amount", 0) or 0),
+                "user_bets": user_bets,
+                "winning_number": None,
+                "date_time": fmt_ist(table.start_time, "%Y-%m-%d %H:%M") if table.start_time else "",
+                "status": None,
+                "amount": 0,
+                "win_amount": 0,
+                "loss_amount": 0,
+                "time_remaining": table.get_time_remaining(),
+                "table_number": table.table_number,
+            })
+    current_games.sort(key=lambda g: (g["game_type"], g["table_number"]))
+    return current_games
 
-        for g in grouped.values():
-            g["user_bets"] = sorted(set(g["user_bets"]))
-            cfg = GAME_CONFIGS.get(g["game_type"], {})
-            payout_amt = int(cfg.get("payout", 0) or 0)
-            total_loss = int(g["bet_amount"] or 0) * len(g["user_bets"])
-
-            if g["winning_number"] in g["user_bets"]:
-                g["status"] = "win"
-                g["win_amount"] = payout_amt
-                g["loss_amount"] = 0
-                g["amount"] = payout_amt
-            else:
-                g["status"] = "lose"
-                g["win_amount"] = 0
-                g["loss_amount"] = total_loss
-                g["amount"] = total_loss
 
-        game_history = list(grouped.values())
-        game_history.sort(key=lambda x: x.get("date_time", ""), reverse=True)
+@app.route("/api/user-games")
+@login_required
+def user_games_history_api():
+    """
+    The user's open games plus one page of finished ones.
 
-    except Exception as e:
-        print("user_games_history_api history query error:", str(e))
-        traceback.print_exc()
+    ?limit=N (default 20, max 100); ?cursor=<next_cursor> for the next
+    (older) page; ?since=<latest_cursor> for only rounds finished since a
+    previous response - if `has_more` comes back true there, more than
+    `limit` rounds finished and the client should reload from the top.
+    """
+    user_id = request.args.get("user_id", type=int) or _get_session_user_id()
 
     try:
-        for game_type, tables in game_tables.items():
-            for table in tables:
-                if getattr(table, "is_finished", False):
-                    continue
-                if getattr(table, "is_betting_closed", False):
-                    continue
+        user_id = int(user_id)
+    except Exception:
+        return jsonify({"current_games": [], "game_history": [], "error": "invalid user_id"})
 
+    limit = request.args.get("limit", USER_GAMES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, USER_GAMES_MAX_PAGE_SIZE))
 
-                user_bets = []
-                for bet in (table.bets or []):
-                    try:
-                        bet_uid = int(bet.get("user_id"))
-                    except Exception:
-                        continue
+    cursor = since = None
+    if request.args.get("cursor"):
+        cursor = _decode_games_cursor(request.args["cursor"])
+        if cursor is None:
+            return jsonify({"current_games": [], "game_history": [], "error": "invalid cursor"}), 400
+    if request.args.get("since"):
+        since = _decode_games_cursor(request.args["since"])
+        if since is None:
+            return jsonify({"current_games": [], "game_history": [], "error": "invalid cursor"}), 400
 
-                    if bet_uid == user_id:
-                        try:
-                            user_bets.append(int(bet.get("number")))
-                        except Exception:
-                            pass
-
-                if user_bets:
-                    current_games.append({
-                        "game_type": table.game_type,
-                        "round_code": table.round_code,
-                        "bet_amount": int(table.config.get("bet_amount", 0) or 0),
-                        "user_bets": sorted(set(user_bets)),
-                        "winning_number": None,
-                        "date_time": fmt_ist(table.start_time, "%Y-%m-%d %H:%M") if table.start_time else "",
-                        "status": None,
-                        "amount": 0,
-                        "win_amount": 0,
-                        "loss_amount": 0,
-                        "time_remaining": table.get_time_remaining(),
-                        "table_number": table.table_number,
-                    })
+    game_history = []
+    has_more = False
+    next_cursor = None
+    latest_cursor = request.args.get("since") or None
+    current_games = []
+
+    try:
+        game_history, has_more, first, last = _user_history_page(user_id, limit, cursor, since)
+        if first is not None and cursor is None:
+            latest_cursor = _encode_games_cursor(first)
+        if has_more and since is None:
+            next_cursor = _encode_games_cursor(last)
+    except Exception as e:
+        print("user_games_history_api history query error:", str(e))
+        traceback.print_exc()
 
+    try:
+        current_games = _user_open_games(user_id)
     except Exception as e:
         print("user_games_history_api current games error:", str(e))
         traceback.print_exc()
 
     return jsonify({
         "current_games": current_games,
-        "game_history": game_history
+        "game_history": game_history,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        "latest_cursor": latest_cursor,
     })
 
 
@@ -2829,9 +4940,9 @@ def external_credit_game_wallet():
 
     data = request.get_json(silent=True) or {}
 
-    userid = safeint(data.get("userid") or data.get("user_id"), 0)
-    cardvalue = safeint(data.get("cardvalue") or data.get("card_value"), 0)
-    quantity = safeint(data.get("quantity"), 1)
+    userid = _safe_int(data.get("userid") or data.get("user_id"), 0)
+    cardvalue = _safe_int(data.get("cardvalue") or data.get("card_value"), 0)
+    quantity = _safe_int(data.get("quantity", 1), 1)
     payment_ref = (data.get("paymentref") or data.get("payment_ref") or "").strip()
     note = (data.get("note") or "").strip()
 
@@ -2959,7 +5070,12 @@ def external_credit_game_wallet():
         db.session.add(storeaudit)
         db.session.add(purchase)
         db.session.add(transfer)
+        enqueue_store_event(
+            "external_credit", user.id, gamewallet.balance, storewallet.balance,
+            amount=totalcoins, reference=payment_ref,
+        )
         db.session.commit()
+        push_balance(user.id, gamewallet.balance, "card", store_balance=int(storewallet.balance or 0))
 
         return jsonify({
             "success": True,
@@ -2971,115 +5087,642 @@ def external_credit_game_wallet():
             "reference": payment_ref
         }), 200
 
+    except IntegrityError:
+        # a concurrent request with the same ref committed first
+        db.session.rollback()
+        gamewallet = ensurewalletforuser(user, startingbalance=0)
+        storewallet = ensurestorewalletforuser(user, startingbalance=0)
+        return jsonify({
+            "success": True,
+            "message": "Already processed",
+            "userid": user.id,
+            "gamebalance": int(gamewallet.balance or 0) if gamewallet else 0,
+            "storebalance": int(storewallet.balance or 0) if storewallet else 0,
+            "reference": payment_ref,
+            "totalcoins": totalcoins
+        }), 200
+
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": f"Credit failed: {str(e)}"}), 500
         
 
 
-@app.route("/api/external/store/wallet-balance/<int:userid>", methods=["GET"])
-def external_store_wallet_balance(userid):
-    if not verify_store_api_request(request):
-        return jsonify({"success": False, "message": "Unauthorized"}), 401
+EXTERNAL_BALANCE_BATCH_MAX = 500
+WALLET_CHANGES_PAGE_SIZE = 500
 
-    user = User.query.get(userid)
-    if not user or getattr(user, "isadmin", False):
-        return jsonify({"success": False, "message": "User not found"}), 404
 
-    gamewallet = ensurewalletforuser(user, starting_balance=0)
-    storewallet = ensurestorewalletforuser(user, starting_balance=0)
+def _bulk_wallet_balances(user_ids):
+    """
+    {user_id: (game balance, store balance)} for non-admin users, read in
+    one query. Missing wallets count as 0 - nothing is created here.
+    """
+    rows = (
+        db.session.query(User.id, Wallet.balance, StoreWallet.balance)
+        .outerjoin(Wallet, Wallet.user_id == User.id)
+        .outerjoin(StoreWallet, StoreWallet.user_id == User.id)
+        .filter(User.id.in_(user_ids), db.or_(User.is_admin.is_(None), User.is_admin.is_(False)))
+        .order_by(User.id, Wallet.id)
+        .all()
+    )
+    balances = {}
+    for uid, game_balance, store_balance in rows:
+        # first game wallet wins if a user somehow has more than one
+        balances.setdefault(uid, (int(game_balance or 0), int(store_balance or 0)))
+    return balances
 
-    return jsonify({
-        "success": True,
-        "userid": user.id,
-        "gamebalance": int(gamewallet.balance or 0) if gamewallet else 0,
-        "storebalance": int(storewallet.balance or 0) if storewallet else 0
-    })
 
-@app.route('/api/external/store/wallet-history/<int:userid>', methods=['GET'])
-def external_store_wallet_history(userid):
-    if not verify_store_api_request(request):
-        return jsonify({"success": False, "message": "Unauthorized"}), 401
+WALLET_CHANGE_SEQUENCE_BATCH = 5000
 
-    user = User.query.get(userid)
-    if not user or getattr(user, "isadmin", False):
-        return jsonify({"success": False, "message": "User not found"}), 404
 
-    gamewallet = ensurewalletforuser(user, starting_balance=0)
-    storewallet = ensurestorewalletforuser(user, starting_balance=0)
+def _sequence_wallet_changes():
+    """
+    Give committed, not yet numbered WalletChange rows the next `seq` values.
 
-    tx_user_col = getattr(Transaction, "user_id", None) or getattr(Transaction, "userid", None)
-    tx_dt_col = getattr(Transaction, "datetime", None) or getattr(Transaction, "createdat", None)
+    Only committed rows are visible here, and a number is only handed out
+    above the highest committed one, so a reader at `since` never has a
+    lower seq appear behind it later. Two callers racing for the same numbers
+    collide on the unique seq index; the loser rolls back and retries.
+    """
+    table = WalletChange.__table__
+    for _ in range(3):
+        pending = [
+            row[0] for row in db.session.execute(
+                select(table.c.id).where(table.c.seq.is_(None))
+                .order_by(table.c.id).limit(WALLET_CHANGE_SEQUENCE_BATCH)
+            )
+        ]
+        if not pending:
+            db.session.rollback()
+            return
+        top = db.session.execute(select(func.coalesce(func.max(table.c.seq), 0))).scalar() or 0
+        try:
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam("change_id"), table.c.seq.is_(None))
+                .values(seq=bindparam("next_seq")),
+                [{"change_id": cid, "next_seq": top + i} for i, cid in enumerate(pending, start=1)],
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            continue
+        if len(pending) < WALLET_CHANGE_SEQUENCE_BATCH:
+            return
 
-    st_user_col = getattr(StoreTransaction, "user_id", None) or getattr(StoreTransaction, "userid", None)
-    st_dt_col = getattr(StoreTransaction, "createdat", None)
 
-    wt_user_col = getattr(WalletTransfer, "user_id", None) or getattr(WalletTransfer, "userid", None)
-    wt_dt_col = getattr(WalletTransfer, "createdat", None)
+def _latest_wallet_change_seq():
+    return db.session.query(func.coalesce(func.max(WalletChange.seq), 0)).scalar() or 0
 
-    game_query = Transaction.query
-    if tx_user_col is not None:
-        game_query = game_query.filter(tx_user_col == user.id)
-    game_rows = game_query.order_by(tx_dt_col.desc() if tx_dt_col is not None else Transaction.id.desc()).limit(100).all()
 
-    store_query = StoreTransaction.query
-    if st_user_col is not None:
-        store_query = store_query.filter(st_user_col == user.id)
-    store_rows = store_query.order_by(st_dt_col.desc() if st_dt_col is not None else StoreTransaction.id.desc()).limit(100).all()
+EXTERNAL_CREDIT_BATCH_MAX = 2000
+EXTERNAL_CREDIT_BATCH_ATTEMPTS = 3
+SQL_IN_CHUNK = 500  # keeps IN lists under SQLite's bound-parameter limit
 
-    transfer_query = WalletTransfer.query
-    if wt_user_col is not None:
-        transfer_query = transfer_query.filter(wt_user_col == user.id)
-    transfer_rows = transfer_query.order_by(wt_dt_col.desc() if wt_dt_col is not None else WalletTransfer.id.desc()).limit(100).all()
 
-    return jsonify({
-        "success": True,
-        "userid": user.id,
-        "gamebalance": int(gamewallet.balance or 0) if gamewallet else 0,
-        "storebalance": int(storewallet.balance or 0) if storewallet else 0,
-        "gametransactions": [
-            {
-                "id": t.id,
-                "kind": getattr(t, "kind", "") or "",
-                "amount": int(getattr(t, "amount", 0) or 0),
-                "balanceafter": int(getattr(t, "balanceafter", 0) or 0),
-                "label": getattr(t, "label", "") or "",
-                "gametitle": getattr(t, "gametitle", "") or "",
-                "note": getattr(t, "note", "") or "",
-                "datetime": fmtist(getattr(t, "datetime", None) or getattr(t, "createdat", None), "%d %b %Y, %I:%M %p")
-                if (getattr(t, "datetime", None) or getattr(t, "createdat", None)) else ""
-            }
-            for t in game_rows
-        ],
-        "storetransactions": [
-            {
-                "id": s.id,
-                "kind": getattr(s, "kind", "") or "",
-                "amount": int(getattr(s, "amount", 0) or 0),
-                "balanceafter": int(getattr(s, "balanceafter", 0) or 0),
-                "label": getattr(s, "label", "") or "",
-                "note": getattr(s, "note", "") or "",
-                "reference": getattr(s, "reference", "") or "",
-                "createdat": fmtist(getattr(s, "createdat", None), "%d %b %Y, %I:%M %p") if getattr(s, "createdat", None) else ""
-            }
-            for s in store_rows
-        ],
-        "transfers": [
-            {
-                "id": w.id,
-                "direction": getattr(w, "direction", "") or "",
-                "amount": int(getattr(w, "amount", 0) or 0),
-                "status": getattr(w, "status", "") or "",
-                "note": getattr(w, "note", "") or "",
-                "createdat": fmtist(getattr(w, "createdat", None), "%d %b %Y, %I:%M %p") if getattr(w, "createdat", None) else ""
-            }
-            for w in transfer_rows
-        ]
-    }), 200
-    
-@app.route("/api/walletsummary", methods=["GET"])
-@app.route("/api/wallet/summary", methods=["GET"])
-@login_required
+def _chunks(items, size=SQL_IN_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+@app.route("/api/external/store/credit-game-wallet/batch", methods=["POST"])
+def external_credit_game_wallet_batch():
+    """
+    Batch form of credit-game-wallet for store reconciliation:
+    {"items": [{"userid", "cardvalue", "quantity", "paymentref", "note"}, ...]}.
+
+    Payment refs already credited (or repeated within the batch) are
+    reported as duplicates; the rest are applied in one transaction with
+    one balance UPDATE per wallet and bulk inserts of the audit rows.
+    Every item gets a result, in request order.
+    """
+    if not verify_store_api_request(request):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "message": "items required"}), 400
+    if len(items) > EXTERNAL_CREDIT_BATCH_MAX:
+        return jsonify({
+            "success": False,
+            "message": f"At most {EXTERNAL_CREDIT_BATCH_MAX} items per request"
+        }), 400
+
+    results = [None] * len(items)
+    valid = []  # (index, userid, cardvalue, quantity, payment_ref, note)
+
+    def _fail(i, message, userid=None, payment_ref=None):
+        results[i] = {"index": i, "status": "error", "message": message,
+                      "userid": userid, "reference": payment_ref}
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            _fail(i, "Invalid item")
+            continue
+        userid = _safe_int(item.get("userid") or item.get("user_id"), 0)
+        cardvalue = _safe_int(item.get("cardvalue") or item.get("card_value"), 0)
+        quantity = _safe_int(item.get("quantity", 1), 1)
+        payment_ref = str(item.get("paymentref") or item.get("payment_ref") or "").strip()
+        note = str(item.get("note") or "").strip()
+
+        if userid <= 0:
+            _fail(i, "Invalid userid", userid, payment_ref)
+        elif cardvalue not in ALLOWED_CARD_VALUES:
+            _fail(i, "Invalid card value", userid, payment_ref)
+        elif quantity <= 0:
+            _fail(i, "Invalid quantity", userid, payment_ref)
+        elif not payment_ref:
+            _fail(i, "payment_ref required", userid, payment_ref)
+        else:
+            valid.append((i, userid, cardvalue, quantity, payment_ref, note))
+
+    user_ids = {v[1] for v in valid}
+    refs = {v[4] for v in valid}
+
+    # users (non-admin) and refs already credited: one indexed IN query each
+    known_users = set()
+    for chunk in _chunks(user_ids):
+        known_users.update(
+            uid for (uid,) in db.session.query(User.id).filter(
+                User.id.in_(chunk), db.or_(User.is_admin.is_(None), User.is_admin.is_(False))
+            )
+        )
+    # the unique (kind, user_id, reference) index catches refs credited by a
+    # concurrent request between the read below and the commit
+    for attempt in range(EXTERNAL_CREDIT_BATCH_ATTEMPTS):
+        done_refs = set()
+        for chunk in _chunks(refs):
+            done_refs.update(
+                db.session.query(StoreTransaction.user_id, StoreTransaction.reference).filter(
+                    StoreTransaction.kind == "externalstorecredit",
+                    StoreTransaction.reference.in_(chunk),
+                )
+            )
+
+        credits = []
+        for i, userid, cardvalue, quantity, payment_ref, note in valid:
+            if userid not in known_users:
+                _fail(i, "User not found", userid, payment_ref)
+            elif (userid, payment_ref) in done_refs:
+                results[i] = {"index": i, "status": "duplicate", "message": "Already processed",
+                              "userid": userid, "reference": payment_ref, "addedcoins": 0}
+            else:
+                done_refs.add((userid, payment_ref))  # repeats later in this batch
+                credits.append((i, userid, cardvalue, quantity, payment_ref, note))
+
+        balances = {}
+        if credits:
+            try:
+                credit_users = sorted({c[1] for c in credits})
+
+                # wallets to credit; create the missing ones first
+                wallet_ids, store_balances = {}, {}
+                for chunk in _chunks(credit_users):
+                    for wid, uid in (
+                        db.session.query(Wallet.id, Wallet.user_id)
+                        .filter(Wallet.user_id.in_(chunk)).order_by(Wallet.id.desc())
+                    ):
+                        wallet_ids[uid] = wid  # lowest id wins, as elsewhere
+                    store_balances.update(
+                        db.session.query(StoreWallet.user_id, StoreWallet.balance)
+                        .filter(StoreWallet.user_id.in_(chunk))
+                    )
+                new_wallets = [Wallet(user_id=uid, balance=0) for uid in credit_users if uid not in wallet_ids]
+                new_store = [StoreWallet(user_id=uid, balance=0) for uid in credit_users if uid not in store_balances]
+                if new_wallets or new_store:
+                    db.session.add_all(new_wallets + new_store)
+                    db.session.flush()
+                    wallet_ids.update({w.user_id: w.id for w in new_wallets})
+                    store_balances.update({w.user_id: 0 for w in new_store})
+
+                totals = {}
+                for _, userid, cardvalue, quantity, _, _ in credits:
+                    totals[userid] = totals.get(userid, 0) + cardvalue * quantity
+
+                # relative updates, so concurrent bets on the same wallets are kept
+                wallet_table = Wallet.__table__
+                db.session.execute(
+                    update(wallet_table)
+                    .where(wallet_table.c.id == bindparam("wallet_id"))
+                    .values(balance=wallet_table.c.balance + bindparam("inc")),
+                    [{"wallet_id": wallet_ids[uid], "inc": inc} for uid, inc in totals.items()],
+                )
+                for chunk in _chunks(credit_users):
+                    balances.update(
+                        db.session.query(Wallet.user_id, Wallet.balance)
+                        .filter(Wallet.id.in_([wallet_ids[uid] for uid in chunk]))
+                    )
+
+                # balance after each item: walk back from the final balance
+                running = {uid: int(balances[uid] or 0) - inc for uid, inc in totals.items()}
+                now_utc = datetime.utcnow()
+                tx_rows, store_rows, purchase_rows, transfer_rows, change_rows = [], [], [], [], []
+                outbox_rows = []
+                for i, userid, cardvalue, quantity, payment_ref, note in credits:
+                    coins = cardvalue * quantity
+                    running[userid] += coins
+                    tx_rows.append({
+                        "user_id": userid, "kind": "added", "amount": coins,
+                        "balance_after": running[userid], "label": "Point Card Added",
+                        "game_title": "External Store Card",
+                        "note": note or f"External store purchase {payment_ref}", "datetime": now_utc,
+                    })
+                    store_rows.append({
+                        "user_id": userid, "kind": "externalstorecredit", "amount": coins,
+                        "balance_after": int(store_balances.get(userid) or 0),
+                        "label": "External Store Purchase",
+                        "note": note or f"Credited to game wallet via store order {payment_ref}",
+                        "reference": payment_ref, "created_at": now_utc,
+                    })
+                    purchase_rows.append({
+                        "user_id": userid, "card_value": cardvalue, "quantity": quantity,
+                        "total_coins": coins, "payment_status": "PAID", "created_at": now_utc,
+                    })
+                    transfer_rows.append({
+                        "user_id": userid, "direction": "STORETOGAME", "amount": coins,
+                        "status": "SUCCESS", "note": f"External store credit ref {payment_ref}",
+                        "created_at": now_utc,
+                    })
+                    change_rows.append({
+                        "user_id": userid, "wallet": "game", "delta": coins,
+                        "balance": running[userid], "created_at": now_utc,
+                    })
+                    if STORE_WEBHOOK_URL:
+                        outbox_rows.append(store_outbox_row(
+                            "external_credit", userid, running[userid], store_balances.get(userid),
+                            amount=coins, reference=payment_ref,
+                        ))
+                    results[i] = {"index": i, "status": "credited",
+                                  "message": "Game wallet credited successfully",
+                                  "userid": userid, "reference": payment_ref,
+                                  "addedcoins": coins, "gamebalance": running[userid]}
+
+                if outbox_rows:
+                    per_user = Counter(row["user_id"] for row in outbox_rows)
+                    next_version = {
+                        uid: top - per_user[uid] + 1
+                        for uid, top in _bump_store_versions(per_user).items()
+                    }
+                    for row in outbox_rows:
+                        payload = json.loads(row["payload"])
+                        payload["version"] = next_version.get(row["user_id"], 0)
+                        next_version[row["user_id"]] = payload["version"] + 1
+                        row["payload"] = json.dumps(payload)
+
+                # bulk UPDATE bypasses the flush hook, so feed rows are written here
+                for Model, rows in (
+                    (Transaction, tx_rows),
+                    (StoreTransaction, store_rows),
+                    (PointCardPurchase, purchase_rows),
+                    (WalletTransfer, transfer_rows),
+                    (WalletChange, change_rows),
+                    (StoreOutbox, outbox_rows),
+                ):
+                    if rows:
+                        db.session.execute(insert(Model), rows)
+
+                db.session.commit()
+            except IntegrityError:
+                # a concurrent request credited one of these refs first; re-read
+                # the credited refs and report it as a duplicate
+                db.session.rollback()
+                if attempt + 1 < EXTERNAL_CREDIT_BATCH_ATTEMPTS:
+                    continue
+                return jsonify({"success": False, "message": "Credit batch conflicted, please retry"}), 409
+            except Exception as e:
+                db.session.rollback()
+                print("external credit batch error:", e)
+                return jsonify({"success": False, "message": f"Credit batch failed: {str(e)}"}), 500
+        break
+
+    for uid in balances:
+        push_balance(uid, int(balances[uid] or 0), "card", store_balance=int(store_balances.get(uid) or 0))
+
+    summary = {"credited": 0, "duplicate": 0, "error": 0}
+    for r in results:
+        summary[r["status"]] += 1
+
+    return jsonify({"success": True, "summary": summary, "results": results}), 200
+
+
+@app.route("/api/external/store/wallet-balance/<int:userid>", methods=["GET"])
+def external_store_wallet_balance(userid):
+    if not verify_store_api_request(request):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    balance = _bulk_wallet_balances([userid]).get(userid)
+    if balance is None:
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    return jsonify({
+        "success": True,
+        "userid": userid,
+        "gamebalance": balance[0],
+        "storebalance": balance[1]
+    })
+
+
+@app.route("/api/external/store/wallet-balances", methods=["POST"])
+def external_store_wallet_balances():
+    """
+    Balances for up to EXTERNAL_BALANCE_BATCH_MAX users: {"userids": [...]}.
+    `seq` is the wallet change feed position these balances include, so the
+    store can continue with /wallet-changes?since=<seq>.
+    """
+    if not verify_store_api_request(request):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get("userids") or data.get("user_ids") or []
+    if not isinstance(raw_ids, list):
+        return jsonify({"success": False, "message": "userids must be a list"}), 400
+    if len(raw_ids) > EXTERNAL_BALANCE_BATCH_MAX:
+        return jsonify({
+            "success": False,
+            "message": f"At most {EXTERNAL_BALANCE_BATCH_MAX} users per request"
+        }), 400
+
+    user_ids = sorted({_safe_int(x, 0) for x in raw_ids} - {0})
+
+    # read the feed position first: changes after it may or may not be in
+    # the balances, but none before it are missed
+    _sequence_wallet_changes()
+    seq = _latest_wallet_change_seq()
+    balances = _bulk_wallet_balances(user_ids) if user_ids else {}
+
+    return jsonify({
+        "success": True,
+        "seq": seq,
+        "balances": {
+            str(uid): {"gamebalance": game, "storebalance": store}
+            for uid, (game, store) in balances.items()
+        },
+        "missing": [uid for uid in user_ids if uid not in balances]
+    })
+
+
+@app.route("/api/external/store/wallet-changes", methods=["GET"])
+def external_store_wallet_changes():
+    """
+    Balance changes after sequence number ?since (default 0), oldest first,
+    at most ?limit. Keep calling with since=<latest_seq> while has_more.
+    """
+    if not verify_store_api_request(request):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    since = max(0, request.args.get("since", 0, type=int))
+    limit = request.args.get("limit", WALLET_CHANGES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, WALLET_CHANGES_PAGE_SIZE))
+
+    _sequence_wallet_changes()
+    rows = (
+        WalletChange.query
+        .filter(WalletChange.seq > since)
+        .order_by(WalletChange.seq.asc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        "success": True,
+        "changes": [
+            {
+                "seq": c.seq,
+                "userid": c.user_id,
+                "wallet": c.wallet,
+                "delta": c.delta,
+                "balance": c.balance,
+                "createdat": as_utc(c.created_at).isoformat() if c.created_at else None
+            }
+            for c in rows
+        ],
+        "latest_seq": rows[-1].seq if rows else since,
+        "has_more": has_more
+    })
+
+
+# ---------------------------------------------------
+# Wallet ledger (merged history)
+# ---------------------------------------------------
+# One stream over Transaction ("game"), StoreTransaction ("store") and
+# WalletTransfer ("transfer"), ordered by (timestamp, source, id) so every
+# row has a unique position and pages never skip or repeat a row.
+
+LEDGER_SOURCES = ("game", "store", "transfer")
+LEDGER_PAGE_SIZE = 50
+LEDGER_MAX_PAGE_SIZE = 200
+
+
+def _ledger_columns(source):
+    """(model, timestamp column, kind column or None) for a ledger source."""
+    if source == "game":
+        return Transaction, Transaction.datetime, Transaction.kind
+    if source == "store":
+        return StoreTransaction, StoreTransaction.created_at, StoreTransaction.kind
+    return WalletTransfer, WalletTransfer.created_at, WalletTransfer.direction
+
+
+def _encode_ledger_cursor(ts, source, row_id):
+    raw = f"{ts.isoformat()}|{source}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_ledger_cursor(cursor):
+    """(timestamp, source, id) from an opaque cursor, or None if it's invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, source, row_id = raw.rsplit("|", 2)
+        if source not in LEDGER_SOURCES:
+            return None
+        return datetime.fromisoformat(ts), source, int(row_id)
+    except Exception:
+        return None
+
+
+def _keyset_filter(source, ts_col, id_col, key, newer):
+    """(ts, source, id) > key if `newer`, else < key, for one source's rows."""
+    k_ts, k_source, k_id = key
+    if source == k_source:
+        if newer:
+            return db.or_(ts_col > k_ts, db.and_(ts_col == k_ts, id_col > k_id))
+        return db.or_(ts_col < k_ts, db.and_(ts_col == k_ts, id_col < k_id))
+    # a different source at the same timestamp sorts by source name
+    if newer:
+        return ts_col >= k_ts if source > k_source else ts_col > k_ts
+    return ts_col <= k_ts if source < k_source else ts_col < k_ts
+
+
+def _ledger_entry(source, row):
+    ts = row.datetime if source == "game" else row.created_at
+    entry = {
+        "source": source,
+        "id": row.id,
+        "amount": int(row.amount or 0),
+        "note": row.note or "",
+        "timestamp": as_utc(ts).isoformat() if ts else None,
+        "datetime": fmt_ist(ts, "%d %b %Y, %I:%M %p") if ts else "",
+    }
+    if source == "game":
+        entry.update(kind=row.kind or "", balanceafter=int(row.balance_after or 0),
+                     label=row.label or "", gametitle=row.game_title or "")
+    elif source == "store":
+        entry.update(kind=row.kind or "", balanceafter=int(row.balance_after or 0),
+                     label=row.label or "", reference=row.reference or "")
+    else:
+        entry.update(kind=row.direction or "", direction=row.direction or "",
+                     status=row.status or "")
+    return entry
+
+
+def wallet_ledger_page(user_id, limit=LEDGER_PAGE_SIZE, sources=LEDGER_SOURCES,
+                       kinds=None, cursor=None, since=None):
+    """
+    One page of a user's merged ledger. Newest first, continuing below
+    `cursor`; or with `since`, oldest first from just after it (for
+    incremental sync). `kinds` maps a source to the kinds (directions for
+    transfers) to keep. Returns (entries, has_more).
+    """
+    key = since or cursor
+    branches = []
+    for source in sources:
+        model, ts_col, kind_col = _ledger_columns(source)
+        q = select(
+            ts_col.label("ts"), literal(source).label("source"), model.id.label("row_id")
+        ).where(model.user_id == user_id)
+        if kinds and kinds.get(source):
+            q = q.where(kind_col.in_(kinds[source]))
+        if key:
+            q = q.where(_keyset_filter(source, ts_col, model.id, key, newer=since is not None))
+        # each branch walks its (user_id, timestamp, id) index for at most a page
+        order = (ts_col.asc(), model.id.asc()) if since else (ts_col.desc(), model.id.desc())
+        branches.append(select(q.order_by(*order).limit(limit + 1).subquery()))
+
+    if not branches:
+        return [], False
+    merged = union_all(*branches).subquery()
+    if since:
+        order = (merged.c.ts.asc(), merged.c.source.asc(), merged.c.row_id.asc())
+    else:
+        order = (merged.c.ts.desc(), merged.c.source.desc(), merged.c.row_id.desc())
+    keys = db.session.execute(select(merged).order_by(*order).limit(limit + 1)).all()
+
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+
+    rows = {}
+    for source in sources:
+        ids = [k.row_id for k in keys if k.source == source]
+        if ids:
+            model = _ledger_columns(source)[0]
+            rows.update({(source, r.id): r for r in model.query.filter(model.id.in_(ids))})
+
+    entries = []
+    for k in keys:
+        entry = _ledger_entry(k.source, rows[(k.source, k.row_id)])
+        entry["cursor"] = _encode_ledger_cursor(k.ts, k.source, k.row_id)
+        entries.append(entry)
+    return entries, has_more
+
+
+def _wallet_history_payload(user_id, default_kinds=None):
+    """
+    Parse ?limit, ?cursor, ?since, ?source=game,store,transfer and
+    ?kind=<kinds> and return (payload, status) for the history endpoints.
+    """
+    limit = request.args.get("limit", LEDGER_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, LEDGER_MAX_PAGE_SIZE))
+
+    sources = LEDGER_SOURCES
+    if request.args.get("source"):
+        sources = tuple(
+            src for src in LEDGER_SOURCES
+            if src in {x.strip().lower() for x in request.args["source"].split(",")}
+        )
+        if not sources:
+            return {"success": False, "message": "Invalid source"}, 400
+
+    kinds = dict(default_kinds or {})
+    if request.args.get("kind"):
+        wanted = [x.strip() for x in request.args["kind"].split(",") if x.strip()]
+        kinds = {
+            "game": [k.lower() for k in wanted],
+            "store": wanted,
+            "transfer": [k.upper() for k in wanted],
+        }
+
+    cursor = since = None
+    if request.args.get("cursor"):
+        cursor = _decode_ledger_cursor(request.args["cursor"])
+        if cursor is None:
+            return {"success": False, "message": "Invalid cursor"}, 400
+    if request.args.get("since"):
+        since = _decode_ledger_cursor(request.args["since"])
+        if since is None:
+            return {"success": False, "message": "Invalid cursor"}, 400
+
+    entries, has_more = wallet_ledger_page(user_id, limit, sources, kinds, cursor, since)
+
+    if since:
+        # oldest first; keep calling with latest_cursor while has_more
+        next_cursor = None
+        latest_cursor = entries[-1]["cursor"] if entries else request.args["since"]
+    else:
+        next_cursor = entries[-1]["cursor"] if (entries and has_more) else None
+        latest_cursor = entries[0]["cursor"] if (entries and not cursor) else None
+
+    return {
+        "success": True,
+        "entries": entries,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        "latest_cursor": latest_cursor,
+    }, 200
+
+
+def _split_ledger_entries(entries):
+    """The per-source lists the history endpoints returned before the merged stream."""
+    return (
+        [e for e in entries if e["source"] == "game"],
+        [e for e in entries if e["source"] == "store"],
+        [e for e in entries if e["source"] == "transfer"],
+    )
+
+
+@app.route('/api/external/store/wallet-history/<int:userid>', methods=['GET'])
+def external_store_wallet_history(userid):
+    if not verify_store_api_request(request):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    user = User.query.get(userid)
+    if not user or getattr(user, "is_admin", False):
+        return jsonify({"success": False, "message": "User not found"}), 404
+
+    payload, status = _wallet_history_payload(user.id)
+    if status != 200:
+        return jsonify(payload), status
+
+    gamewallet = ensure_wallet_for_user(user, starting_balance=0)
+    storewallet = ensure_store_wallet_for_user(user, starting_balance=0)
+    game_rows, store_rows, transfer_rows = _split_ledger_entries(payload["entries"])
+
+    payload.update({
+        "userid": user.id,
+        "gamebalance": int(gamewallet.balance or 0) if gamewallet else 0,
+        "storebalance": int(storewallet.balance or 0) if storewallet else 0,
+        "gametransactions": game_rows,
+        "storetransactions": store_rows,
+        "transfers": transfer_rows,
+    })
+    return jsonify(payload), 200
+    
+@app.route("/api/walletsummary", methods=["GET"])
+@app.route("/api/wallet/summary", methods=["GET"])
+@login_required
 def apiwalletsummary():
     user = getcurrentloggedinuser()
     if not user:
@@ -3121,94 +5764,27 @@ def apiwalletsummary():
 @app.route("/api/wallet/history", methods=["GET"])
 @login_required
 def apiwallethistory():
-    user = getcurrentloggedinuser()
+    user = get_current_logged_in_user()
     if not user:
         return jsonify({"success": False, "message": "User not found"}), 404
 
-    tx_user_col = _model_col(Transaction, "userid", "user_id")
-    tx_dt_col = _model_col(Transaction, "datetime", "created_at")
-
-    st_user_col = _model_col(StoreTransaction, "userid", "user_id")
-    st_created_col = _model_col(StoreTransaction, "createdat", "created_at")
-
-    wt_user_col = _model_col(WalletTransfer, "userid", "user_id")
-    wt_created_col = _model_col(WalletTransfer, "createdat", "created_at")
-
-    game_query = Transaction.query
-    if tx_user_col is not None:
-        game_query = game_query.filter(tx_user_col == user.id)
-    game_rows = (
-        game_query
-        .filter(Transaction.kind.in_(["added", "redeem"]))
-        .order_by(tx_dt_col.desc() if tx_dt_col is not None else Transaction.id.desc())
-        .limit(100)
-        .all()
-    )
-
-    store_query = StoreTransaction.query
-    if st_user_col is not None:
-        store_query = store_query.filter(st_user_col == user.id)
-    store_rows = (
-        store_query
-        .order_by(st_created_col.desc() if st_created_col is not None else StoreTransaction.id.desc())
-        .limit(100)
-        .all()
-    )
-
-    transfer_query = WalletTransfer.query
-    if wt_user_col is not None:
-        transfer_query = transfer_query.filter(wt_user_col == user.id)
-    transfer_rows = (
-        transfer_query
-        .order_by(wt_created_col.desc() if wt_created_col is not None else WalletTransfer.id.desc())
-        .limit(100)
-        .all()
-    )
+    # players see wallet top-ups/redeems here; bets and wins are in game history
+    payload, status = _wallet_history_payload(user.id, default_kinds={"game": ["added", "redeem"]})
+    if status != 200:
+        return jsonify(payload), status
 
-    return jsonify({
-        "success": True,
-        "game_transactions": [
-            {
-                "id": t.id,
-                "kind": _obj_val(t, "kind", default="") or "",
-                "amount": int(_obj_val(t, "amount", default=0) or 0),
-                "balanceafter": int(_obj_val(t, "balanceafter", "balance_after", default=0) or 0),
-                "label": _obj_val(t, "label", default="") or "",
-                "gametitle": _obj_val(t, "gametitle", "game_title", default="") or "",
-                "note": _obj_val(t, "note", default="") or "",
-                "datetime": fmtist(_obj_val(t, "datetime", "created_at"), "%d %b %Y, %I:%M %p") if _obj_val(t, "datetime", "created_at") else ""
-            }
-            for t in game_rows
-        ],
-        "store_transactions": [
-            {
-                "id": s.id,
-                "kind": _obj_val(s, "kind", default="") or "",
-                "amount": int(_obj_val(s, "amount", default=0) or 0),
-                "balanceafter": int(_obj_val(s, "balanceafter", "balance_after", default=0) or 0),
-                "label": _obj_val(s, "label", default="") or "",
-                "note": _obj_val(s, "note", default="") or "",
-                "reference": _obj_val(s, "reference", default="") or "",
-                "createdat": fmtist(_obj_val(s, "createdat", "created_at"), "%d %b %Y, %I:%M %p") if _obj_val(s, "createdat", "created_at") else ""
-            }
-            for s in store_rows
-        ],
-        "transfers": [
-            {
-                "id": w.id,
-                "direction": _obj_val(w, "direction", default="") or "",
-                "amount": int(_obj_val(w, "amount", default=0) or 0),
-                "status": _obj_val(w, "status", default="") or "",
-                "note": _obj_val(w, "note", default="") or "",
-                "createdat": fmtist(_obj_val(w, "createdat", "created_at"), "%d %b %Y, %I:%M %p") if _obj_val(w, "createdat", "created_at") else ""
-            }
-            for w in transfer_rows
-        ]
+    game_rows, store_rows, transfer_rows = _split_ledger_entries(payload["entries"])
+    payload.update({
+        "game_transactions": game_rows,
+        "store_transactions": store_rows,
+        "transfers": transfer_rows,
     })
+    return jsonify(payload)
 
 @app.route("/api/storebuy-card", methods=["POST"])
 @app.route("/api/store/buy-card", methods=["POST"])
 @login_required
+@idempotent("buy_card")
 def buy_card():
     user = get_current_logged_in_user()
     if not user:
@@ -3225,7 +5801,8 @@ def buy_card():
         return jsonify(success=False, message="Invalid quantity"), 400
 
     total_coins = card_value * quantity
-    reference = f"CARD{int(time.time())}{user.id}"
+    # random suffix: two purchases in the same second must not share a reference
+    reference = f"CARD{int(time.time())}{user.id}{secrets.token_hex(3).upper()}"
 
     try:
         game_wallet = ensure_wallet_for_user(user, starting_balance=0)
@@ -3262,7 +5839,11 @@ def buy_card():
         db.session.add(game_tx)
         db.session.add(purchase)
         db.session.add(transfer)
+        enqueue_store_event(
+            "card_purchase", user.id, game_wallet.balance, amount=total_coins, reference=reference
+        )
         db.session.commit()
+        push_balance(user.id, game_wallet.balance, "card")
 
         return jsonify(
             success=True,
@@ -3280,6 +5861,7 @@ def buy_card():
 @app.route("/api/wallet/redeem-to-store", methods=["POST"])
 @app.route("/api/store/redeem-from-game", methods=["POST"])
 @login_required
+@idempotent("redeem_from_game")
 def redeem_from_game():
     user = get_current_logged_in_user()
     if not user:
@@ -3334,7 +5916,11 @@ def redeem_from_game():
         db.session.add(game_tx)
         db.session.add(store_tx)
         db.session.add(transfer)
+        enqueue_store_event(
+            "game_to_store", user.id, game_wallet.balance, store_wallet.balance, amount=amount
+        )
         db.session.commit()
+        push_balance(user.id, game_wallet.balance, "redeem", store_balance=int(store_wallet.balance or 0))
 
         return jsonify(
             success=True,
@@ -3347,8 +5933,138 @@ def redeem_from_game():
         return jsonify(success=False, message=f"Redeem failed: {str(e)}"), 500
 
 
+def _parse_cart_lines(items):
+    """{product_id: qty} from checkout/reserve items (repeats summed), or None if invalid."""
+    lines = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        product_id = _safe_int(item.get("product_id") or item.get("productid"), 0)
+        qty = _safe_int(item.get("qty", item.get("quantity", 1)), 0)
+        if product_id <= 0 or qty <= 0:
+            return None
+        lines[product_id] = lines.get(product_id, 0) + qty
+    return lines
+
+
+def _load_cart_products(product_ids):
+    """Active products by id, in one IN query."""
+    return {
+        p.id: p
+        for p in Product.query.filter(Product.id.in_(list(product_ids)), Product.is_active.is_(True))
+    }
+
+
+def _take_stock(lines):
+    """
+    Decrement stock for every line with `UPDATE ... WHERE stock >= qty`, in
+    product id order. Returns the product id that ran out (caller rolls
+    back), or None when all lines were taken.
+    """
+    product_table = Product.__table__
+    for product_id in sorted(lines):
+        taken = db.session.execute(
+            update(product_table)
+            .where(product_table.c.id == product_id, product_table.c.stock >= lines[product_id])
+            .values(stock=product_table.c.stock - lines[product_id])
+        ).rowcount
+        if taken != 1:
+            return product_id
+    return None
+
+
+def _release_reservations(*criteria):
+    """Put HELD reservations matching `criteria` back into stock; commits."""
+    res_table = StockReservation.__table__
+    product_table = Product.__table__
+    held = StockReservation.query.filter(StockReservation.status == "HELD", *criteria).limit(500).all()
+    for res in held:
+        # flip HELD -> RELEASED first, so a checkout racing us can't also use it
+        flipped = db.session.execute(
+            update(res_table)
+            .where(res_table.c.id == res.id, res_table.c.status == "HELD")
+            .values(status="RELEASED")
+        ).rowcount
+        if flipped == 1:
+            db.session.execute(
+                update(product_table)
+                .where(product_table.c.id == res.product_id)
+                .values(stock=product_table.c.stock + res.qty)
+            )
+    db.session.commit()
+    return len(held)
+
+
+def _release_expired_reservations():
+    _release_reservations(StockReservation.expires_at <= datetime.utcnow())
+
+
+@app.route("/api/store/reserve", methods=["POST"])
+@login_required
+def store_reserve():
+    """
+    Optional: hold stock for a cart for STORE_RESERVATION_TTL_SECONDS. Send
+    the returned reservation_token to /api/store/checkout; the stock is
+    already taken, so checkout doesn't touch the product rows again.
+    """
+    user = get_current_logged_in_user()
+    if not user:
+        return jsonify(success=False, message="User not found"), 404
+
+    data = request.get_json(silent=True) or {}
+    items = data.get("items") or []
+    if not isinstance(items, list) or not items:
+        return jsonify(success=False, message="Cart is empty"), 400
+
+    lines = _parse_cart_lines(items)
+    if lines is None:
+        return jsonify(success=False, message="Invalid cart item"), 400
+
+    try:
+        _release_expired_reservations()
+
+        products = _load_cart_products(lines)
+        missing = [pid for pid in lines if pid not in products]
+        if missing:
+            return jsonify(success=False, message="Product not available"), 404
+
+        short = _take_stock(lines)
+        if short is not None:
+            db.session.rollback()
+            return jsonify(success=False, message=f"Insufficient stock for {products[short].title}"), 400
+
+        token = secrets.token_urlsafe(18)
+        expires_at = datetime.utcnow() + timedelta(seconds=STORE_RESERVATION_TTL_SECONDS)
+        db.session.add_all([
+            StockReservation(token=token, user_id=user.id, product_id=pid, qty=qty, expires_at=expires_at)
+            for pid, qty in lines.items()
+        ])
+        db.session.commit()
+
+        return jsonify(
+            success=True,
+            reservation_token=token,
+            expires_at=as_utc(expires_at).isoformat(),
+            ttl_seconds=STORE_RESERVATION_TTL_SECONDS
+        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(success=False, message=f"Reservation failed: {str(e)}"), 500
+
+
+@app.route("/api/store/reserve/<token>", methods=["DELETE"])
+@login_required
+def store_release_reservation(token):
+    user = get_current_logged_in_user()
+    if not user:
+        return jsonify(success=False, message="User not found"), 404
+    released = _release_reservations(StockReservation.token == token, StockReservation.user_id == user.id)
+    return jsonify(success=True, released=released)
+
+
 @app.route("/api/store/checkout", methods=["POST"])
 @login_required
+@idempotent("store_checkout")
 def store_checkout():
     user = get_current_logged_in_user()
     if not user:
@@ -3356,11 +6072,45 @@ def store_checkout():
 
     data = request.get_json(silent=True) or {}
     items = data.get("items") or []
+    reservation_token = (data.get("reservation_token") or "").strip()
     address_id = data.get("address_id") or data.get("addressid")
     note = (data.get("note") or "").strip()
 
-    if not isinstance(items, list) or not items:
-        return jsonify(success=False, message="Cart is empty"), 400
+    try:
+        _release_expired_reservations()
+    except Exception as e:
+        db.session.rollback()
+        print("reservation sweep error:", e)
+
+    reservation = []
+
+    def _fail(message, status):
+        db.session.rollback()
+        if reservation:
+            # this checkout won't use the hold; put its stock back now rather
+            # than when it expires
+            try:
+                _release_reservations(
+                    StockReservation.token == reservation_token, StockReservation.user_id == user.id
+                )
+            except Exception as e:
+                db.session.rollback()
+                print("reservation release error:", e)
+        return jsonify(success=False, message=message), status
+
+    if reservation_token:
+        reservation = StockReservation.query.filter_by(
+            token=reservation_token, user_id=user.id, status="HELD"
+        ).all()
+        if not reservation or any(r.expires_at <= datetime.utcnow() for r in reservation):
+            return jsonify(success=False, message="Reservation expired, please try again"), 409
+        lines = {r.product_id: r.qty for r in reservation}
+    else:
+        if not isinstance(items, list) or not items:
+            return jsonify(success=False, message="Cart is empty"), 400
+        lines = _parse_cart_lines(items)
+        if lines is None:
+            return jsonify(success=False, message="Invalid cart item"), 400
 
     try:
         store_wallet = ensure_store_wallet_for_user(user, starting_balance=0)
@@ -3372,25 +6122,16 @@ def store_checkout():
                 user_id=user.id
             ).first()
             if not address:
-                return jsonify(success=False, message="Address not found"), 404
+                return _fail("Address not found", 404)
+
+        products = _load_cart_products(lines)
+        if any(pid not in products for pid in lines):
+            return _fail("Product not available", 404)
 
         subtotal = 0
         product_rows = []
-
-        for item in items:
-            product_id = _safe_int(item.get("product_id") or item.get("productid"), 0)
-            qty = _safe_int(item.get("qty") or item.get("quantity"), 1)
-
-            if product_id <= 0 or qty <= 0:
-                return jsonify(success=False, message="Invalid cart item"), 400
-
-            product = Product.query.get(product_id)
-            if not product or not product.is_active:
-                return jsonify(success=False, message="Product not available"), 404
-
-            if int(product.stock or 0) < qty:
-                return jsonify(success=False, message=f"Insufficient stock for {product.title}"), 400
-
+        for product_id, qty in lines.items():
+            product = products[product_id]
             line_total = int(product.price or 0) * qty
             subtotal += line_total
             product_rows.append((product, qty, line_total))
@@ -3398,9 +6139,39 @@ def store_checkout():
         total = subtotal
 
         if int(store_wallet.balance or 0) < total:
-            return jsonify(success=False, message="Insufficient store wallet balance"), 400
+            return _fail("Insufficient store wallet balance", 400)
+
+        if reservation:
+            # stock was taken at reserve time; claim the hold exactly once
+            res_table = StockReservation.__table__
+            claimed = db.session.execute(
+                update(res_table)
+                .where(res_table.c.token == reservation_token, res_table.c.status == "HELD")
+                .values(status="USED")
+            ).rowcount
+            if claimed != len(reservation):
+                return _fail("Reservation expired, please try again", 409)
+        else:
+            short = _take_stock(lines)
+            if short is not None:
+                db.session.rollback()
+                return jsonify(success=False, message=f"Insufficient stock for {products[short].title}"), 400
 
-        store_wallet.balance = int(store_wallet.balance or 0) - total
+        # relative debit, so two checkouts by the same user can't both spend it
+        db.session.flush()
+        store_table = StoreWallet.__table__
+        debited = db.session.execute(
+            update(store_table)
+            .where(store_table.c.id == store_wallet.id, store_table.c.balance >= total)
+            .values(balance=store_table.c.balance - total)
+        ).rowcount
+        if debited != 1:
+            return _fail("Insufficient store wallet balance", 400)
+        store_balance = int(
+            db.session.query(StoreWallet.balance).filter(StoreWallet.id == store_wallet.id).scalar() or 0
+        )
+        # Core UPDATE bypasses the flush hook, so the feed row is added here
+        db.session.add(WalletChange(user_id=user.id, wallet="store", delta=-total, balance=store_balance))
 
         order = StoreOrder(
             user_id=user.id,
@@ -3416,7 +6187,6 @@ def store_checkout():
         db.session.flush()
 
         for product, qty, line_total in product_rows:
-            product.stock = int(product.stock or 0) - qty
             db.session.add(StoreOrderItem(
                 order_id=order.id,
                 product_id=product.id,
@@ -3430,7 +6200,7 @@ def store_checkout():
             user_id=user.id,
             kind="product_purchase",
             amount=total,
-            balance_after=int(store_wallet.balance or 0),
+            balance_after=store_balance,
             label="Order placed",
             note=f"Order {order.order_code}",
             reference=order.order_code
@@ -3444,11 +6214,10 @@ def store_checkout():
             message="Order placed successfully",
             order_code=order.order_code,
             total=total,
-            store_balance=int(store_wallet.balance or 0)
+            store_balance=store_balance
         )
     except Exception as e:
-        db.session.rollback()
-        return jsonify(success=False, message=f"Checkout failed: {str(e)}"), 500
+        return _fail(f"Checkout failed: {str(e)}", 500)
 
 
 @app.route("/api/store/products", methods=["GET"])
@@ -4469,6 +7238,7 @@ def get_balance_api():
 
 @app.route("/api/coins/redeem", methods=["POST"])
 @login_required
+@idempotent("redeem_coins")
 def redeem_coins():
     user_id = session.get("user_id")
     user = User.query.get(user_id)
@@ -4501,6 +7271,7 @@ def redeem_coins():
     )
     db.session.add(tx)
     db.session.commit()
+    push_balance(user.id, wallet.balance, "redeem")
 
     return jsonify({
         "success": True,
@@ -4530,10 +7301,30 @@ def get_balance(user_id):
 
 
 def _get_user_history_store():
+    if table_state_store is not None:
+        return table_state_store.load_user_history()
+    if GAME_ENGINE_MODE == "client":
+        try:
+            return engine_client.request("user_history")
+        except GameEngineUnavailable as e:
+            print("user history snapshot error:", e)
+            return {}
     # supports both variable names used across your versions
     return globals().get("user_game_history") or globals().get("usergamehistory") or {}
 
 def _get_game_tables_store():
+    if table_state_store is not None:
+        return {
+            gt: [GameTable.from_state(st) for _, st in rows]
+            for gt, rows in table_state_store.load_all().items()
+        }
+    if GAME_ENGINE_MODE == "client":
+        try:
+            snapshot = engine_client.request("snapshot")
+        except GameEngineUnavailable as e:
+            print("tables snapshot error:", e)
+            return {}
+        return {gt: [GameTable.from_state(st) for st in states] for gt, states in snapshot.items()}
     return globals().get("game_tables") or globals().get("gametables") or {}
 
 def _fmt_ist(dt, fmt="%Y-%m-%d %H:%M"):
@@ -4890,6 +7681,7 @@ def admin_credit_debit(user_id):
     )
     db.session.add(tx)
     db.session.commit()
+    push_balance(user.id, wallet.balance, "admin")
 
     return jsonify({
         "success": True,
@@ -5011,7 +7803,7 @@ def admingameuserbets(roundcode):
 
     target = norm(roundcode)
 
-    tables_store = globals().get("game_tables") or globals().get("gametables") or {}
+    tables_store = _get_game_tables_store()
     for gametype, tables in (tables_store or {}).items():
         for t in (tables or []):
             rc = getattr(t, "roundcode", None) or getattr(t, "round_code", None) or ""
@@ -5079,7 +7871,7 @@ def admin_get_stats():
         if not (getattr(t, "is_finished", False) or getattr(t, "isfinished", False))
     )
 
-    open_tickets = Ticket.query.filter(func.upper(Ticket.status) == "OPEN").count()
+    open_tickets = Ticket.query.filter(Ticket.status == "OPEN").count()
 
 
     return jsonify({
@@ -5102,7 +7894,7 @@ def admin_user_games(user_id):
         rows = (
             db.session.query(GameRoundBet, GameRoundHistory)
             .join(GameRoundHistory, GameRoundHistory.roundcode == GameRoundBet.roundcode)
-            .filter(GameRoundBet.userid == str(user_id))
+            .filter(GameRoundBet.user_ref == user_id)
             .order_by(GameRoundHistory.endedat.desc(), GameRoundBet.bettime.asc())
             .all()
         )
@@ -6001,7 +8793,7 @@ def api_agent_stats():
             db.session.query(func.coalesce(func.sum(Transaction.amount), 0))
             .filter(
                 Transaction.user_id.in_(user_ids),
-                func.lower(Transaction.kind) == 'bet'
+                Transaction.kind == 'bet'
             )
             .scalar()
         ) or 0
@@ -6015,6 +8807,653 @@ def api_agent_stats():
 
 
 
+# ---------------------------------------------------
+# update_table broadcast coalescing
+# ---------------------------------------------------
+
+
+class TableBroadcastCoalescer:
+    """
+    Per-table debounce for update_table. The first mutation arms a timer
+    for `window` seconds; mutations inside the window ride along, and one
+    update with the table's state at flush time goes to the game's room.
+
+    Every update carries a per-table `version`: a millisecond timestamp,
+    bumped if needed so it always increases. Snapshots are stamped the same
+    way (see _snapshot_version), so versions compare across processes and
+    restarts. With `deltas` on, an update within the same round only lists
+    the bets `added` since `base_version` plus the phase fields; clients
+    newer than `base_version` merge it, older ones send `resync` for a full
+    snapshot. A new round always goes out in full.
+    """
+
+    def __init__(self, window, deltas=False):
+        self.window = window
+        self.deltas = deltas
+        self._lock = threading.Lock()
+        self._pending = {}  # (game_type, table_number) -> table
+        self._sent = {}     # key -> {"version", "round_code", "bets": set of (user_id, number)}
+        self.mutations = 0
+        self.emits = 0
+        self.resyncs = 0
+
+    def schedule(self, table):
+        key = (table.game_type, table.table_number)
+        with self._lock:
+            self.mutations += 1
+            if key in self._pending:
+                return
+            self._pending[key] = table
+
+        if self.window <= 0:
+            self._flush(key)
+            return
+        timer = threading.Timer(self.window, self._flush, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self, key):
+        with self._lock:
+            table = self._pending.pop(key, None)
+        if table is None or table.is_retired:
+            return
+
+        with table._state_lock:
+            # held bets go out once confirmed (deltas can't take a bet back)
+            bets = [
+                {"user_id": str(b["user_id"]), "username": b["username"], "number": b["number"]}
+                for b in table.bets
+                if not b.get("held")
+            ]
+            payload = {
+                "game_type": table.game_type,
+                "table_number": table.table_number,
+                "round_code": table.round_code,
+                "players": len(bets),
+                "slots_available": table.get_slots_available(),
+                "time_remaining": table.get_time_remaining(),
+                "is_betting_closed": table.is_betting_closed,
+                "is_finished": table.is_finished,
+                "result": table.result,
+                **table.get_deadlines(),
+            }
+
+        with self._lock:
+            sent = self._sent.get(key)
+            if sent is None or sent["round_code"] != payload["round_code"]:
+                sent = {"version": sent["version"] if sent else 0, "round_code": payload["round_code"], "bets": set()}
+                self._sent[key] = sent
+                is_new_round = True
+            else:
+                is_new_round = False
+            payload["base_version"] = sent["version"]
+            sent["version"] = max(sent["version"] + 1, _snapshot_version())
+            payload["version"] = sent["version"]
+
+            if self.deltas and not is_new_round:
+                payload["delta"] = True
+                payload["added"] = [b for b in bets if (b["user_id"], b["number"]) not in sent["bets"]]
+            else:
+                payload["bets"] = bets
+            sent["bets"].update((b["user_id"], b["number"]) for b in bets)
+            self.emits += 1
+
+        _join_snapshot_cache.pop(table.game_type, None)
+        socketio.emit("update_table", payload, to=table.game_type)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mutations": self.mutations,
+                "emits": self.emits,
+                "resyncs": self.resyncs,
+                "window_ms": int(self.window * 1000),
+            }
+
+
+table_broadcaster = TableBroadcastCoalescer(UPDATE_TABLE_WINDOW_MS / 1000.0, deltas=UPDATE_TABLE_DELTAS)
+
+
+# ---------------------------------------------------
+# Store webhook outbox
+# ---------------------------------------------------
+# Delivery is at-least-once and in outbox order: the store should dedupe on
+# the event `id`. The body is signed as
+#   X-Store-Signature: sha256=HMAC(STORE_WEBHOOK_SECRET, "<X-Store-Timestamp>.<body>")
+# See store_webhook_stub.py for a receiver to test against.
+
+STORE_WEBHOOK_BATCH_SIZE = 100
+STORE_WEBHOOK_POLL_SECONDS = 1.0
+STORE_WEBHOOK_MAX_BACKOFF_SECONDS = 300
+# longer than a send can take (connect + read timeout), so a live claim never lapses
+STORE_WEBHOOK_LEASE_SECONDS = 60
+STORE_OUTBOX_RETENTION_HOURS = 24
+
+
+def sign_store_webhook(secret, timestamp, body):
+    return hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+
+
+class StoreWebhookDispatcher:
+    """
+    Background thread that sends pending StoreOutbox rows to the store in
+    batches over one pooled HTTP session. A failed batch is retried with
+    exponential back-off (with jitter); later rows wait behind it so the
+    store sees changes in order.
+
+    Every worker process may run one; a batch is claimed with a short lease
+    on its rows first, and a dispatcher that finds the oldest row claimed by
+    someone else waits rather than sending the rows behind it.
+    """
+
+    def __init__(self, url, secret, batch_size=STORE_WEBHOOK_BATCH_SIZE,
+                 poll_seconds=STORE_WEBHOOK_POLL_SECONDS,
+                 max_backoff=STORE_WEBHOOK_MAX_BACKOFF_SECONDS):
+        self.url = url
+        self.secret = secret
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_backoff = max_backoff
+        self.worker_id = f"{os.uname().nodename}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._thread = None
+        self._last_prune = 0.0
+        self.delivered = 0
+        self.failed_batches = 0
+        self.last_error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not _draining.is_set():
+            sent = 0
+            try:
+                with app.app_context():
+                    sent = self.dispatch_once()
+                    self._prune()
+            except Exception as e:
+                print("store webhook dispatcher error:", e)
+                try:
+                    with app.app_context():
+                        db.session.rollback()
+                except Exception:
+                    pass
+            if sent < self.batch_size:
+                _draining.wait(self.poll_seconds)
+
+    def dispatch_once(self):
+        """Send the next batch if it's due. Returns how many rows were delivered."""
+        rows = (
+            StoreOutbox.query
+            .filter(StoreOutbox.delivered_at.is_(None))
+            .order_by(StoreOutbox.id.asc())
+            .limit(self.batch_size)
+            .all()
+        )
+        now_utc = datetime.utcnow()
+        if not rows or rows[0].next_attempt_at > now_utc:
+            db.session.rollback()  # end the read transaction
+            return 0
+
+        ids = [r.id for r in rows]
+        attempts = rows[0].attempts + 1
+        events = [
+            {
+                "id": r.id,
+                "event": r.event,
+                "createdat": as_utc(r.created_at).isoformat(),
+                **json.loads(r.payload),
+            }
+            for r in rows
+        ]
+
+        # claim the batch; if another dispatcher holds any of it, leave it to them
+        table = StoreOutbox.__table__
+        claimed = db.session.execute(
+            update(table)
+            .where(
+                table.c.id.in_(ids),
+                table.c.delivered_at.is_(None),
+                db.or_(table.c.locked_until.is_(None), table.c.locked_until <= now_utc),
+            )
+            .values(
+                locked_by=self.worker_id,
+                locked_until=now_utc + timedelta(seconds=STORE_WEBHOOK_LEASE_SECONDS),
+            )
+        ).rowcount
+        if claimed != len(ids):
+            db.session.rollback()
+            return 0
+        db.session.commit()
+
+        body = json.dumps({"events": events}, separators=(",", ":")).encode()
+        timestamp = str(int(time.time()))
+
+        error = None
+        try:
+            resp = self.session.post(
+                self.url,
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Store-Timestamp": timestamp,
+                    "X-Store-Signature": "sha256=" + sign_store_webhook(self.secret, timestamp, body),
+                },
+                timeout=(3, 10),
+            )
+            if not 200 <= resp.status_code < 300:
+                error = f"HTTP {resp.status_code}"
+        except requests.RequestException as e:
+            error = str(e) or e.__class__.__name__
+
+        mine = update(table).where(table.c.id.in_(ids), table.c.locked_by == self.worker_id)
+        if error is None:
+            db.session.execute(mine.values(delivered_at=now_utc, locked_by=None, locked_until=None))
+            db.session.commit()
+            self.delivered += len(rows)
+            return len(rows)
+
+        delay = min(self.max_backoff, 2 ** min(attempts, 16)) * random.uniform(0.8, 1.2)
+        db.session.execute(mine.values(
+            attempts=attempts,
+            next_attempt_at=now_utc + timedelta(seconds=delay),
+            last_error=error[:300],
+            locked_by=None,
+            locked_until=None,
+        ))
+        db.session.commit()
+        self.failed_batches += 1
+        self.last_error = error
+        print(f"store webhook: {len(rows)} events failed ({error}), retry in {delay:.0f}s")
+        return 0
+
+    def _prune(self):
+        if time.monotonic() - self._last_prune < 600:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(hours=STORE_OUTBOX_RETENTION_HOURS)
+        StoreOutbox.query.filter(
+            StoreOutbox.delivered_at.isnot(None), StoreOutbox.delivered_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        pending = StoreOutbox.query.filter(StoreOutbox.delivered_at.is_(None)).count()
+        return {
+            "url": self.url,
+            "pending": pending,
+            "delivered": self.delivered,
+            "failed_batches": self.failed_batches,
+            "last_error": self.last_error,
+        }
+
+
+store_webhooks = None
+
+
+def start_store_webhooks():
+    """Start the dispatcher where the game tables run (not in client web workers)."""
+    global store_webhooks
+    if not STORE_WEBHOOK_URL or GAME_ENGINE_MODE == "client":
+        return
+    store_webhooks = StoreWebhookDispatcher(STORE_WEBHOOK_URL, STORE_WEBHOOK_SECRET)
+    store_webhooks.start()
+    print(f"📨 Store webhooks -> {STORE_WEBHOOK_URL}")
+
+
+# ---------------------------------------------------
+# Graceful shutdown
+# ---------------------------------------------------
+# On SIGTERM: stop admitting bets, let every game loop finish the tick it is
+# in (so a settlement in progress commits its payouts and round history),
+# then hand the tables to the next process - fsync the round journal, or
+# release the shared-store leases so a successor takes over immediately.
+
+DRAIN_TIMEOUT_SECONDS = 20
+
+_draining = threading.Event()
+_game_threads = []
+_previous_sigterm_handler = None
+
+
+def drain_and_hand_off(timeout=DRAIN_TIMEOUT_SECONDS):
+    if _draining.is_set():
+        return
+    _draining.set()
+    print("Draining: bet admission stopped, waiting for game loops...", flush=True)
+
+    deadline = time.monotonic() + timeout
+    for thread in list(_game_threads):
+        thread.join(max(0.0, deadline - time.monotonic()))
+    still_running = sum(1 for t in _game_threads if t.is_alive())
+    if still_running:
+        print(f"Drain timeout: {still_running} game loops still busy", flush=True)
+
+    for tables in game_tables.values():
+        for table in tables:
+            if round_journal is not None:
+                round_journal.record(table)
+            if table_state_store is not None:
+                try:
+                    table_state_store.release_lease(table.game_type, table.table_number)
+                except Exception as e:
+                    print("lease release error:", e)
+
+    if round_journal is not None:
+        round_journal.sync()
+
+    if GAME_ENGINE_MODE == "engine" and os.path.exists(GAME_ENGINE_SOCKET):
+        os.unlink(GAME_ENGINE_SOCKET)
+
+    try:
+        db.session.remove()
+    except Exception:
+        pass
+    print("Drain complete, tables handed off", flush=True)
+
+
+def _handle_sigterm(signum, frame):
+    drain_and_hand_off()
+    if callable(_previous_sigterm_handler):
+        _previous_sigterm_handler(signum, frame)  # e.g. gunicorn's worker handler
+    else:
+        raise SystemExit(0)
+
+
+def install_shutdown_hooks():
+    global _previous_sigterm_handler
+    try:
+        _previous_sigterm_handler = signal.signal(signal.SIGTERM, _handle_sigterm)
+    except ValueError:
+        # not the main thread (imported by a test runner etc.)
+        print("SIGTERM drain hook not installed (not in main thread)")
+
+
+# ---------------------------------------------------
+# Game engine process
+# ---------------------------------------------------
+# With GAME_ENGINE_MODE=engine exactly one process (engine.py) owns the
+# tables and game threads; web workers in "client" mode reach it over a
+# Unix socket for bet admission and table snapshots, so they can scale
+# with gunicorn -w N without each starting its own copy of every table.
+
+GAME_ENGINE_AUTHKEY = hashlib.sha256(("game-engine:" + app.config["SECRET_KEY"]).encode()).digest()
+
+
+class GameEngineUnavailable(RuntimeError):
+    pass
+
+
+def _require_socketio_queue():
+    """
+    The engine emits every table broadcast while browsers sit on the web
+    workers, so without a shared queue nobody would ever see a round.
+    """
+    if GAME_ENGINE_MODE in ("engine", "client") and not SOCKETIO_MESSAGE_QUEUE:
+        raise RuntimeError(
+            f"GAME_ENGINE_MODE={GAME_ENGINE_MODE} needs SOCKETIO_MESSAGE_QUEUE "
+            "(e.g. 'local') set the same for engine.py and the web workers"
+        )
+
+
+def get_forced_winners():
+    if GAME_ENGINE_MODE == "client":
+        try:
+            return engine_client.request("forced_winners")
+        except GameEngineUnavailable as e:
+            print("forced winners snapshot error:", e)
+            return {}
+    if table_state_store is not None:
+        return table_state_store.forced_winners()
+    return dict(forced_winners)
+
+
+def get_forced_winner(game_type, round_code):
+    """Forced number for one round, or None (game loop side)."""
+    if table_state_store is not None:
+        return table_state_store.forced_winner(game_type, round_code)
+    return forced_winners.get((game_type, round_code))
+
+
+def set_forced_winner(game_type, round_code, number):
+    """number=None clears the forced winner."""
+    if GAME_ENGINE_MODE == "client":
+        engine_client.request("set_forced_winner", game_type, round_code, number)
+        return
+    if table_state_store is not None:
+        # shared, so the worker holding the table's lease sees it
+        table_state_store.set_forced_winner(game_type, round_code, number)
+        return
+    if number is None:
+        forced_winners.pop((game_type, round_code), None)
+    else:
+        forced_winners[(game_type, round_code)] = int(number)
+
+
+ENGINE_OPS = {
+    "ping": lambda: "pong",
+    "snapshot": lambda: {gt: [t.get_state() for t in tables] for gt, tables in game_tables.items()},
+    "place_bet": lambda data: admit_bet(data),
+    "forced_winners": get_forced_winners,
+    "set_forced_winner": set_forced_winner,
+    "user_history": lambda: user_game_history,
+    "phase_jitter": lambda: phase_lateness.snapshot(),
+    "broadcast_stats": lambda: table_broadcaster.stats(),
+    "count_resync": lambda: _count_resync(),
+    "user_open_games": lambda user_id: _user_open_games(user_id),
+}
+
+
+def _serve_engine_connection(conn):
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                with app.app_context():
+                    reply = ("ok", ENGINE_OPS[op](*args))
+            except Exception as e:
+                print(f"engine op {op} error:", e)
+                try:
+                    db.session.rollback()
+                except Exception:
+                    pass
+                reply = ("error", str(e))
+
+            try:
+                conn.send(reply)
+            except (OSError, ValueError):
+                return
+
+
+def serve_game_engine():
+    """Blocking accept loop for web worker connections (engine.py)."""
+    from multiprocessing.connection import Listener
+    from multiprocessing import AuthenticationError
+
+    if os.path.exists(GAME_ENGINE_SOCKET):
+        os.unlink(GAME_ENGINE_SOCKET)
+
+    listener = Listener(GAME_ENGINE_SOCKET, family="AF_UNIX", authkey=GAME_ENGINE_AUTHKEY)
+    print(f"Game engine listening on {GAME_ENGINE_SOCKET}")
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            print("engine accept error:", e)
+            continue
+        threading.Thread(target=_serve_engine_connection, args=(conn,), daemon=True).start()
+
+
+class GameEngineClient:
+    """One connection per worker thread; reconnects if the engine restarted."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _send(self, message):
+        from multiprocessing.connection import Client
+
+        # retry once on a stale connection; the engine never saw the request
+        for attempt in range(2):
+            try:
+                if getattr(self._local, "conn", None) is None:
+                    self._local.conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                self._local.conn.send(message)
+                return self._local.conn
+            except (OSError, EOFError) as e:
+                self._drop()
+                if attempt:
+                    raise GameEngineUnavailable(f"engine unreachable: {e}")
+
+    def request(self, op, *args):
+        conn = self._send((op, args))
+        try:
+            status, result = conn.recv()
+        except (OSError, EOFError) as e:
+            # the request may have been applied; don't resend it
+            self._drop()
+            raise GameEngineUnavailable(f"engine connection lost: {e}")
+        if status != "ok":
+            raise GameEngineUnavailable(result)
+        return result
+
+
+# checked at import, before any table thread starts
+_require_socketio_queue()
+engine_client = GameEngineClient(GAME_ENGINE_SOCKET, GAME_ENGINE_AUTHKEY) if GAME_ENGINE_MODE == "client" else None
+
+
+# ---------------------------------------------------
+# place_bet admission control
+# ---------------------------------------------------
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key: `rate` tokens a second up to `burst`, one
+    token per event. Least recently used keys beyond `max_keys` are dropped
+    (a dropped key simply starts again with a full bucket).
+    """
+
+    def __init__(self, rate, burst, max_keys=50000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> [tokens, last refill (monotonic)]
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [float(self.burst), now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            allowed = bucket[0] >= 1.0
+            if allowed:
+                bucket[0] -= 1.0
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def forget(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class PlaceBetGate:
+    """
+    Front door for place_bet: rejects a connection or user over its rate,
+    and sheds load with a retryable error once `max_in_flight` bets are
+    already being processed, so one noisy client can't slow everyone down.
+    """
+
+    def __init__(self, conn_rate, conn_burst, user_rate, user_burst, max_in_flight):
+        self.per_connection = TokenBucketLimiter(conn_rate, conn_burst)
+        self.per_user = TokenBucketLimiter(user_rate, user_burst)
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._lock = threading.Lock()
+        self.max_in_flight = max_in_flight
+        self.admitted = 0
+        self.shed_connection = 0
+        self.shed_user = 0
+        self.shed_overload = 0
+
+    def enter(self, sid, user_id):
+        """
+        None if the bet may proceed (call leave() after), else an error payload.
+        `user_id` must come from the session, never the client's payload;
+        without one the connection stands in for the user.
+        """
+        if not self.per_connection.allow(sid):
+            return self._shed("shed_connection", "Too many bets, please slow down")
+        if not self.per_user.allow(self._user_key(sid, user_id)):
+            return self._shed("shed_user", "Too many bets, please slow down")
+        if not self._in_flight.acquire(blocking=False):
+            return self._shed("shed_overload", "Game server busy, please try again")
+        with self._lock:
+            self.admitted += 1
+        return None
+
+    def leave(self):
+        self._in_flight.release()
+
+    def forget_connection(self, sid):
+        self.per_connection.forget(sid)
+        self.per_user.forget(self._user_key(sid, None))
+
+    @staticmethod
+    def _user_key(sid, user_id):
+        return str(user_id) if user_id is not None else f"sid:{sid}"
+
+    def _shed(self, counter, message):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        return {"message": message, "retryable": True}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "shed_connection": self.shed_connection,
+                "shed_user": self.shed_user,
+                "shed_overload": self.shed_overload,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+place_bet_gate = PlaceBetGate(
+    PLACE_BET_CONN_RATE,
+    PLACE_BET_CONN_BURST,
+    PLACE_BET_USER_RATE,
+    PLACE_BET_USER_BURST,
+    PLACE_BET_MAX_IN_FLIGHT,
+)
+
+
 # ---------------------------------------------------
 # Socket.IO handlers
 # ---------------------------------------------------
@@ -6023,60 +9462,135 @@ def api_agent_stats():
 @socketio.on("connect")
 def handle_connect():
     print(f"Client connected: {request.sid}")
+    # private room for this user's balance pushes (see push_balance)
+    user_id = session.get("user_id")
+    if user_id:
+        join_room(f"user:{user_id}")
     emit("connection_response", {"data": "Connected"})
 
 
+@socketio.on("clock_sync")
+def handle_clock_sync(data):
+    """
+    Clock-offset handshake: echo the client's send time with ours so it can
+    estimate offset = server_time + rtt/2 - now and run countdowns locally
+    against the *_ts deadlines in table payloads.
+    """
+    emit("clock_sync", {"client_time": (data or {}).get("client_time"), "server_time": time.time()})
+
+
 @socketio.on("disconnect")
 def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
+    place_bet_gate.forget_connection(request.sid)
 
 
 @socketio.on("join_game")
 def handle_join_game(data):
+    """
+    Join the game's room and reply with a table_snapshot of its tables plus
+    the caller's own open bets and balance, so a (re)connecting client
+    doesn't need to hit /api/tables and /balance.
+    """
+    data = data or {}
     game_type = data.get("game_type")
     user_id = data.get("user_id")
     print(f"User {user_id} joined game {game_type}")
     join_room(game_type)
 
+    game_type = (game_type or "").lower()
+    if game_type not in GAME_CONFIGS:
+        return
+
+    tables = _game_snapshot(game_type)
+    reply = {"game_type": game_type, "tables": tables}
+
+    session_user_id = session.get("user_id")
+    if session_user_id:
+        uid = str(session_user_id)
+        # t["bets"] has no held bets (see _serialize_table)
+        reply["my_bets"] = [
+            {"table_number": t["table_number"], "round_code": t["round_code"], "number": b["number"]}
+            for t in tables
+            if not t["is_finished"]
+            for b in t["bets"]
+            if b["user_id"] == uid
+        ]
+        wallet = Wallet.query.filter_by(user_id=session_user_id).first()
+        reply["balance"] = wallet.balance if wallet else 0
 
-@socketio.on("place_bet")
-def handle_place_bet(data):
-    """Handle user bet placement - FORCED WINNERS DON'T BLOCK USER BETS"""
+    emit("table_snapshot", reply)
+
+
+def _count_resync():
+    with table_broadcaster._lock:
+        table_broadcaster.resyncs += 1
+
+
+@socketio.on("resync")
+def handle_resync(data):
+    """
+    A client saw an update_table whose base_version it doesn't hold; reply
+    with a full snapshot of the game's tables at their current versions.
+    """
+    game_type = ((data or {}).get("game_type") or "").lower()
+    if game_type not in GAME_CONFIGS:
+        return
+
+    if GAME_ENGINE_MODE == "client":
+        try:
+            engine_client.request("count_resync")
+        except GameEngineUnavailable:
+            pass
+    else:
+        _count_resync()
+
+    emit("table_snapshot", {"game_type": game_type, "tables": _game_snapshot(game_type, fresh=True)})
+
+
+def admit_bet(data):
+    """
+    Validate and place one bet - FORCED WINNERS DON'T BLOCK USER BETS.
+    Returns the socket events to send as (event, payload, broadcast) tuples,
+    so the caller (the socket handler, or the engine process answering a web
+    worker) decides how to deliver them.
+    """
+    data = data or {}
     game_type = data.get("game_type")
     raw_user_id = data.get("user_id")
     username = data.get("username")
     number = data.get("number")
     round_code = data.get("round_code")
+    client_bet_id = str(data.get("client_bet_id") or "")[:64] or None
+    if client_bet_id and client_bet_id.startswith("win:"):
+        client_bet_id = None  # reserved for win payouts (see _pay_round_winners)
+
+    def _error(message):
+        return [("bet_error", {"message": message}, False)]
+
+    if _draining.is_set():
+        return _error("Server is restarting, please place your bet again in a moment")
 
     print(f"Ã°Å¸Å½Â¯ Bet attempt: user={raw_user_id}, game={game_type}, number={number}, round={round_code}")
 
     if game_type not in GAME_CONFIGS:
-        emit("bet_error", {"message": "Invalid game type"})
-        return
+        return _error("Invalid game type")
 
     try:
         user_id = int(raw_user_id)
     except (TypeError, ValueError):
         user_id = raw_user_id
 
-    user = User.query.get(user_id)
-    if not user:
-        emit("bet_error", {"message": "User not found"})
-        return
-
-    if user.is_blocked:
-        emit("bet_error", {"message": f"Your account is blocked. Reason: {user.block_reason or 'No reason provided'}"})
-        return
-
-    wallet = ensure_wallet_for_user(user)
-    if not wallet:
-        emit("bet_error", {"message": "Admin cannot place bets"})
-        return
+    # a retry of a bet we already admitted: same reply, no wallet/DB work
+    if client_bet_id:
+        for t in game_tables.get(game_type, []):
+            receipt = t.bet_receipt(user_id, client_bet_id)
+            if receipt is not None:
+                return [("bet_success", receipt, False)]
 
     tables = game_tables.get(game_type)
     if not tables:
-        emit("bet_error", {"message": "No tables for this game"})
-        return
+        return _error("No tables for this game")
 
     table = None
     if round_code:
@@ -6085,91 +9599,354 @@ def handle_place_bet(data):
                 table = t
                 break
         if not table:
-            emit("bet_error", {"message": "This game round is no longer available. Please join a new game."})
-            return
+            return _error("This game round is no longer available. Please join a new game.")
     else:
-        for t in tables:
-            if (not t.is_betting_closed) and (not t.is_finished) and (len(t.bets) < t.max_players):
-                table = t
-                break
+        table = table_matchmaker.best(game_type) or scale_up_game_tables(game_type, force=True)
         if not table:
-            emit("bet_error", {"message": "No open game table"})
-            return
+            return _error("No open game table")
 
-    if table.is_finished or table.is_betting_closed:
-        emit("bet_error", {"message": "Betting is closed for this game"})
-        return
+    # seat checks and the hold run on the table's own thread, in line with
+    # its phase changes and resets; the wallet debit runs here, so a slow DB
+    # never holds up the table's deadlines
+    try:
+        return _admit_on_table(table, user_id, username, number, round_code, client_bet_id)
+    except TableBusy as e:
+        print(f"Bet not admitted on {game_type} #{table.table_number}: {e}")
+        return _error("Game server busy, please try again")
 
-    if len(table.bets) >= table.max_players:
-        emit("bet_error", {"message": "All slots are full"})
-        return
+
+BET_IN_FLIGHT_WAIT_SECONDS = 2.0  # a retry waits this long for its original to finish
+
+
+def _table_call(table, fn, *args):
+    """
+    mailbox.call for the confirm/release steps of a bet whose debit already
+    happened: if the loop can't take the call, run it under the table's lock.
+    """
+    try:
+        return table.mailbox.call(fn, *args)
+    except TableBusy:
+        with table._state_lock:
+            return fn(*args)
+
+
+def _admit_on_table(table, user_id, username, number, round_code, client_bet_id):
+    """
+    Place one bet on `table`: hold the seat (table thread), debit the wallet
+    and commit (this thread), then confirm the hold - or release it if the
+    debit didn't happen.
+    """
+    def _error(message):
+        return [("bet_error", {"message": message}, False)]
+
+    user = User.query.get(user_id)
+    if not user:
+        return _error("User not found")
+
+    if user.is_blocked:
+        return _error(f"Your account is blocked. Reason: {user.block_reason or 'No reason provided'}")
+
+    wallet = ensure_wallet_for_user(user)
+    if not wallet:
+        return _error("Admin cannot place bets")
 
     bet_amount = table.config["bet_amount"]
     if wallet.balance < bet_amount:
-        emit("bet_error", {"message": "Insufficient balance"})
-        return
+        return _error("Insufficient balance")
+
+    # every player bet gets a ledger ref, so a held bet can always be matched
+    # to its debit (see _resolve_held_bets)
+    bet_ref = client_bet_id or f"srv:{secrets.token_hex(8)}"
+
+    deadline = time.monotonic() + BET_IN_FLIGHT_WAIT_SECONDS
+    while True:
+        held = table.mailbox.call(
+            _hold_bet, table, user_id, username, number, round_code, client_bet_id, bet_ref
+        )
+        if held != "in_flight":
+            break
+        if time.monotonic() >= deadline:
+            return _error("Your bet is still being placed, please wait")
+        time.sleep(0.05)
+    if held is not True:
+        return held  # retry receipt or rejection
+
+    try:
+        new_balance = _debit_bet(wallet.id, user_id, bet_amount, table, number, bet_ref)
+    except IntegrityError:
+        # this client_bet_id was debited before (another table, or a restart)
+        db.session.rollback()
+        _table_call(table, _release_held_bet, table, bet_ref)
+        balance = db.session.query(Wallet.balance).filter(Wallet.id == wallet.id).scalar()
+        return [
+            (
+                "bet_success",
+                {
+                    "message": "Bet already placed",
+                    "new_balance": int(balance or 0),
+                    "client_bet_id": client_bet_id,
+                },
+                False,
+            )
+        ]
+    except Exception:
+        db.session.rollback()
+        _table_call(table, _release_held_bet, table, bet_ref)
+        raise
+
+    if new_balance is None:
+        _table_call(table, _release_held_bet, table, bet_ref)
+        return _error("Insufficient balance")
+
+    receipt = _table_call(table, _confirm_held_bet, table, user_id, number, bet_ref, new_balance)
+    if receipt is None:
+        # the round resolved the hold without us (the debit took past the
+        # result); give the stake back
+        _refund_bet(wallet.id, user_id, bet_amount, table, number)
+        return _error("This game round is no longer available. Please join a new game.")
+
+    push_balance(user_id, new_balance, "bet")
+    print(f"Ã¢Å“â€¦ Bet placed successfully: user={user_id}, number={number}, round={receipt['round_code']}")
 
-    # Ã¢Å“â€¦ CRITICAL: Add bet to table (forced winners don't interfere here)
-    success, message = table.add_bet(user_id, username, number)
+    # grow the pool ahead of demand so the next player finds an open table
+    scale_up_game_tables(table.game_type)
+
+    return [("bet_success", receipt, False)]
+
+
+def _hold_bet(table, user_id, username, number, round_code, client_bet_id, bet_ref):
+    """
+    Table thread: seat checks, then add the bet as held. True when held,
+    "in_flight" while the same client_bet_id is still held, else the events
+    to send (a retry's receipt or a rejection).
+    """
+    def _error(message):
+        return [("bet_error", {"message": message}, False)]
+
+    if client_bet_id:
+        for bet in table.bets:
+            if (
+                bet.get("held")
+                and bet.get("client_bet_id") == client_bet_id
+                and str(bet["user_id"]) == str(user_id)
+            ):
+                return "in_flight"
+        # a retry that queued behind the original
+        receipt = table.bet_receipt(user_id, client_bet_id)
+        if receipt is not None:
+            return [("bet_success", receipt, False)]
+
+    # the round may have moved on while the call sat in the mailbox
+    if round_code and table.round_code != round_code:
+        return _error("This game round is no longer available. Please join a new game.")
+
+    if not table.betting_open():
+        return _error("Betting is closed for this game")
+
+    if len(table.bets) >= table.max_players:
+        return _error("All slots are full")
+
+    if table_state_store is not None:
+        success, message = _admit_bet_shared(
+            table, user_id, username, number, round_code, client_bet_id, bet_ref
+        )
+    else:
+        success, message = table.add_bet(
+            user_id, username, number, record_history=False, client_bet_id=client_bet_id,
+            bet_ref=bet_ref, held=True,
+        )
+        if success:
+            # journaled before the debit, so a crash between the debit's
+            # commit and the confirm leaves a bet to resolve on restart
+            _journal_table(table)
     if not success:
-        print(f"Ã¢ÂÅ’ Bet rejected: {message}")
-        emit("bet_error", {"message": message})
-        return
+        print(f"Ã¢ÂÅ’ Bet rejected: {message}")
+        return _error(message)
+    return True
+
 
-    # Deduct balance
-    wallet.balance -= bet_amount
+def _debit_bet(wallet_id, user_id, bet_amount, table, number, bet_ref):
+    """
+    Take the stake and log the bet, committed. Returns the new balance, or
+    None if the wallet no longer covers it. IntegrityError means bet_ref was
+    already debited.
+    """
+    wallet_table = Wallet.__table__
+    debited = db.session.execute(
+        update(wallet_table)
+        .where(wallet_table.c.id == wallet_id, wallet_table.c.balance >= bet_amount)
+        .values(balance=wallet_table.c.balance - bet_amount)
+    ).rowcount
+    if debited != 1:
+        db.session.rollback()
+        return None
+    balance = int(db.session.query(Wallet.balance).filter(Wallet.id == wallet_id).scalar() or 0)
 
-    # Log transaction
-    bet_tx = Transaction(
+    # Core UPDATE bypasses the flush hook, so the feed row is added here
+    db.session.add(WalletChange(user_id=user_id, wallet="game", delta=-bet_amount, balance=balance))
+    db.session.add(Transaction(
         user_id=user_id,
         kind="bet",
         amount=bet_amount,
-        balance_after=wallet.balance,
+        balance_after=balance,
         label="Bet Placed",
         game_title=table.config["name"],
         note=f"Number {number}",
+        client_ref=bet_ref,
+    ))
+    db.session.commit()
+    return balance
+
+
+def _refund_bet(wallet_id, user_id, bet_amount, table, number):
+    wallet_table = Wallet.__table__
+    db.session.execute(
+        update(wallet_table)
+        .where(wallet_table.c.id == wallet_id)
+        .values(balance=wallet_table.c.balance + bet_amount)
     )
-    db.session.add(bet_tx)
+    balance = int(db.session.query(Wallet.balance).filter(Wallet.id == wallet_id).scalar() or 0)
+    db.session.add(WalletChange(user_id=user_id, wallet="game", delta=bet_amount, balance=balance))
+    db.session.add(Transaction(
+        user_id=user_id,
+        kind="refund",
+        amount=bet_amount,
+        balance_after=balance,
+        label="Bet Refunded",
+        game_title=table.config["name"],
+        note=f"Number {number}, round closed before the bet was placed",
+    ))
     db.session.commit()
+    push_balance(user_id, balance, "refund")
 
-    print(f"Ã¢Å“â€¦ Bet placed successfully: user={user_id}, number={number}, round={table.round_code}")
 
-    # Prepare players list for broadcast
-    players_data = []
-    for bet in table.bets:
-        players_data.append(
-            {"user_id": str(bet["user_id"]), "username": bet["username"], "number": bet["number"]}
+def _confirm_held_bet(table, user_id, number, bet_ref, new_balance):
+    """
+    Table thread: the debit committed; make the held bet a real one. If the
+    draw got there first, _resolve_held_bets already kept it (the debit was
+    committed), so it counts as confirmed. None only when the bet is out of
+    play - its hold was dropped - and the stake must go back.
+    """
+    found = []
+
+    def _confirm(bets):
+        for bet in bets:
+            if bet.get("bet_ref") == bet_ref and bet.get("held"):
+                del bet["held"]
+                found.append(bet)
+        return bets
+
+    round_code = table.round_code
+    if any(b.get("bet_ref") == bet_ref and b.get("held") for b in table.bets):
+        _change_table_bets(table, _confirm)
+    if found:
+        bet = found[0]
+        table.record_user_bet(user_id, int(number))
+        _journal_table(table)
+    else:
+        bet = next((b for b in table.bets if b.get("bet_ref") == bet_ref), None)
+        if bet is None:
+            # resolved, and the round has moved on since
+            kept = table.kept_held_bet(bet_ref)
+            if kept is None:
+                return None
+            round_code, bet = kept
+
+    receipt = {
+        "message": "Bet placed successfully",
+        "new_balance": new_balance,
+        "round_code": round_code,
+        "table_number": table.table_number,
+        "game_type": table.game_type,
+        "bet": {"user_id": str(user_id), "username": bet["username"], "number": bet["number"]},
+        "players": len(table.bets),
+        "slots_available": table.get_slots_available(),
+    }
+    if bet.get("client_bet_id"):
+        receipt["client_bet_id"] = bet["client_bet_id"]
+        table.remember_bet_receipt(user_id, bet["client_bet_id"], receipt)
+    return dict(receipt)
+
+
+def _release_held_bet(table, bet_ref):
+    """Table thread: the debit didn't happen; free the seat."""
+    if any(b.get("bet_ref") == bet_ref and b.get("held") for b in table.bets):
+        _change_table_bets(
+            table, lambda bets: [b for b in bets if not (b.get("bet_ref") == bet_ref and b.get("held"))]
         )
+        _journal_table(table)
+
+
+def _resolve_held_bets(table):
+    """
+    Table thread, before the result is drawn: a bet still held here lost its
+    admitting thread (crash, lost worker). Keep it if its debit committed,
+    drop it otherwise.
+    """
+    held = [b for b in table.bets if b.get("held")]
+    if not held:
+        return
+    paid = set()
+    for bet in held:
+        if Transaction.query.filter_by(user_id=bet["user_id"], client_ref=bet.get("bet_ref")).first():
+            paid.add(bet.get("bet_ref"))
+
+    def _resolve(bets):
+        out = []
+        for bet in bets:
+            if bet.get("held"):
+                if bet.get("bet_ref") not in paid:
+                    continue
+                del bet["held"]
+            out.append(bet)
+        return out
+
+    _change_table_bets(table, _resolve)
+    for bet in held:
+        if bet.get("bet_ref") in paid:
+            table.record_user_bet(bet["user_id"], bet["number"])
+            # its admitting thread may still confirm it (see _confirm_held_bet)
+            table.remember_kept_held_bet(bet["bet_ref"], bet)
+    _journal_table(table)
+
+
+@socketio.on("place_bet")
+def handle_place_bet(data):
+    """Handle user bet placement (locally, or via the engine process)."""
+    # rate and load checks first - a rejected event costs no DB or table work
+    # per-user limit keyed on the session user: a client-supplied user_id
+    # could be rotated to dodge it
+    user_id = session.get("user_id")
+    # echoed on bet_error so the client can stop retrying that bet
+    client_bet_id = str(data.get("client_bet_id") or "")[:64] if isinstance(data, dict) else ""
+    rejected = place_bet_gate.enter(request.sid, user_id)
+    if rejected is not None:
+        if client_bet_id:
+            rejected = {**rejected, "client_bet_id": client_bet_id}
+        emit("bet_error", rejected)
+        return
+
+    try:
+        if GAME_ENGINE_MODE == "client":
+            try:
+                events = engine_client.request("place_bet", data)
+            except GameEngineUnavailable as e:
+                print("place_bet engine error:", e)
+                events = [("bet_error", {"message": "Game server busy, please try again"}, False)]
+        else:
+            events = admit_bet(data)
+    finally:
+        place_bet_gate.leave()
+
+    for event, payload, broadcast in events:
+        if event == "bet_error" and client_bet_id:
+            payload = {**payload, "client_bet_id": client_bet_id}
+        if broadcast:
+            emit(event, payload, broadcast=True, include_self=True)
+        else:
+            emit(event, payload)
 
-    # Emit success to the user
-    emit(
-        "bet_success",
-        {
-            "message": message,
-            "new_balance": wallet.balance,
-            "round_code": table.round_code,
-            "table_number": table.table_number,
-            "players": players_data,
-            "slots_available": table.get_slots_available(),
-        },
-    )
 
-    # Broadcast table update to all clients
-    emit(
-        "update_table",
-        {
-            "game_type": game_type,
-            "table_number": table.table_number,
-            "round_code": table.round_code,
-            "players": players_data,
-            "slots_available": table.get_slots_available(),
-            "time_remaining": table.get_time_remaining(),
-            "is_betting_closed": table.is_betting_closed,
-        },
-        broadcast=True,
-        include_self=True,
-    )
-    
 # ---------------------------------------------------
 # Demo user seeding
 # ---------------------------------------------------
@@ -6217,16 +9994,30 @@ with app.app_context():
     db.create_all()
     migrate_ticket_schema()
     migrate_subadmin_phone_column()
+    migrate_transaction_client_ref()
+    migrate_game_round_bet_user_ref()
+    migrate_kind_status_normalization()
+    migrate_wallet_ledger_indexes()
+    migrate_wallet_change_seq()
+    migrate_store_webhook_columns()
+    migrate_store_transaction_ref_unique()
+    migrate_idempotency_lease()
     print("✅ Database tables created (including ForcedWinnerHistory)")
 
     print("👥 Seeding demo users...")
     seed_demo_users()
 
-    print("🎮 Initializing game tables...")
-    initialize_game_tables()
+    if GAME_ENGINE_MODE == "client":
+        print(f"🎮 Game tables run in the engine process ({GAME_ENGINE_SOCKET})")
+    else:
+        print("🎮 Initializing game tables...")
+        initialize_game_tables()
+
+        print("▶️  Starting game threads...")
+        start_all_game_tables()
 
-    print("▶️  Starting game threads...")
-    start_all_game_tables()
+    install_shutdown_hooks()
+    start_store_webhooks()
 
     print("\n" + "=" * 60)
     print("🎮 GAME OF FIVE - Admin Panel Ready")
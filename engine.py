@@ -0,0 +1,31 @@
+"""
+Standalone game engine.
+
+Runs every game table in this one process and serves bet admission and
+table snapshots to the web workers over a local Unix socket:
+
+    python engine.py
+    GAME_ENGINE_MODE=client gunicorn -k eventlet -w 4 app:app
+
+Both sides must share FLASK_SECRET_KEY (the socket auth key is derived
+from it) and GAME_ENGINE_SOCKET if the default path is overridden.
+
+Both sides must also set the same SOCKETIO_MESSAGE_QUEUE (``local`` is
+enough on one host). The engine emits every table broadcast, but the
+browsers are connected to the gunicorn workers; without a shared queue
+those emits never reach them. The engine and client-mode workers refuse
+to start while it is empty:
+
+    SOCKETIO_MESSAGE_QUEUE=local python engine.py
+    SOCKETIO_MESSAGE_QUEUE=local GAME_ENGINE_MODE=client gunicorn -k eventlet -w 4 app:app
+"""
+
+import os
+
+os.environ["GAME_ENGINE_MODE"] = "engine"
+
+from app import serve_game_engine  # noqa: E402  (importing app starts the tables)
+
+
+if __name__ == "__main__":
+    serve_game_engine()
@@ -175,6 +175,24 @@ function formatTime(seconds) {
   return `${mins}:${secs.toString().padStart(2, "0")}`;
 }
 
+// ================= SERVER CLOCK =================
+// Countdowns run locally against the table's *_ts deadlines (UTC epoch
+// seconds); serverClockOffsetMs comes from the clock_sync handshake.
+let serverClockOffsetMs = 0;
+
+function serverNow() {
+  return Date.now() + serverClockOffsetMs;
+}
+
+function secondsRemaining(table, fallback = 0) {
+  const endTs = Number(table?.end_ts) || 0;
+  if (!endTs) return fallback;
+  const now = serverNow() / 1000;
+  const startTs = Number(table?.start_ts) || 0;
+  if (startTs && now < startTs) return Math.floor(endTs - startTs);
+  return Math.max(0, Math.floor(endTs - now));
+}
+
 function renderTimer() {
   if (!timerText) return;
   timerText.textContent = formatTime(displayRemainingSeconds);
@@ -624,7 +642,7 @@ function startLocalTimer() {
   localTimerInterval = setInterval(() => {
     if (gameFinished) return;
     if (displayRemainingSeconds > 0) {
-      displayRemainingSeconds -= 1;
+      displayRemainingSeconds = secondsRemaining(currentTable, displayRemainingSeconds - 1);
       renderTimer();
     }
   }, 1000);
@@ -638,41 +656,47 @@ async function fetchTableData() {
   try {
     const res = await fetch("/api/tables/diamond");
     const data = await res.json();
+    applyTablesList(data.tables);
+  } catch (err) {
+    console.error("fetchTableData error", err);
+  }
+}
 
-    if (gameFinished) return;
+// Picks this page's table out of an /api/tables list or a table_snapshot.
+function applyTablesList(tables) {
+  if (gameFinished) return;
 
-    if (!data.tables || !data.tables.length) {
-      setStatus("No active tables", "error");
-      return;
-    }
+  if (!tables || !tables.length) {
+    setStatus("No active tables", "error");
+    return;
+  }
 
-    let table = null;
+  let table = null;
 
-    if (tableCodeFromUrl) {
-      table = data.tables.find((t) => t.round_code === tableCodeFromUrl) || null;
+  if (tableCodeFromUrl) {
+    table = tables.find((t) => t.round_code === tableCodeFromUrl) || null;
 
-      if (!table) {
-        gameFinished = true;
-        disableBettingUI(true);
-        if (tablePollInterval) clearInterval(tablePollInterval);
-        if (localTimerInterval) clearInterval(localTimerInterval);
+    if (!table) {
+      gameFinished = true;
+      disableBettingUI(true);
+      if (tablePollInterval) clearInterval(tablePollInterval);
+      if (localTimerInterval) clearInterval(localTimerInterval);
 
-        stopDiamondLoop(); // NEW
+      stopDiamondLoop(); // NEW
 
-        setStatus("This game has finished. You'll be taken back to lobby to join a new one.", "error");
-        setTimeout(() => window.history.back(), 2000);
-        return;
-      }
-    } else {
-      table = data.tables[0];
-      syncUrlWithTable(table.round_code);
+      setStatus("This game has finished. You'll be taken back to lobby to join a new one.", "error");
+      setTimeout(() => window.history.back(), 2000);
+      return;
     }
-
-    currentTable = table;
-    updateGameUI(table);
-  } catch (err) {
-    console.error("fetchTableData error", err);
+  } else {
+    table = tables[0];
+    syncUrlWithTable(table.round_code);
   }
+
+  // a cached snapshot may be older than the deltas already applied
+  if (isCurrentRound(table) && Number(table.version) < tableVersion) return;
+
+  applyTableState(table, table.version);
 }
 
 function updateGameUI(table) {
@@ -769,9 +793,7 @@ function updateGameUI(table) {
 function startPolling() {
   fetchTableData();
   if (tablePollInterval) clearInterval(tablePollInterval);
-  tablePollInterval = setInterval(() => {
-    if (!gameFinished) fetchTableData();
-  }, 2000);
+  tablePollInterval = setInterval(tickTable, 2000);
 }
 
 // ================= SOCKET =================
@@ -788,33 +810,168 @@ async function fetchBalance() {
   }
 }
 
+// client_bet_id makes place_bet safe to retry: the server answers a repeat
+// with the original bet_success instead of debiting again
+function newClientBetId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+// Bets sent but not answered yet, by client_bet_id. They are resent with the
+// same id after a reconnect or when no reply arrives within BET_RETRY_MS, so
+// a lost reply never turns into a second bet.
+const BET_RETRY_MS = 5000;
+const BET_MAX_SENDS = 4;
+const pendingBets = new Map();
+
+function sendBet(payload) {
+  const id = payload.client_bet_id;
+  const entry = pendingBets.get(id) || { payload, sends: 0, timer: null };
+  clearTimeout(entry.timer);
+  pendingBets.set(id, entry);
+  if (!socket || !socket.connected) return; // resent on connect
+  entry.sends += 1;
+  entry.timer = setTimeout(() => retryBet(id), BET_RETRY_MS);
+  socket.emit("place_bet", payload);
+}
+
+function retryBet(id) {
+  const entry = pendingBets.get(id);
+  if (!entry) return;
+  if (entry.sends >= BET_MAX_SENDS) {
+    pendingBets.delete(id);
+    setStatus("No reply from the server for your bet. Please check your bets.", "error");
+    return;
+  }
+  sendBet(entry.payload);
+}
+
+// bet_success / bet_error for one of our pending bets
+function settlePendingBet(payload) {
+  const entry = pendingBets.get(payload?.client_bet_id);
+  if (!entry) return;
+  clearTimeout(entry.timer);
+  pendingBets.delete(payload.client_bet_id);
+}
+
+function resendPendingBets() {
+  pendingBets.forEach((entry) => sendBet(entry.payload));
+}
+
 function joinGameRoom() {
   socket.emit("join_game", { game_type: GAME, user_id: USER_ID });
 }
 
 socket.on("connect", () => {
-  joinGameRoom();
-  fetchBalance();
-  fetchTableData();
+  socket.emit("clock_sync", { client_time: Date.now() });
+  joinGameRoom(); // replies with a table_snapshot carrying tables + balance
+  resendPendingBets();
 });
 
 socket.on("connect_error", (error) => console.error("[socket] CONNECTION ERROR:", error));
 socket.on("disconnect", () => {});
 
-// ✅ bet_success: refresh from API (simplest + consistent)
+// ✅ bet_success: add our bet locally; the next update_table confirms it
 socket.on("bet_success", (payload) => {
+  settlePendingBet(payload);
   if (gameFinished) return;
   setStatus(payload?.message || "Bet placed ✓", "ok");
   if (typeof payload?.new_balance === "number") updateWallet(payload.new_balance);
-  fetchTableData();
+  if (payload?.bet && isCurrentRound(payload)) {
+    applyTableState({
+      ...currentTable,
+      players: payload.players,
+      slots_available: payload.slots_available,
+      bets: mergeBets(currentTable.bets || [], [payload.bet]),
+    });
+  }
 });
 
-socket.on("update_table", () => {
-  if (gameFinished) return;
-  fetchTableData();
+// ================= TABLE DELTAS =================
+// update_table carries only what changed since `base_version` (new bets +
+// phase fields); merge it into currentTable and ask for a snapshot when a
+// version was missed.
+let tableVersion = 0;
+let resyncPending = false;
+
+function isCurrentRound(payload) {
+  return !!currentTable && String(payload?.round_code) === String(currentTable.round_code);
+}
+
+function mergeBets(bets, added) {
+  const key = (b) => `${b.user_id}:${b.number}`;
+  const seen = new Set(bets.map(key));
+  const out = bets.slice();
+  for (const b of added || []) {
+    if (seen.has(key(b))) continue;
+    seen.add(key(b));
+    out.push(b);
+  }
+  return out;
+}
+
+function requestResync() {
+  if (resyncPending) return;
+  resyncPending = true;
+  socket.emit("resync", { game_type: GAME });
+}
+
+function applyTableState(table, version) {
+  currentTable = { ...table, time_remaining: secondsRemaining(table, table.time_remaining) };
+  if (version !== undefined) tableVersion = Number(version) || 0;
+  updateGameUI(currentTable);
+}
+
+socket.on("update_table", (payload) => {
+  if (gameFinished || !payload) return;
+  if (!isCurrentRound(payload)) {
+    // our table moved on to a new round: fetchTableData takes us back
+    if (currentTable && payload.table_number === currentTable.table_number) fetchTableData();
+    return;
+  }
+
+  const version = Number(payload.version) || 0;
+  if (payload.delta) {
+    if (version <= tableVersion) return; // already reflected
+    if ((Number(payload.base_version) || 0) > tableVersion) return requestResync();
+  }
+
+  const { delta, added, base_version, version: _v, ...fields } = payload;
+  const bets = delta ? mergeBets(currentTable.bets || [], added) : (payload.bets || []);
+  applyTableState({ ...currentTable, ...fields, bets }, version);
 });
 
+// join_game and resync replies: the game's tables (plus our balance on join)
+socket.on("table_snapshot", (payload) => {
+  resyncPending = false;
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+  applyTablesList(payload?.tables);
+});
+
+socket.on("clock_sync", (payload) => {
+  const sentAt = Number(payload?.client_time) || 0;
+  const serverTime = Number(payload?.server_time) || 0;
+  if (!sentAt || !serverTime) return;
+  const now = Date.now();
+  serverClockOffsetMs = serverTime * 1000 + (now - sentAt) / 2 - now;
+});
+
+// wallet changes (bets, wins, card purchases, redeems) pushed to user:<id>
+socket.on("balance", (payload) => {
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+});
+
+// No polling: the countdown is recomputed locally from end_ts and phase
+// changes arrive as update_table; /api/tables is only polled while the
+// socket is down.
+function tickTable() {
+  if (gameFinished) return;
+  if (!socket.connected) return fetchTableData();
+  if (currentTable) applyTableState(currentTable);
+}
+
 socket.on("bet_error", (payload) => {
+  settlePendingBet(payload);
   if (gameFinished) return;
   setStatus(payload?.message || "Bet error", "error");
 });
@@ -873,11 +1030,12 @@ if (placeBetBtn) {
       return;
     }
 
-    socket.emit("place_bet", {
+    sendBet({
       game_type: GAME,
       user_id: USER_ID,
       username: USERNAME,
       number: selectedNumber,
+      client_bet_id: newClientBetId(),
     });
   });
 }
@@ -191,6 +191,32 @@ function safeNum(v, fallback = 0) {
   return Number.isFinite(n) ? n : fallback;
 }
 
+// ================= SERVER CLOCK =================
+// Countdowns run locally against the table's *_ts deadlines (UTC epoch
+// seconds); serverClockOffsetMs comes from the clock_sync handshake.
+let serverClockOffsetMs = 0;
+
+function serverNow() {
+  return Date.now() + serverClockOffsetMs;
+}
+
+function secondsRemaining(raw, fallback = 0) {
+  const endTs = safeNum(pick(raw, "end_ts"), 0);
+  if (!endTs) return fallback;
+  const now = serverNow() / 1000;
+  const startTs = safeNum(pick(raw, "start_ts"), 0);
+  if (startTs && now < startTs) return Math.floor(endTs - startTs);
+  return Math.max(0, Math.floor(endTs - now));
+}
+
+function handleClockSync(payload) {
+  const sentAt = safeNum(payload?.client_time, 0);
+  const serverTime = safeNum(payload?.server_time, 0);
+  if (!sentAt || !serverTime) return;
+  const now = Date.now();
+  serverClockOffsetMs = serverTime * 1000 + (now - sentAt) / 2 - now;
+}
+
 function formatTime(seconds) {
   const s = Math.max(0, parseInt(seconds || 0, 10));
   const mins = Math.floor(s / 60);
@@ -211,7 +237,7 @@ function normalizeTable(raw) {
   const t = { ...raw };
 
   t.roundCode = pick(raw, "round_code", "roundcode");
-  t.timeRemaining = safeNum(pick(raw, "time_remaining", "timeremaining"), 0);
+  t.timeRemaining = secondsRemaining(raw, safeNum(pick(raw, "time_remaining", "timeremaining"), 0));
   t.isFinished = toBool(pick(raw, "is_finished", "isfinished"));
   t.isBettingClosed = toBool(pick(raw, "is_betting_closed", "isbettingclosed"));
 
@@ -721,7 +747,7 @@ function startLocalTimer() {
     if (gameFinished) return;
 
     if (displayRemainingSeconds > 0) {
-      displayRemainingSeconds -= 1;
+      displayRemainingSeconds = secondsRemaining(currentTable, displayRemainingSeconds - 1);
       renderTimer();
 
       maybeStartKickVideo();
@@ -737,46 +763,54 @@ async function fetchTableData() {
   try {
     const res = await fetch("/api/tables/gold");
     const data = await res.json();
+    applyTablesList(data.tables);
+  } catch (err) {
+    console.error("fetchTableData error", err);
+  }
+}
 
-    if (!data.tables || !data.tables.length) {
-      setStatus("No active tables", "error");
-      return;
-    }
+// Picks this page's table out of an /api/tables list or a table_snapshot.
+function applyTablesList(tables) {
+  if (gameFinished) return;
+
+  if (!tables || !tables.length) {
+    setStatus("No active tables", "error");
+    return;
+  }
 
-    let raw = null;
+  let raw = null;
 
-    if (tableCodeFromUrl) {
-      raw =
-        data.tables.find((t) => String(pick(t, "round_code", "roundcode")) === String(tableCodeFromUrl)) ||
-        null;
+  if (tableCodeFromUrl) {
+    raw =
+      tables.find((t) => String(pick(t, "round_code", "roundcode")) === String(tableCodeFromUrl)) ||
+      null;
 
-      if (!raw) {
-        gameFinished = true;
-        disableBettingUI(true);
+    if (!raw) {
+      gameFinished = true;
+      disableBettingUI(true);
 
-        if (tablePollInterval) clearInterval(tablePollInterval);
-        tablePollInterval = null;
+      if (tablePollInterval) clearInterval(tablePollInterval);
+      tablePollInterval = null;
 
-        if (localTimerInterval) clearInterval(localTimerInterval);
-        localTimerInterval = null;
+      if (localTimerInterval) clearInterval(localTimerInterval);
+      localTimerInterval = null;
 
-        cleanupKickVideo();
-        stopGoldLoop(); // NEW
+      cleanupKickVideo();
+      stopGoldLoop(); // NEW
 
-        setStatus("This game has finished. You'll be taken back to lobby to join a new one.", "error");
-        setTimeout(() => window.history.back(), 2000);
-        return;
-      }
-    } else {
-      raw = data.tables[0];
-      syncUrlWithTable(pick(raw, "round_code", "roundcode"));
+      setStatus("This game has finished. You'll be taken back to lobby to join a new one.", "error");
+      setTimeout(() => window.history.back(), 2000);
+      return;
     }
-
-    currentTable = normalizeTable(raw);
-    updateGameUI(currentTable);
-  } catch (err) {
-    console.error("fetchTableData error", err);
+  } else {
+    raw = tables[0];
+    syncUrlWithTable(pick(raw, "round_code", "roundcode"));
   }
+
+  // a cached snapshot may be older than the deltas already applied
+  if (isCurrentRound(raw) && Number(raw.version) < tableVersion) return;
+
+  applyTableState(raw, raw.version);
 }
 
 function updateGameUI(table) {
@@ -894,9 +928,7 @@ function startPolling() {
   fetchTableData();
   if (tablePollInterval) clearInterval(tablePollInterval);
 
-  tablePollInterval = setInterval(() => {
-    if (!gameFinished) fetchTableData();
-  }, 1000);
+  tablePollInterval = setInterval(tickTable, 1000);
 }
 
 // ================= SOCKET =================
@@ -912,33 +944,173 @@ async function fetchBalance() {
   }
 }
 
+// client_bet_id makes place_bet safe to retry: the server answers a repeat
+// with the original bet_success instead of debiting again
+function newClientBetId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+// Bets sent but not answered yet, by client_bet_id. They are resent with the
+// same id after a reconnect or when no reply arrives within BET_RETRY_MS, so
+// a lost reply never turns into a second bet.
+const BET_RETRY_MS = 5000;
+const BET_MAX_SENDS = 4;
+const pendingBets = new Map();
+
+function sendBet(payload) {
+  const id = payload.client_bet_id;
+  const entry = pendingBets.get(id) || { payload, sends: 0, timer: null };
+  clearTimeout(entry.timer);
+  pendingBets.set(id, entry);
+  if (!socket || !socket.connected) return; // resent on connect
+  entry.sends += 1;
+  entry.timer = setTimeout(() => retryBet(id), BET_RETRY_MS);
+  socket.emit("place_bet", payload);
+}
+
+function retryBet(id) {
+  const entry = pendingBets.get(id);
+  if (!entry) return;
+  if (entry.sends >= BET_MAX_SENDS) {
+    pendingBets.delete(id);
+    setStatus("No reply from the server for your bet. Please check your bets.", "error");
+    return;
+  }
+  sendBet(entry.payload);
+}
+
+// bet_success / bet_error for one of our pending bets
+function settlePendingBet(payload) {
+  const entry = pendingBets.get(payload?.client_bet_id);
+  if (!entry) return;
+  clearTimeout(entry.timer);
+  pendingBets.delete(payload.client_bet_id);
+}
+
+function resendPendingBets() {
+  pendingBets.forEach((entry) => sendBet(entry.payload));
+}
+
 function joinGameRoom() {
   socket.emit("join_game", { game_type: GAME, user_id: USER_ID });
   socket.emit("joingame", { game_type: GAME, user_id: USER_ID });
 }
 
+// ================= TABLE DELTAS =================
+// update_table carries only what changed since `base_version` (new bets +
+// phase fields); merge it into currentTable and ask for a snapshot when a
+// version was missed.
+let tableVersion = 0;
+let resyncPending = false;
+
+function isCurrentRound(payload) {
+  return !!currentTable && String(pick(payload, "round_code", "roundcode")) === String(currentTable.roundCode);
+}
+
+function mergeBets(bets, added) {
+  const key = (b) => `${pick(b, "user_id", "userid")}:${b.number}`;
+  const seen = new Set(bets.map(key));
+  const out = bets.slice();
+  for (const b of added || []) {
+    if (seen.has(key(b))) continue;
+    seen.add(key(b));
+    out.push(b);
+  }
+  return out;
+}
+
+function requestResync() {
+  if (resyncPending) return;
+  resyncPending = true;
+  socket.emit("resync", { game_type: GAME });
+}
+
+function applyTableState(raw, version) {
+  currentTable = normalizeTable(raw);
+  if (version !== undefined) tableVersion = safeNum(version, tableVersion);
+  updateGameUI(currentTable);
+}
+
+function handleTableDelta(payload) {
+  if (gameFinished || !payload) return;
+  if (!isCurrentRound(payload)) {
+    // our table moved on to a new round: fetchTableData takes us back
+    if (currentTable && String(pick(payload, "table_number")) === String(pick(currentTable, "table_number"))) {
+      fetchTableData();
+    }
+    return;
+  }
+
+  const version = safeNum(payload.version, 0);
+  if (payload.delta) {
+    if (version <= tableVersion) return; // already reflected
+    if (safeNum(payload.base_version, 0) > tableVersion) return requestResync();
+  }
+
+  const { delta, added, base_version, version: _v, ...fields } = payload;
+  const bets = delta ? mergeBets(currentTable.bets || [], added) : (payload.bets || []);
+  applyTableState({ ...currentTable, ...fields, bets }, version);
+}
+
+function applyOwnBet(payload) {
+  if (!payload?.bet || !isCurrentRound(payload)) return;
+  applyTableState({
+    ...currentTable,
+    players: payload.players,
+    slots_available: payload.slots_available,
+    bets: mergeBets(currentTable.bets || [], [payload.bet]),
+  });
+}
+
+// join_game and resync replies: the game's tables (plus our balance on join)
+function handleTableSnapshot(payload) {
+  resyncPending = false;
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+  applyTablesList(payload?.tables);
+}
+
+socket.on("table_snapshot", handleTableSnapshot);
+socket.on("clock_sync", handleClockSync);
+
+// wallet changes (bets, wins, card purchases, redeems) pushed to user:<id>
+socket.on("balance", (payload) => {
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+});
+
+// No per-second polling: the countdown is recomputed locally from end_ts and
+// phase changes arrive as update_table; /api/tables is only polled while the
+// socket is down.
+function tickTable() {
+  if (gameFinished) return;
+  if (!socket.connected) return fetchTableData();
+  if (currentTable) applyTableState(currentTable);
+}
+
 socket.on("connect", () => {
-  joinGameRoom();
-  fetchBalance();
-  fetchTableData();
+  socket.emit("clock_sync", { client_time: Date.now() });
+  joinGameRoom(); // replies with a table_snapshot carrying tables + balance
+  resendPendingBets();
 });
 
 function handleBetSuccess(payload) {
+  settlePendingBet(payload);
   if (gameFinished) return;
 
   setStatus(payload?.message || "Bet placed ✓", "ok");
   const newBal = payload?.new_balance ?? payload?.newbalance;
   if (typeof newBal === "number") updateWallet(newBal);
 
-  fetchTableData();
+  applyOwnBet(payload);
 }
 
 function handleUpdateTable(payload) {
   if (gameFinished) return;
-  fetchTableData();
+  handleTableDelta(payload);
 }
 
 function handleBetError(payload) {
+  settlePendingBet(payload);
   if (gameFinished) return;
   setStatus(payload?.message || "Bet error", "error");
 }
@@ -994,9 +1166,10 @@ if (placeBetBtn) {
       user_id: USER_ID,
       username: USERNAME,
       number: selectedNumber,
+      client_bet_id: newClientBetId(),
     };
 
-    socket.emit("place_bet", payload);
+    sendBet(payload);
     socket.emit("placebet", payload);
   });
 }
@@ -161,66 +161,140 @@ if (tableNumber !== "" && tableNumber !== null && tableNumber !== undefined) {
   return card;
 }
 
-async function loadHistory() {
+// finished games shown so far, newest first, and the cursors to extend them
+let historyGames = [];
+let nextCursor = null;
+let latestCursor = null;
+
+async function fetchUserGames(params) {
+  const qs = new URLSearchParams(params || {});
+  const res = await fetch(`/api/user-games?${qs.toString()}`, {
+    headers: {
+      Accept: "application/json"
+    }
+  });
+
+  const contentType = res.headers.get("content-type") || "";
+  const rawText = await res.text();
+
+  if (!res.ok) {
+    throw new Error(`HTTP ${res.status}: ${rawText.slice(0, 300)}`);
+  }
+
+  if (!contentType.includes("application/json")) {
+    throw new Error(`Expected JSON but got: ${contentType}. Response: ${rawText.slice(0, 300)}`);
+  }
+
+  return JSON.parse(rawText);
+}
+
+function renderCurrentGames(currentGames) {
   const currentWrap = document.getElementById("currentGames");
+
+  currentWrap.innerHTML = "";
+  if (!currentGames.length) {
+    currentWrap.innerHTML = '<div class="empty-message">No current games. Place a bet to start playing!</div>';
+  } else {
+    currentGames.forEach((g) => {
+      currentWrap.appendChild(renderGameCard(g, true));
+    });
+  }
+}
+
+function renderHistoryGames() {
   const historyWrap = document.getElementById("historyGames");
 
-  currentWrap.innerHTML = '<div class="empty-message">Loading your games…</div>';
-  historyWrap.innerHTML = '<div class="empty-message">Loading your games…</div>';
+  historyWrap.innerHTML = "";
+  if (!historyGames.length) {
+    historyWrap.innerHTML = '<div class="empty-message">No completed games yet.</div>';
+    return;
+  }
 
-  try {
-    const res = await fetch("/api/user-games", {
-      headers: {
-        Accept: "application/json"
-      }
+  historyGames.forEach((g) => {
+    historyWrap.appendChild(renderGameCard(g, false));
+  });
+
+  if (nextCursor) {
+    const more = document.createElement("button");
+    more.className = "open-game-btn";
+    more.textContent = "Load more";
+    more.addEventListener("click", () => {
+      more.disabled = true;
+      loadMoreHistory();
     });
+    historyWrap.appendChild(more);
+  }
+}
 
-    const contentType = res.headers.get("content-type") || "";
-    const rawText = await res.text();
+async function loadHistory() {
+  const currentWrap = document.getElementById("currentGames");
+  const historyWrap = document.getElementById("historyGames");
 
-    console.log("HTTP status:", res.status);
-    console.log("Content-Type:", contentType);
-    console.log("RAW response text:", rawText);
+  currentWrap.innerHTML = '<div class="empty-message">Loading your games…</div>';
+  historyWrap.innerHTML = '<div class="empty-message">Loading your games…</div>';
 
-    if (!res.ok) {
-      throw new Error(`HTTP ${res.status}: ${rawText.slice(0, 300)}`);
-    }
+  try {
+    const data = await fetchUserGames();
 
-    if (!contentType.includes("application/json")) {
-      throw new Error(`Expected JSON but got: ${contentType}. Response: ${rawText.slice(0, 300)}`);
-    }
+    historyGames = data.game_history || data.gamehistory || [];
+    nextCursor = data.next_cursor || null;
+    latestCursor = data.latest_cursor || null;
 
-    const data = JSON.parse(rawText);
+    renderCurrentGames(data.current_games || data.currentgames || []);
+    renderHistoryGames();
+  } catch (err) {
+    console.error("Error loading history:", err);
+    currentWrap.innerHTML = '<div class="empty-message">Could not load history.</div>';
+    historyWrap.innerHTML = '<div class="empty-message">Could not load history.</div>';
+  }
+}
 
-    console.log("RAW /api/user-games response:", data);
+async function loadMoreHistory() {
+  if (!nextCursor) return;
 
-    const currentGames = data.current_games || data.currentgames || [];
-    const historyGames = data.game_history || data.gamehistory || [];
+  try {
+    const data = await fetchUserGames({ cursor: nextCursor });
+    historyGames = historyGames.concat(data.game_history || []);
+    nextCursor = data.next_cursor || null;
+    renderHistoryGames();
+  } catch (err) {
+    console.error("Error loading more history:", err);
+    renderHistoryGames();
+  }
+}
 
-    console.log("currentGames:", currentGames);
-    console.log("historyGames:", historyGames);
+// periodic refresh: current games, plus only the rounds finished since the
+// newest one already shown
+async function refreshHistory() {
+  try {
+    const data = await fetchUserGames(latestCursor ? { since: latestCursor } : {});
+
+    if (!latestCursor) {
+      // nothing finished yet when we last looked: this is a first page
+      historyGames = data.game_history || [];
+      nextCursor = data.next_cursor || null;
+      latestCursor = data.latest_cursor || null;
+      renderCurrentGames(data.current_games || []);
+      renderHistoryGames();
+      return;
+    }
 
-    currentWrap.innerHTML = "";
-    if (!currentGames.length) {
-      currentWrap.innerHTML = '<div class="empty-message">No current games. Place a bet to start playing!</div>';
-    } else {
-      currentGames.forEach((g) => {
-        currentWrap.appendChild(renderGameCard(g, true));
-      });
+    if (data.has_more) {
+      // more new rounds than one page; start over from the top
+      loadHistory();
+      return;
     }
 
-    historyWrap.innerHTML = "";
-    if (!historyGames.length) {
-      historyWrap.innerHTML = '<div class="empty-message">No completed games yet.</div>';
-    } else {
-      historyGames.forEach((g) => {
-        historyWrap.appendChild(renderGameCard(g, false));
-      });
+    renderCurrentGames(data.current_games || []);
+
+    const fresh = data.game_history || [];
+    if (fresh.length) {
+      historyGames = fresh.concat(historyGames);
+      latestCursor = data.latest_cursor || latestCursor;
+      renderHistoryGames();
     }
   } catch (err) {
-    console.error("Error loading history:", err);
-    currentWrap.innerHTML = '<div class="empty-message">Could not load history.</div>';
-    historyWrap.innerHTML = '<div class="empty-message">Could not load history.</div>';
+    console.error("Error refreshing history:", err);
   }
 }
 
@@ -231,7 +305,7 @@ document.addEventListener("DOMContentLoaded", () => {
   setInterval(() => {
     const currentTab = document.querySelector('.tab[data-tab="current"]');
     if (currentTab && currentTab.classList.contains("active")) {
-      loadHistory();
+      refreshHistory();
     }
   }, 10000);
 });
@@ -3,32 +3,43 @@ const USER_ID = localStorage.getItem('user_id') || 'guest';
 let walletBalance = 0;
 
 // --- Update wallet balance ---
+function showBalance(balance) {
+  const pill = document.getElementById('coinsPill');
+  walletBalance = balance || 0;
+
+  const display = document.getElementById('walletBalance');
+  if (display) {
+    display.textContent = walletBalance.toLocaleString('en-IN');
+  }
+
+  // small bounce animation when value updates
+  if (pill) {
+    pill.classList.add('bounce');
+    setTimeout(() => pill.classList.remove('bounce'), 450);
+  }
+}
+
 function updateBalance() {
   fetch(`/balance/${USER_ID}`)
     .then(res => res.json())
-    .then(data => {
-      const pill = document.getElementById('coinsPill');
-      walletBalance = data.balance || 0;
-
-      const display = document.getElementById('walletBalance');
-      if (display) {
-        display.textContent = walletBalance.toLocaleString('en-IN');
-      }
-
-      // small bounce animation when value updates
-      if (pill) {
-        pill.classList.add('bounce');
-        setTimeout(() => pill.classList.remove('bounce'), 450);
-      }
-    })
+    .then(data => showBalance(data.balance))
     .catch(err => {
       console.error('Balance fetch error', err);
     });
 }
 
-// Update on load and every 10 seconds
+// Server pushes every wallet change to our user:<id> room; polling every
+// 10 seconds is only a fallback while the socket is down.
+const balanceSocket = typeof io === 'function' ? io() : null;
+if (balanceSocket) {
+  balanceSocket.on('balance', data => showBalance(data.balance));
+  balanceSocket.on('connect', updateBalance);
+}
+
 updateBalance();
-setInterval(updateBalance, 10000);
+setInterval(() => {
+  if (!balanceSocket || !balanceSocket.connected) updateBalance();
+}, 10000);
 
 // --- Coins pill click → Redeem page ---
 const coinsPill = document.getElementById('coinsPill');
@@ -184,13 +184,39 @@ function safeNum(v, fallback = 0) {
   return Number.isFinite(n) ? n : fallback;
 }
 
+// ================= SERVER CLOCK =================
+// Countdowns run locally against the table's *_ts deadlines (UTC epoch
+// seconds); serverClockOffsetMs comes from the clock_sync handshake.
+let serverClockOffsetMs = 0;
+
+function serverNow() {
+  return Date.now() + serverClockOffsetMs;
+}
+
+function secondsRemaining(raw, fallback = 0) {
+  const endTs = safeNum(pick(raw, "end_ts"), 0);
+  if (!endTs) return fallback;
+  const now = serverNow() / 1000;
+  const startTs = safeNum(pick(raw, "start_ts"), 0);
+  if (startTs && now < startTs) return Math.floor(endTs - startTs);
+  return Math.max(0, Math.floor(endTs - now));
+}
+
+function handleClockSync(payload) {
+  const sentAt = safeNum(payload?.client_time, 0);
+  const serverTime = safeNum(payload?.server_time, 0);
+  if (!sentAt || !serverTime) return;
+  const now = Date.now();
+  serverClockOffsetMs = serverTime * 1000 + (now - sentAt) / 2 - now;
+}
+
 function normalizeTable(table) {
   if (!table) return null;
 
   const t = { ...table };
 
   t.roundCode = pick(table, "round_code", "roundcode");
-  t.timeRemaining = safeNum(pick(table, "time_remaining", "timeremaining"), 0);
+  t.timeRemaining = secondsRemaining(table, safeNum(pick(table, "time_remaining", "timeremaining"), 0));
   t.isFinished = toBool(pick(table, "is_finished", "isfinished"));
   t.isBettingClosed = toBool(pick(table, "is_betting_closed", "isbettingclosed"));
 
@@ -620,46 +646,54 @@ async function fetchTableData() {
   try {
     const res = await fetch("/api/tables/platinum");
     const data = await res.json();
+    applyTablesList(data.tables);
+  } catch (err) {
+    console.error("fetchTableData error", err);
+  }
+}
 
-    if (!data.tables || !data.tables.length) {
-      setStatus("No active tables", "error");
-      return;
-    }
-
-    let rawTable = null;
+// Picks this page's table out of an /api/tables list or a table_snapshot.
+function applyTablesList(tables) {
+  if (gameFinished) return;
 
-    if (tableCodeFromUrl) {
-      rawTable =
-        data.tables.find((t) => String(pick(t, "round_code", "roundcode")) === String(tableCodeFromUrl)) || null;
+  if (!tables || !tables.length) {
+    setStatus("No active tables", "error");
+    return;
+  }
 
-      if (!rawTable) {
-        gameFinished = true;
-        disableBettingUI(true);
-        setStatus("This game has finished. You'll be taken back to lobby for a new one.", "error");
+  let rawTable = null;
 
-        stopPlatinumLoop(); // NEW
+  if (tableCodeFromUrl) {
+    rawTable =
+      tables.find((t) => String(pick(t, "round_code", "roundcode")) === String(tableCodeFromUrl)) || null;
 
-        if (tablePollInterval) {
-          clearInterval(tablePollInterval);
-          tablePollInterval = null;
-        }
+    if (!rawTable) {
+      gameFinished = true;
+      disableBettingUI(true);
+      setStatus("This game has finished. You'll be taken back to lobby for a new one.", "error");
 
-        setTimeout(() => {
-          window.location.href = "/game/platinum";
-        }, 2000);
+      stopPlatinumLoop(); // NEW
 
-        return;
+      if (tablePollInterval) {
+        clearInterval(tablePollInterval);
+        tablePollInterval = null;
       }
-    } else {
-      rawTable = data.tables[0];
-      syncUrlWithTable(pick(rawTable, "round_code", "roundcode"));
-    }
 
-    currentTable = normalizeTable(rawTable);
-    updateGameUI(currentTable);
-  } catch (err) {
-    console.error("fetchTableData error", err);
+      setTimeout(() => {
+        window.location.href = "/game/platinum";
+      }, 2000);
+
+      return;
+    }
+  } else {
+    rawTable = tables[0];
+    syncUrlWithTable(pick(rawTable, "round_code", "roundcode"));
   }
+
+  // a cached snapshot may be older than the deltas already applied
+  if (isCurrentRound(rawTable) && Number(rawTable.version) < tableVersion) return;
+
+  applyTableState(rawTable, rawTable.version);
 }
 
 function updateGameUI(table) {
@@ -811,25 +845,165 @@ async function fetchBalance() {
   }
 }
 
+// client_bet_id makes place_bet safe to retry: the server answers a repeat
+// with the original bet_success instead of debiting again
+function newClientBetId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+// Bets sent but not answered yet, by client_bet_id. They are resent with the
+// same id after a reconnect or when no reply arrives within BET_RETRY_MS, so
+// a lost reply never turns into a second bet.
+const BET_RETRY_MS = 5000;
+const BET_MAX_SENDS = 4;
+const pendingBets = new Map();
+
+function sendBet(payload) {
+  const id = payload.client_bet_id;
+  const entry = pendingBets.get(id) || { payload, sends: 0, timer: null };
+  clearTimeout(entry.timer);
+  pendingBets.set(id, entry);
+  if (!socket || !socket.connected) return; // resent on connect
+  entry.sends += 1;
+  entry.timer = setTimeout(() => retryBet(id), BET_RETRY_MS);
+  socket.emit("place_bet", payload);
+}
+
+function retryBet(id) {
+  const entry = pendingBets.get(id);
+  if (!entry) return;
+  if (entry.sends >= BET_MAX_SENDS) {
+    pendingBets.delete(id);
+    setStatus("No reply from the server for your bet. Please check your bets.", "error");
+    return;
+  }
+  sendBet(entry.payload);
+}
+
+// bet_success / bet_error for one of our pending bets
+function settlePendingBet(payload) {
+  const entry = pendingBets.get(payload?.client_bet_id);
+  if (!entry) return;
+  clearTimeout(entry.timer);
+  pendingBets.delete(payload.client_bet_id);
+}
+
+function resendPendingBets() {
+  pendingBets.forEach((entry) => sendBet(entry.payload));
+}
+
 function joinGameRoom() {
   socket.emit("join_game", { game_type: GAME, user_id: USER_ID });
   socket.emit("joingame", { game_type: GAME, user_id: USER_ID });
 }
 
+// ================= TABLE DELTAS =================
+// update_table carries only what changed since `base_version` (new bets +
+// phase fields); merge it into currentTable and ask for a snapshot when a
+// version was missed.
+let tableVersion = 0;
+let resyncPending = false;
+
+function isCurrentRound(payload) {
+  return !!currentTable && String(pick(payload, "round_code", "roundcode")) === String(currentTable.roundCode);
+}
+
+function mergeBets(bets, added) {
+  const key = (b) => `${pick(b, "user_id", "userid")}:${b.number}`;
+  const seen = new Set(bets.map(key));
+  const out = bets.slice();
+  for (const b of added || []) {
+    if (seen.has(key(b))) continue;
+    seen.add(key(b));
+    out.push(b);
+  }
+  return out;
+}
+
+function requestResync() {
+  if (resyncPending) return;
+  resyncPending = true;
+  socket.emit("resync", { game_type: GAME });
+}
+
+function applyTableState(raw, version) {
+  currentTable = normalizeTable(raw);
+  if (version !== undefined) tableVersion = safeNum(version, tableVersion);
+  updateGameUI(currentTable);
+}
+
+function handleTableDelta(payload) {
+  if (gameFinished || !payload) return;
+  if (!isCurrentRound(payload)) {
+    // our table moved on to a new round: fetchTableData takes us back
+    if (currentTable && String(pick(payload, "table_number")) === String(pick(currentTable, "table_number"))) {
+      fetchTableData();
+    }
+    return;
+  }
+
+  const version = safeNum(payload.version, 0);
+  if (payload.delta) {
+    if (version <= tableVersion) return; // already reflected
+    if (safeNum(payload.base_version, 0) > tableVersion) return requestResync();
+  }
+
+  const { delta, added, base_version, version: _v, ...fields } = payload;
+  const bets = delta ? mergeBets(currentTable.bets || [], added) : (payload.bets || []);
+  applyTableState({ ...currentTable, ...fields, bets }, version);
+}
+
+function applyOwnBet(payload) {
+  if (!payload?.bet || !isCurrentRound(payload)) return;
+  applyTableState({
+    ...currentTable,
+    players: payload.players,
+    slots_available: payload.slots_available,
+    bets: mergeBets(currentTable.bets || [], [payload.bet]),
+  });
+}
+
+// join_game and resync replies: the game's tables (plus our balance on join)
+function handleTableSnapshot(payload) {
+  resyncPending = false;
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+  applyTablesList(payload?.tables);
+}
+
+socket.on("table_snapshot", handleTableSnapshot);
+socket.on("clock_sync", handleClockSync);
+
+// wallet changes (bets, wins, card purchases, redeems) pushed to user:<id>
+socket.on("balance", (payload) => {
+  if (typeof payload?.balance === "number") updateWallet(payload.balance);
+});
+
+// No per-second polling: the countdown is recomputed locally from end_ts and
+// phase changes arrive as update_table; /api/tables is only polled while the
+// socket is down.
+function tickTable() {
+  if (gameFinished) return;
+  if (!socket.connected) return fetchTableData();
+  if (currentTable) applyTableState(currentTable);
+}
+
 socket.on("connect", () => {
-  joinGameRoom();
-  fetchBalance();
-  fetchTableData();
+  socket.emit("clock_sync", { client_time: Date.now() });
+  joinGameRoom(); // replies with a table_snapshot carrying tables + balance
+  resendPendingBets();
 });
 
 function handleBetSuccess(payload) {
+  settlePendingBet(payload);
   setStatus(payload?.message || "Bet placed", "ok");
   const newBal = payload?.new_balance ?? payload?.newbalance;
   if (typeof newBal === "number") updateWallet(newBal);
-  fetchTableData();
+  applyOwnBet(payload);
 }
 
 function handleBetError(payload) {
+  settlePendingBet(payload);
   setStatus(payload?.message || "Bet error", "error");
 }
 
@@ -839,8 +1013,8 @@ socket.on("betsuccess", handleBetSuccess);
 socket.on("bet_error", handleBetError);
 socket.on("beterror", handleBetError);
 
-socket.on("update_table", () => fetchTableData());
-socket.on("updatetable", () => fetchTableData());
+socket.on("update_table", handleTableDelta);
+socket.on("updatetable", handleTableDelta);
 
 // ================== UI EVENTS ==================
 
@@ -892,8 +1066,14 @@ if (placeBetBtn) {
     const alreadyOnThisNumber = myBets.some((b) => Number(b.number) === Number(selectedNumber));
     if (alreadyOnThisNumber) return setStatus("You already placed a bet on this number", "error");
 
-    const payload = { game_type: GAME, user_id: USER_ID, username: USERNAME, number: selectedNumber };
-    socket.emit("place_bet", payload);
+    const payload = {
+      game_type: GAME,
+      user_id: USER_ID,
+      username: USERNAME,
+      number: selectedNumber,
+      client_bet_id: newClientBetId(),
+    };
+    sendBet(payload);
     socket.emit("placebet", payload);
   });
 }
@@ -924,5 +1104,5 @@ setSelectedNumber(0);
 setStatus("");
 
 if (!tablePollInterval) {
-  tablePollInterval = setInterval(fetchTableData, 1000);
+  tablePollInterval = setInterval(tickTable, 1000);
 }
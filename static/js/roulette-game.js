@@ -371,6 +371,23 @@ function toBool(v) {
   return v === true || v === 1 || v === "1" || v === "true";
 }
 
+// Countdowns run locally against the table's *_ts deadlines (UTC epoch
+// seconds); serverClockOffsetMs comes from the clock_sync handshake.
+let serverClockOffsetMs = 0;
+
+function serverNow() {
+  return Date.now() + serverClockOffsetMs;
+}
+
+function secondsRemaining(raw, fallback = null) {
+  const endTs = toNumOrNull(getVal(raw, "end_ts"));
+  if (!endTs) return fallback;
+  const now = serverNow() / 1000;
+  const startTs = toNumOrNull(getVal(raw, "start_ts"));
+  if (startTs && now < startTs) return Math.floor(endTs - startTs);
+  return Math.max(0, Math.floor(endTs - now));
+}
+
 function normalizeTable(raw) {
   if (!raw || typeof raw !== "object") return null;
 
@@ -381,7 +398,10 @@ function normalizeTable(raw) {
   const tableNumber = toIntOrNull(getVal(raw, "table_number", "tablenumber", "tableNumber"));
   const roundCode = getVal(raw, "round_code", "roundcode", "roundCode") || null;
   const result = toNumOrNull(getVal(raw, "result", "winning_number", "winningNumber"));
-  const timeRemaining = toIntOrNull(getVal(raw, "time_remaining", "timeremaining", "timeRemaining"));
+  const timeRemaining = secondsRemaining(
+    raw,
+    toIntOrNull(getVal(raw, "time_remaining", "timeremaining", "timeRemaining"))
+  );
   const isBettingClosed = toBool(getVal(raw, "is_betting_closed", "isbettingclosed"));
   const isFinished = toBool(getVal(raw, "is_finished", "isfinished"));
   const isStartedRaw = getVal(raw, "is_started", "isstarted");
@@ -1026,12 +1046,57 @@ async function fetchRouletteTableState() {
     const t = chooseTable(data.tables);
     if (!t) return;
 
-    applyTableState(t);
+    applyRawTable(t.raw, t.raw.version);
   } catch (e) {
     console.error("[Roulette] fetchRouletteTableState failed:", e);
   }
 }
 
+// ================= TABLE DELTAS =================
+// update_table carries only what changed since `base_version` (new bets +
+// phase fields); merge it into the last raw table and ask for a snapshot
+// when a version was missed.
+let tableVersion = 0;
+let resyncPending = false;
+let lastTableRaw = null;
+
+function mergeBets(bets, added) {
+  const key = (b) => `${getVal(b, "user_id", "userid")}:${getVal(b, "number")}`;
+  const seen = new Set(bets.map(key));
+  const out = bets.slice();
+  for (const b of added || []) {
+    if (seen.has(key(b))) continue;
+    seen.add(key(b));
+    out.push(b);
+  }
+  return out;
+}
+
+function requestResync() {
+  if (resyncPending || !socket) return;
+  resyncPending = true;
+  socket.emit("resync", { game_type: GAMETYPE });
+}
+
+function applyRawTable(raw, version) {
+  lastTableRaw = raw;
+  if (version !== undefined) tableVersion = Number(version) || 0;
+  applyTableState(normalizeTable(raw));
+}
+
+// No per-second polling: the countdown is recomputed locally from end_ts and
+// phase changes arrive as update_table; /api/tables is only polled while the
+// socket is down.
+function tickTable() {
+  if (redirectScheduled || gameFinished) return;
+  if (!socketConnected || !lastTableRaw) return fetchRouletteTableState();
+  applyTableState(normalizeTable(lastTableRaw));
+}
+
+function isLastTableRound(payload) {
+  return !!lastTableRaw && getVal(payload, "round_code", "roundcode") === getVal(lastTableRaw, "round_code", "roundcode");
+}
+
 // ================= SOCKET =================
 let socket = null;
 let socketConnected = false;
@@ -1057,11 +1122,13 @@ function initSocket() {
     console.log("[Roulette] socket connected:", socket.id);
     setStatus("");
 
+    socket.emit("clock_sync", { client_time: Date.now() });
     socket.emit("join_game", {
       game_type: GAMETYPE,
       user_id: USER_ID
     });
 
+    resendPendingBets();
     refreshControls(true);
   });
 
@@ -1083,6 +1150,7 @@ function initSocket() {
   });
 
   socket.on("bet_error", (data) => {
+    settlePendingBet(data);
     if (redirectScheduled || gameFinished) return;
     setStatus(data?.message || "Bet rejected.", "error");
     fetchBalance();
@@ -1090,6 +1158,7 @@ function initSocket() {
   });
 
   socket.on("bet_success", (data) => {
+    settlePendingBet(data);
     if (redirectScheduled || gameFinished) return;
 
     if (typeof data?.new_balance === "number") {
@@ -1107,26 +1176,13 @@ function initSocket() {
 
     setStatus(data?.message || "Bet placed.", "ok");
 
-    if (Array.isArray(data?.players)) {
-      currentPlayers = data.players;
-      currentPlayerCount = Number.isFinite(data?.player_count)
-        ? data.player_count
-        : getUniquePlayerCountFromPlayers(currentPlayers);
-      currentTotalBets = Number.isFinite(data?.total_bets)
-        ? data.total_bets
-        : currentPlayers.length;
-
-      if (data?.phase) currentPhase = data.phase;
-
-      lockedNumbers = new Set(
-        currentPlayers
-          .map((p) => parseInt(getVal(p, "number"), 10))
-          .filter((n) => Number.isFinite(n))
-      );
-
-      updateHeaderPlayersCount();
-      updateMyBetsUIFromPlayers();
-      applyLockedStateToChips();
+    if (data?.bet && isLastTableRound(data)) {
+      applyRawTable({
+        ...lastTableRaw,
+        players: data.players,
+        slots_available: data.slots_available,
+        bets: mergeBets(lastTableRaw.bets || [], [data.bet])
+      });
       snapshotCurrentRoundBets();
     } else {
       fetchRouletteTableState();
@@ -1136,12 +1192,54 @@ function initSocket() {
   });
 
   socket.on("update_table", (payload) => {
+    if (redirectScheduled || gameFinished || !payload) return;
+    if (payload.game_type && payload.game_type !== GAMETYPE) return;
+    if (!isSamePinnedTable(payload)) return;
+
+    const version = Number(payload.version) || 0;
+    if (!payload.delta) {
+      applyRawTable(payload, version);
+      return;
+    }
+
+    if (version <= tableVersion && isLastTableRound(payload)) return; // already reflected
+    if (!isLastTableRound(payload) || (Number(payload.base_version) || 0) > tableVersion) {
+      requestResync();
+      return;
+    }
+
+    const { delta, added, base_version, version: _v, ...fields } = payload;
+    applyRawTable({ ...lastTableRaw, ...fields, bets: mergeBets(lastTableRaw.bets || [], added) }, version);
+  });
+
+  // wallet changes (bets, wins, card purchases, redeems) pushed to user:<id>
+  socket.on("balance", (payload) => {
+    if (typeof payload?.balance !== "number") return;
+    walletBalance = payload.balance;
+    updateWalletUI();
+  });
+
+  socket.on("clock_sync", (payload) => {
+    const sentAt = toNumOrNull(payload?.client_time);
+    const serverTime = toNumOrNull(payload?.server_time);
+    if (!sentAt || !serverTime) return;
+    const now = Date.now();
+    serverClockOffsetMs = serverTime * 1000 + (now - sentAt) / 2 - now;
+  });
+
+  // join_game and resync replies: the game's tables (plus our balance on join)
+  socket.on("table_snapshot", (payload) => {
+    resyncPending = false;
     if (redirectScheduled || gameFinished) return;
-    const t = normalizeTable(payload);
+    if (typeof payload?.balance === "number") {
+      walletBalance = payload.balance;
+      updateWalletUI();
+    }
+    const t = chooseTable(payload?.tables);
     if (!t) return;
-    if (t.game_type && t.game_type !== GAMETYPE) return;
-    if (!isSamePinnedTable(t)) return;
-    applyTableState(t);
+    // a cached snapshot may be older than the deltas already applied
+    if (isLastTableRound(t.raw) && (Number(t.raw.version) || 0) < tableVersion) return;
+    applyRawTable(t.raw, t.raw.version);
   });
 
   socket.on("spin_started", (payload) => {
@@ -1203,6 +1301,54 @@ function initSocket() {
 }
 
 // ================= ACTIONS =================
+// client_bet_id makes place_bet safe to retry: the server answers a repeat
+// with the original bet_success instead of debiting again
+function newClientBetId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+// Bets sent but not answered yet, by client_bet_id. They are resent with the
+// same id after a reconnect or when no reply arrives within BET_RETRY_MS, so
+// a lost reply never turns into a second bet.
+const BET_RETRY_MS = 5000;
+const BET_MAX_SENDS = 4;
+const pendingBets = new Map();
+
+function sendBet(payload) {
+  const id = payload.client_bet_id;
+  const entry = pendingBets.get(id) || { payload, sends: 0, timer: null };
+  clearTimeout(entry.timer);
+  pendingBets.set(id, entry);
+  if (!socket || !socket.connected) return; // resent on connect
+  entry.sends += 1;
+  entry.timer = setTimeout(() => retryBet(id), BET_RETRY_MS);
+  socket.emit("place_bet", payload);
+}
+
+function retryBet(id) {
+  const entry = pendingBets.get(id);
+  if (!entry) return;
+  if (entry.sends >= BET_MAX_SENDS) {
+    pendingBets.delete(id);
+    setStatus("No reply from the server for your bet. Please check your bets.", "error");
+    return;
+  }
+  sendBet(entry.payload);
+}
+
+// bet_success / bet_error for one of our pending bets
+function settlePendingBet(payload) {
+  const entry = pendingBets.get(payload?.client_bet_id);
+  if (!entry) return;
+  clearTimeout(entry.timer);
+  pendingBets.delete(payload.client_bet_id);
+}
+
+function resendPendingBets() {
+  pendingBets.forEach((entry) => sendBet(entry.payload));
+}
+
 function handlePlaceBet() {
   unlockAudioOnce();
   if (isSpinning || redirectScheduled || gameFinished) return;
@@ -1240,12 +1386,13 @@ function handlePlaceBet() {
     setTimeout(() => {
       if (gameFinished || redirectScheduled || !socketConnected || !socket) return;
 
-      socket.emit("place_bet", {
+      sendBet({
         game_type: GAMETYPE,
         user_id: USER_ID,
         username: USERNAME,
         number: number,
-        round_code: currentRoundCode
+        round_code: currentRoundCode,
+        client_bet_id: newClientBetId()
       });
     }, index * 80);
   });
@@ -1270,8 +1417,11 @@ fetchBalance();
 updateWalletUI();
 
 fetchRouletteTableState();
-tableStateInterval = setInterval(fetchRouletteTableState, 1500);
-balanceInterval = setInterval(fetchBalance, 5000);
+tableStateInterval = setInterval(tickTable, 1000);
+// balance is pushed over the socket; poll only while it's down
+balanceInterval = setInterval(() => {
+  if (!socketConnected) fetchBalance();
+}, 5000);
 
 initSocket();
 
@@ -0,0 +1,54 @@
+"""
+Stand-in for the store's webhook receiver, for trying the wallet change
+webhooks locally:
+
+    python store_webhook_stub.py
+    STORE_WEBHOOK_URL=http://127.0.0.1:5055/webhook python app.py
+
+Checks the signature, prints each event and answers 204. Set
+STUB_FAIL_EVERY=N to answer 503 to every Nth batch and watch the retries.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+
+from flask import Flask, request
+
+SECRET = os.environ.get(
+    "STORE_WEBHOOK_SECRET",
+    os.environ.get("STORE_API_SECRET", "change-this-store-secret-now"),
+)
+FAIL_EVERY = int(os.environ.get("STUB_FAIL_EVERY", "0"))
+
+stub = Flask(__name__)
+seen_ids = set()
+batches = 0
+
+
+@stub.route("/webhook", methods=["POST"])
+def receive():
+    global batches
+    batches += 1
+    if FAIL_EVERY and batches % FAIL_EVERY == 0:
+        print(f"batch {batches}: failing on purpose")
+        return "", 503
+
+    body = request.get_data()
+    timestamp = request.headers.get("X-Store-Timestamp", "")
+    expected = hmac.new(SECRET.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(request.headers.get("X-Store-Signature", ""), "sha256=" + expected):
+        print("bad signature")
+        return "", 401
+
+    for event in json.loads(body)["events"]:
+        duplicate = " (duplicate)" if event["id"] in seen_ids else ""
+        seen_ids.add(event["id"])
+        print(f"#{event['id']} {event['event']} user={event['userid']} "
+              f"game={event.get('gamebalance')} store={event.get('storebalance')}{duplicate}")
+    return "", 204
+
+
+if __name__ == "__main__":
+    stub.run(host="127.0.0.1", port=int(os.environ.get("STUB_PORT", 5055)))
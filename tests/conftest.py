@@ -0,0 +1,110 @@
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import pytest
+
+# app.py configures itself from the environment at import time
+_tmp_dir = tempfile.mkdtemp(prefix="game-of-five-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp_dir, "test.db")
+os.environ["ROUND_JOURNAL"] = "off"
+os.environ["TABLE_STATE_STORE"] = ""
+os.environ["STORE_WEBHOOK_URL"] = ""
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _repo_dir)
+
+# the older sqlite3 migrations always open game.db next to app.py
+_stray_db = os.path.join(_repo_dir, "game.db")
+_stray_db_existed = os.path.exists(_stray_db)
+
+import app as game_app  # noqa: E402
+
+# table numbers well above the live pool, so round codes never collide
+_table_numbers = itertools.count(900)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stop_game_loops():
+    yield
+    game_app._draining.set()
+    if not _stray_db_existed and os.path.exists(_stray_db):
+        os.remove(_stray_db)
+
+
+@pytest.fixture
+def app_ctx():
+    with game_app.app.app_context():
+        yield game_app
+        game_app.db.session.rollback()
+
+
+@pytest.fixture
+def make_user(app_ctx):
+    """A player with a game wallet and a store wallet."""
+    def _make(game_balance=0, store_balance=0):
+        user = game_app.User(username=f"t-{uuid.uuid4().hex[:12]}", password_hash="x")
+        game_app.db.session.add(user)
+        game_app.db.session.flush()
+        game_app.db.session.add(game_app.Wallet(user_id=user.id, balance=game_balance))
+        game_app.db.session.add(game_app.StoreWallet(user_id=user.id, balance=store_balance))
+        game_app.db.session.commit()
+        return user
+    return _make
+
+
+@pytest.fixture
+def client(app_ctx):
+    return game_app.app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def _login(user):
+        with client.session_transaction() as sess:
+            sess["user_id"] = user.id
+        return client
+    return _login
+
+
+@pytest.fixture
+def table_number():
+    return next(_table_numbers)
+
+
+@pytest.fixture
+def open_table(app_ctx, monkeypatch, table_number):
+    """
+    A silver table owned by the test thread (mailbox calls run inline) with
+    betting open, standing in for the live silver tables.
+    """
+    table = game_app.GameTable("silver", table_number, 0)
+    table.mailbox.owner = threading.current_thread()
+    table._mono_close = time.monotonic() + 300
+    table._mono_end = table._mono_close + 60
+    monkeypatch.setitem(game_app.game_tables, "silver", [table])
+    monkeypatch.setattr(game_app, "scale_up_game_tables", lambda *a, **k: None)
+    return table
+
+
+@pytest.fixture
+def place_bet(app_ctx):
+    """admit_bet for `user` on `table`; returns its events."""
+    def _place(table, user, number, client_bet_id=None):
+        return game_app.admit_bet({
+            "game_type": table.game_type, "user_id": user.id, "username": user.username,
+            "number": number, "round_code": table.round_code, "client_bet_id": client_bet_id,
+        })
+    return _place
+
+
+@pytest.fixture
+def game_balance(app_ctx):
+    def _balance(user):
+        game_app.db.session.expire_all()
+        return game_app.Wallet.query.filter_by(user_id=user.id).first().balance
+    return _balance
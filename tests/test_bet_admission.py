@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+
+def _with_draw_after_debit(app, monkeypatch, table, after_resolve=None):
+    """Make the table resolve its held bets between the debit commit and the confirm."""
+    real_debit = app._debit_bet
+
+    def _debit_then_draw(*args):
+        balance = real_debit(*args)
+        app._resolve_held_bets(table)
+        if after_resolve:
+            after_resolve()
+        return balance
+
+    monkeypatch.setattr(app, "_debit_bet", _debit_then_draw)
+
+
+def test_bet_kept_by_the_draw_before_confirm_is_not_refunded(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch
+):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+    _with_draw_after_debit(app, monkeypatch, open_table)
+
+    events = place_bet(open_table, user, 4, "cb-draw")
+
+    assert events[0][0] == "bet_success"
+    assert events[0][1]["round_code"] == open_table.round_code
+    assert game_balance(user) == 1000 - stake
+    assert [b for b in open_table.bets if b["user_id"] == user.id and not b.get("held")]
+    assert app.Transaction.query.filter_by(user_id=user.id, kind="refund").count() == 0
+
+
+def test_bet_kept_by_a_round_that_already_ended_is_not_refunded(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch
+):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+    played_round = open_table.round_code
+
+    def _next_round():
+        open_table.bets = []
+        open_table.round_code = played_round + "-next"
+
+    _with_draw_after_debit(app, monkeypatch, open_table, after_resolve=_next_round)
+
+    events = place_bet(open_table, user, 4, "cb-ended")
+
+    assert events[0][0] == "bet_success"
+    assert events[0][1]["round_code"] == played_round
+    assert game_balance(user) == 1000 - stake
+
+
+def test_bet_dropped_by_the_draw_before_its_debit_is_refunded(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch
+):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    real_debit = app._debit_bet
+
+    def _draw_then_debit(*args):
+        app._resolve_held_bets(open_table)  # no committed debit yet: dropped
+        return real_debit(*args)
+
+    monkeypatch.setattr(app, "_debit_bet", _draw_then_debit)
+
+    events = place_bet(open_table, user, 4, "cb-late")
+
+    assert events[0][0] == "bet_error"
+    assert game_balance(user) == 1000
+    assert not [b for b in open_table.bets if b["user_id"] == user.id]
+
+
+def test_failed_debit_leaves_no_bet_on_the_table(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch
+):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+
+    def _db_down(*args):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(app, "_debit_bet", _db_down)
+    with pytest.raises(RuntimeError):
+        place_bet(open_table, user, 6, "cb-3")
+
+    assert not [b for b in open_table.bets if b["user_id"] == user.id]
+    assert game_balance(user) == 1000
+
+
+def test_concurrent_debits_never_overdraw_the_wallet(app_ctx, make_user, open_table, game_balance):
+    app = app_ctx
+    stake = open_table.config["bet_amount"]
+    user = make_user(game_balance=stake * 3)
+    wallet_id = app.Wallet.query.filter_by(user_id=user.id).first().id
+    results = []
+
+    def _debit(i):
+        with app.app.app_context():
+            results.append(app._debit_bet(wallet_id, user.id, stake, open_table, i, f"t-debit-{user.id}-{i}"))
+
+    threads = [threading.Thread(target=_debit, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len([r for r in results if r is not None]) == 3
+    assert results.count(None) == 5
+    assert game_balance(user) == 0
+    assert app.Transaction.query.filter_by(user_id=user.id, kind="bet").count() == 3
+
+
+def test_snapshots_leave_out_held_bets(app_ctx, make_user, open_table, login, monkeypatch):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    open_table.add_bet(user.id, user.username, 7, record_history=False, bet_ref="srv:held", held=True)
+
+    assert app._serialize_table(open_table, 0)["bets"] == []
+
+    monkeypatch.setattr(app, "_join_snapshot_cache", {})
+    sock = app.socketio.test_client(app.app, flask_test_client=login(user))
+    sock.emit("join_game", {"game_type": "silver", "user_id": user.id})
+    snapshot = next(r["args"][0] for r in sock.get_received() if r["name"] == "table_snapshot")
+    sock.disconnect()
+
+    assert snapshot["my_bets"] == []
+    assert all(t["bets"] == [] for t in snapshot["tables"])
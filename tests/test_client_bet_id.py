@@ -0,0 +1,48 @@
+def test_duplicate_client_bet_id_debits_once(app_ctx, make_user, open_table, place_bet, game_balance):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+
+    first = place_bet(open_table, user, 5, "cb-1")
+    retry = place_bet(open_table, user, 5, "cb-1")
+
+    assert first[0][0] == retry[0][0] == "bet_success"
+    assert retry[0][1]["new_balance"] == first[0][1]["new_balance"] == 1000 - stake
+    assert game_balance(user) == 1000 - stake
+    assert app.Transaction.query.filter_by(user_id=user.id, kind="bet").count() == 1
+    assert [b["number"] for b in open_table.bets if b["user_id"] == user.id] == [5]
+
+
+def test_client_bet_id_debited_before_a_restart_is_not_debited_again(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch
+):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+    place_bet(open_table, user, 5, "cb-2")
+
+    # same round, but the table state (and its receipts) was lost
+    fresh = app.GameTable("silver", open_table.table_number, 0)
+    fresh.round_code = open_table.round_code
+    fresh.mailbox.owner = open_table.mailbox.owner
+    fresh._mono_close, fresh._mono_end = open_table._mono_close, open_table._mono_end
+    monkeypatch.setitem(app.game_tables, "silver", [fresh])
+
+    events = place_bet(fresh, user, 5, "cb-2")
+
+    assert events[0][0] == "bet_success"
+    assert events[0][1]["new_balance"] == 1000 - stake
+    assert game_balance(user) == 1000 - stake
+    assert not [b for b in fresh.bets if b["user_id"] == user.id]
+
+
+def test_bet_error_echoes_the_client_bet_id(app_ctx, make_user, login):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    sock = app.socketio.test_client(app.app, flask_test_client=login(user))
+
+    sock.emit("place_bet", {"game_type": "nope", "user_id": user.id, "number": 1, "client_bet_id": "cb-err"})
+
+    errors = [r["args"][0] for r in sock.get_received() if r["name"] == "bet_error"]
+    assert errors and errors[0]["client_bet_id"] == "cb-err"
+    sock.disconnect()
@@ -0,0 +1,11 @@
+def test_external_credit_ref_is_credited_once(app_ctx, make_user, client, game_balance, monkeypatch):
+    monkeypatch.setattr(app_ctx, "verify_store_api_request", lambda req: True)
+    user = make_user()
+    item = {"userid": user.id, "cardvalue": 10, "quantity": 1, "paymentref": f"pay-{user.id}"}
+
+    single = client.post("/api/external/store/credit-game-wallet", json=item).get_json()
+    batch = client.post("/api/external/store/credit-game-wallet/batch", json={"items": [item, item]}).get_json()
+
+    assert single["message"] == "Game wallet credited successfully"
+    assert batch["summary"] == {"credited": 0, "duplicate": 2, "error": 0}
+    assert game_balance(user) == 10
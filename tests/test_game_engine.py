@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.mark.parametrize("mode", ["engine", "client"])
+def test_split_engine_needs_a_message_queue(app_ctx, monkeypatch, mode):
+    app = app_ctx
+    monkeypatch.setattr(app, "GAME_ENGINE_MODE", mode)
+    monkeypatch.setattr(app, "SOCKETIO_MESSAGE_QUEUE", "")
+
+    with pytest.raises(RuntimeError, match="SOCKETIO_MESSAGE_QUEUE"):
+        app._require_socketio_queue()
+
+    monkeypatch.setattr(app, "SOCKETIO_MESSAGE_QUEUE", "local")
+    app._require_socketio_queue()
+
+
+def test_embedded_mode_runs_without_a_message_queue(app_ctx, monkeypatch):
+    monkeypatch.setattr(app_ctx, "GAME_ENGINE_MODE", "embedded")
+    monkeypatch.setattr(app_ctx, "SOCKETIO_MESSAGE_QUEUE", "")
+    app_ctx._require_socketio_queue()
+
+
+def test_force_winner_returns_503_when_the_engine_is_down(app_ctx, client, monkeypatch):
+    app = app_ctx
+    monkeypatch.setattr(app, "GAME_ENGINE_MODE", "client")
+    monkeypatch.setattr(app, "engine_client", app.GameEngineClient("/nonexistent/engine.sock", b"x"))
+    start = (datetime.now(app.IST) + timedelta(hours=3)).strftime("%Y%m%d_%H%M")
+    round_code = f"S_{start}_907"
+    with client.session_transaction() as sess:
+        sess["is_superadmin"] = True
+
+    resp = client.post("/api/sa/force-winner", json={"round_code": round_code, "number": 4})
+    assert resp.status_code == 503
+    assert resp.get_json()["success"] is False
+    assert app.ForcedWinnerHistory.query.filter_by(round_code=round_code).count() == 0
+
+    resp = client.post("/api/sa/force-winner", json={"round_code": round_code, "number": ""})
+    assert resp.status_code == 503
@@ -0,0 +1,75 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+
+def _buy_card(client, key, card_value=10, quantity=1):
+    return client.post(
+        "/api/store/buy-card",
+        data=json.dumps({"card_value": card_value, "quantity": quantity}),
+        content_type="application/json",
+        headers={"Idempotency-Key": key},
+    )
+
+
+def test_idempotency_key_replays_the_first_response(app_ctx, make_user, login, game_balance):
+    user = make_user(store_balance=1000)
+    client = login(user)
+
+    first = _buy_card(client, "k-replay")
+    again = _buy_card(client, "k-replay")
+
+    assert first.status_code == again.status_code == 200
+    assert again.headers.get("Idempotent-Replayed") == "true"
+    assert again.get_json() == first.get_json()
+    assert game_balance(user) == 10
+
+
+def test_idempotency_key_reused_for_another_request_is_422(app_ctx, make_user, login):
+    client = login(make_user(store_balance=1000))
+
+    assert _buy_card(client, "k-reuse", card_value=10).status_code == 200
+    assert _buy_card(client, "k-reuse", card_value=50).status_code == 422
+
+
+def _reserve_key(app, user, key, body, locked_until):
+    app.db.session.add(app.IdempotencyRecord(
+        user_id=user.id, endpoint="buy_card", key=key,
+        request_hash=hashlib.sha256(body.encode()).hexdigest(), locked_until=locked_until,
+    ))
+    app.db.session.commit()
+
+
+def test_idempotency_key_in_progress_is_409(app_ctx, make_user, login, game_balance):
+    user = make_user(store_balance=1000)
+    client = login(user)
+    body = json.dumps({"card_value": 10, "quantity": 1})
+    _reserve_key(app_ctx, user, "k-running", body, datetime.utcnow() + timedelta(seconds=30))
+
+    assert _buy_card(client, "k-running").status_code == 409
+    assert game_balance(user) == 0
+
+
+def test_idempotency_key_with_expired_lease_is_taken_over(app_ctx, make_user, login, game_balance):
+    user = make_user(store_balance=1000)
+    client = login(user)
+    body = json.dumps({"card_value": 10, "quantity": 1})
+    # the request that reserved it died without recording a response
+    _reserve_key(app_ctx, user, "k-crashed", body, datetime.utcnow() - timedelta(seconds=1))
+
+    resp = _buy_card(client, "k-crashed")
+
+    assert resp.status_code == 200
+    assert game_balance(user) == 10
+    assert _buy_card(client, "k-crashed").headers.get("Idempotent-Replayed") == "true"
+
+
+def test_idempotency_cache_entries_expire(app_ctx):
+    app = app_ctx
+    cache_key = (0, "buy_card", "k-cache")
+    app._idempotency_cache_put(cache_key, ("h", 200, "{}"),
+                               datetime.utcnow() - timedelta(hours=app.IDEMPOTENCY_TTL_HOURS, seconds=1))
+    assert app._idempotency_cache_get(cache_key) is None
+
+    app._idempotency_cache_put(cache_key, ("h", 200, "{}"))
+    assert app._idempotency_cache_get(cache_key) == ("h", 200, "{}")
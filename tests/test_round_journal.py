@@ -0,0 +1,68 @@
+from datetime import datetime
+
+
+def _restart(app, journal_path, table):
+    """A fresh process: reopen the journal and restore `table`'s round onto a new table."""
+    journal = app.RoundJournal(journal_path)
+    state = journal.load()[(table.game_type, table.table_number)]
+    restored = app.GameTable(table.game_type, table.table_number, 0)
+    assert app._restore_table(restored, state)
+    return restored
+
+
+def test_restored_round_keeps_its_bets_and_settles(
+    app_ctx, make_user, open_table, place_bet, game_balance, monkeypatch, tmp_path
+):
+    app = app_ctx
+    path = str(tmp_path / "round_journal.log")
+    monkeypatch.setattr(app, "round_journal", app.RoundJournal(path))
+    user = make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+    place_bet(open_table, user, 3, "cb-journal")
+
+    restored = _restart(app, path, open_table)
+
+    assert restored.round_code == open_table.round_code
+    assert [(b["user_id"], b["number"]) for b in restored.bets] == [(user.id, 3)]
+
+    # the loop settles the resumed round as usual
+    restored.is_finished, restored.result = True, 3
+    app._settle_round(restored, lambda *a: None, datetime.utcnow())
+    assert game_balance(user) == 1000 - stake + open_table.config["payout"]
+
+
+def test_held_bet_paid_before_a_crash_survives_the_restart(
+    app_ctx, make_user, open_table, game_balance, monkeypatch, tmp_path
+):
+    app = app_ctx
+    path = str(tmp_path / "round_journal.log")
+    monkeypatch.setattr(app, "round_journal", app.RoundJournal(path))
+    paid, unpaid = make_user(game_balance=1000), make_user(game_balance=1000)
+    stake = open_table.config["bet_amount"]
+
+    for user, number in ((paid, 1), (unpaid, 2)):
+        assert app._hold_bet(
+            open_table, user.id, user.username, number, open_table.round_code, None, f"srv:{user.id}"
+        ) is True
+    wallet_id = app.Wallet.query.filter_by(user_id=paid.id).first().id
+    app._debit_bet(wallet_id, paid.id, stake, open_table, 1, f"srv:{paid.id}")
+    # crash: neither bet was confirmed, and the unpaid one never debited
+
+    restored = _restart(app, path, open_table)
+
+    assert [(b["user_id"], b["number"]) for b in restored.bets] == [(paid.id, 1)]
+    assert not any(b.get("held") for b in restored.bets)
+    assert game_balance(paid) == 1000 - stake
+    assert game_balance(unpaid) == 1000
+
+
+def test_torn_final_frame_is_ignored(app_ctx, open_table, tmp_path):
+    app = app_ctx
+    path = str(tmp_path / "round_journal.log")
+    journal = app.RoundJournal(path)
+    journal.record(open_table)
+    journal.sync()
+    with open(path, "ab") as f:
+        f.write(app.RoundJournal._HEADER.pack(1000) + b"partial")
+
+    assert (open_table.game_type, open_table.table_number) in app.RoundJournal(path).load()
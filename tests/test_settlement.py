@@ -0,0 +1,85 @@
+from datetime import datetime
+
+
+def _finished_round(app, table_number, user, number=4):
+    """A silver round that was drawn (is_finished) but never settled."""
+    table = app.GameTable("silver", table_number, 0)
+    table.bets = [{
+        "user_id": user.id, "username": user.username, "number": number,
+        "is_bot": False, "bet_amount": table.config["bet_amount"], "bet_time": datetime.utcnow(),
+    }]
+    table.is_finished = True
+    table.result = number
+    return table
+
+
+def _win_count(app, table):
+    return app.Transaction.query.filter_by(kind="win", client_ref=f"win:{table.round_code}").count()
+
+
+def test_settling_a_round_twice_pays_once(app_ctx, make_user, game_balance, table_number):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+    table = _finished_round(app, table_number, user)
+
+    app._settle_round(table, lambda *a: None, datetime.utcnow())
+    assert table.is_settled
+    # a new lease owner finds the round finished but not marked settled
+    table.is_settled = False
+    app._settle_round(table, lambda *a: None, datetime.utcnow())
+
+    assert game_balance(user) == 1000 + table.config["payout"]
+    assert _win_count(app, table) == 1
+
+
+def test_settling_a_round_twice_counts_it_once(app_ctx, make_user, table_number):
+    app = app_ctx
+    winner, loser = make_user(), make_user()
+    table = _finished_round(app, table_number, winner, number=2)
+    table.bets.append(dict(table.bets[0], user_id=loser.id, username=loser.username, number=5))
+
+    app._settle_round(table, lambda *a: None, datetime.utcnow())
+    table.is_settled = False
+    app._settle_round(table, lambda *a: None, datetime.utcnow())
+
+    won = app.UserWinControl.query.filter_by(user_id=winner.id, game_type="silver").one()
+    lost = app.UserWinControl.query.filter_by(user_id=loser.id, game_type="silver").one()
+    assert (won.played_rounds, won.total_wins, won.loss_streak) == (1, 1, 0)
+    assert (lost.played_rounds, lost.total_wins, lost.loss_streak) == (1, 0, 1)
+
+
+def test_takeover_pays_winners_the_old_owner_missed(app_ctx, make_user, game_balance, table_number):
+    app = app_ctx
+    paid, missed = make_user(game_balance=0), make_user(game_balance=0)
+    table = _finished_round(app, table_number, paid, number=1)
+    table.bets.append(dict(table.bets[0], user_id=missed.id, username=missed.username, number=2))
+
+    # the old owner paid one winner, then died before settling the round
+    table.result = 1
+    app._pay_round_winners(table, 1)
+    app.db.session.commit()
+
+    # both numbers win for the new owner's settlement check
+    table.get_winners = lambda: [
+        {"user_id": paid.id, "payout": table.config["payout"]},
+        {"user_id": missed.id, "payout": table.config["payout"]},
+    ]
+    app._settle_round(table, lambda *a: None, datetime.utcnow())
+
+    assert game_balance(paid) == table.config["payout"]
+    assert game_balance(missed) == table.config["payout"]
+    assert _win_count(app, table) == 2
+
+
+def test_client_bet_id_cannot_claim_a_win_ref(app_ctx, make_user, open_table):
+    app = app_ctx
+    user = make_user(game_balance=1000)
+
+    events = app.admit_bet({
+        "game_type": "silver", "user_id": user.id, "username": user.username, "number": 3,
+        "round_code": open_table.round_code, "client_bet_id": f"win:{open_table.round_code}",
+    })
+
+    assert events[0][0] == "bet_success"
+    bet_tx = app.Transaction.query.filter_by(user_id=user.id, kind="bet").one()
+    assert not bet_tx.client_ref.startswith("win:")
@@ -0,0 +1,93 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+
+def _product(app, stock, price=10):
+    product = app.Product(title="Test item", slug=f"t-{uuid.uuid4().hex[:12]}", price=price,
+                          stock=stock, is_active=True)
+    app.db.session.add(product)
+    app.db.session.commit()
+    return product
+
+
+def _stock(app, product):
+    app.db.session.expire_all()
+    return app.db.session.get(app.Product, product.id).stock
+
+
+def test_concurrent_stock_takes_never_oversell(app_ctx):
+    app = app_ctx
+    product = _product(app, stock=5)
+    results = []
+
+    def _take():
+        with app.app.app_context():
+            short = app._take_stock({product.id: 1})
+            if short is None:
+                app.db.session.commit()
+            else:
+                app.db.session.rollback()
+            results.append(short)
+
+    threads = [threading.Thread(target=_take) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(None) == 5
+    assert _stock(app, product) == 0
+
+
+def test_checkouts_never_overspend_the_store_wallet(app_ctx, make_user, login):
+    app = app_ctx
+    user = make_user(store_balance=25)
+    client = login(user)
+    product = _product(app, stock=10, price=10)
+
+    codes = [
+        client.post("/api/store/checkout", json={"items": [{"product_id": product.id, "qty": 1}]}).status_code
+        for _ in range(4)
+    ]
+
+    assert codes == [200, 200, 400, 400]
+    app.db.session.expire_all()
+    assert app.StoreWallet.query.filter_by(user_id=user.id).first().balance == 5
+    assert _stock(app, product) == 8
+
+
+def test_failed_checkout_releases_its_hold(app_ctx, make_user, login):
+    app = app_ctx
+    client = login(make_user(store_balance=5))
+    product = _product(app, stock=3, price=10)
+
+    token = client.post(
+        "/api/store/reserve", json={"items": [{"product_id": product.id, "qty": 2}]}
+    ).get_json()["reservation_token"]
+    assert _stock(app, product) == 1
+
+    resp = client.post("/api/store/checkout", json={"reservation_token": token})
+
+    assert resp.status_code == 400
+    assert _stock(app, product) == 3
+    assert {r.status for r in app.StockReservation.query.filter_by(token=token)} == {"RELEASED"}
+
+
+def test_expired_holds_are_swept_at_checkout(app_ctx, make_user, login):
+    app = app_ctx
+    client = login(make_user(store_balance=100))
+    product = _product(app, stock=2, price=10)
+
+    token = client.post(
+        "/api/store/reserve", json={"items": [{"product_id": product.id, "qty": 2}]}
+    ).get_json()["reservation_token"]
+    app.StockReservation.query.filter_by(token=token).update(
+        {"expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    app.db.session.commit()
+
+    resp = client.post("/api/store/checkout", json={"items": [{"product_id": product.id, "qty": 2}]})
+
+    assert resp.status_code == 200
+    assert _stock(app, product) == 0
@@ -0,0 +1,49 @@
+import json
+
+
+class _FakeSession:
+    def __init__(self, on_post=None):
+        self.batches = []
+        self.on_post = on_post
+
+    def post(self, url, data, headers, timeout):
+        self.batches.append([e["id"] for e in json.loads(data)["events"]])
+        if self.on_post:
+            self.on_post()
+        return type("Resp", (), {"status_code": 200})()
+
+
+def _pending(app):
+    return app.StoreOutbox.query.filter(app.StoreOutbox.delivered_at.is_(None))
+
+
+def test_events_carry_a_per_user_version(app_ctx, make_user, monkeypatch):
+    app = app_ctx
+    monkeypatch.setattr(app, "STORE_WEBHOOK_URL", "http://store.invalid/hook")
+    user = make_user()
+
+    for balance in (10, 20, 30):
+        app.enqueue_store_event("test", user.id, balance)
+        app.db.session.commit()
+
+    rows = app.StoreOutbox.query.filter_by(user_id=user.id).order_by(app.StoreOutbox.id).all()
+    assert [json.loads(r.payload)["version"] for r in rows] == [1, 2, 3]
+
+
+def test_a_claimed_batch_is_sent_by_one_dispatcher(app_ctx, make_user, monkeypatch):
+    app = app_ctx
+    monkeypatch.setattr(app, "STORE_WEBHOOK_URL", "http://store.invalid/hook")
+    _pending(app).update({"delivered_at": app.datetime.utcnow()})
+    user = make_user()
+    app.enqueue_store_event("test", user.id, 10)
+    app.db.session.commit()
+
+    other = app.StoreWebhookDispatcher("http://store.invalid/hook", "secret")
+    other.session = _FakeSession()
+    first = app.StoreWebhookDispatcher("http://store.invalid/hook", "secret")
+    # the other dispatcher polls while the first one is mid-send
+    first.session = _FakeSession(on_post=lambda: other.dispatch_once())
+
+    assert first.dispatch_once() == 1
+    assert other.session.batches == []
+    assert _pending(app).count() == 0
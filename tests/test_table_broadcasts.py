@@ -0,0 +1,74 @@
+import time
+
+
+def _capture_updates(app, monkeypatch, table):
+    """update_table payloads for `table` (the live game loops broadcast too)."""
+    sent = []
+
+    def _emit(event, payload=None, **kwargs):
+        if event == "update_table" and payload["table_number"] == table.table_number:
+            sent.append(payload)
+
+    monkeypatch.setattr(app.socketio, "emit", _emit)
+    return sent
+
+
+def test_mutations_inside_the_window_go_out_as_one_update(app_ctx, open_table, monkeypatch):
+    app = app_ctx
+    sent = _capture_updates(app, monkeypatch, open_table)
+    coalescer = app.TableBroadcastCoalescer(0.05)
+
+    for _ in range(5):
+        coalescer.schedule(open_table)
+    time.sleep(0.2)
+
+    assert len(sent) == 1
+    assert coalescer.stats()["mutations"] == 5
+
+
+def test_deltas_list_only_the_bets_added_since_the_last_update(app_ctx, open_table, monkeypatch):
+    app = app_ctx
+    sent = _capture_updates(app, monkeypatch, open_table)
+    coalescer = app.TableBroadcastCoalescer(0, deltas=True)
+
+    open_table.add_bet(1, "a", 1, record_history=False)
+    coalescer.schedule(open_table)
+    open_table.add_bet(2, "b", 2, record_history=False)
+    open_table.add_bet(3, "c", 3, record_history=False, bet_ref="srv:held", held=True)
+    coalescer.schedule(open_table)
+
+    full, delta = sent
+    assert "delta" not in full and [b["number"] for b in full["bets"]] == [1]
+    assert delta["delta"] is True
+    assert [b["number"] for b in delta["added"]] == [2]  # the held bet waits for its confirm
+    assert delta["base_version"] == full["version"] < delta["version"]
+
+
+def test_a_new_round_is_sent_in_full(app_ctx, open_table, monkeypatch):
+    app = app_ctx
+    sent = _capture_updates(app, monkeypatch, open_table)
+    coalescer = app.TableBroadcastCoalescer(0, deltas=True)
+
+    open_table.add_bet(1, "a", 1, record_history=False)
+    coalescer.schedule(open_table)
+    open_table.round_code += "-next"
+    open_table.bets = []
+    coalescer.schedule(open_table)
+
+    assert "delta" not in sent[1] and sent[1]["bets"] == []
+    assert sent[1]["version"] > sent[0]["version"]
+
+
+def test_resync_replies_with_a_full_snapshot(app_ctx, open_table, login, make_user, monkeypatch):
+    app = app_ctx
+    monkeypatch.setattr(app, "_join_snapshot_cache", {})
+    open_table.add_bet(1, "a", 4, record_history=False)
+    sock = app.socketio.test_client(app.app, flask_test_client=login(make_user()))
+
+    sock.emit("resync", {"game_type": "silver"})
+    snapshot = next(r["args"][0] for r in sock.get_received() if r["name"] == "table_snapshot")
+    sock.disconnect()
+
+    (table,) = snapshot["tables"]
+    assert [b["number"] for b in table["bets"]] == [4]
+    assert table["version"] > 0
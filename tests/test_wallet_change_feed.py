@@ -0,0 +1,26 @@
+def _feed(client, since):
+    return client.get(f"/api/external/store/wallet-changes?since={since}").get_json()
+
+
+def test_a_change_committed_late_with_a_lower_id_is_still_served(app_ctx, client, monkeypatch):
+    app = app_ctx
+    monkeypatch.setattr(app, "verify_store_api_request", lambda req: True)
+    cursor = _feed(client, 0)["latest_seq"]
+    while True:
+        page = _feed(client, cursor)
+        cursor = page["latest_seq"]
+        if not page["has_more"]:
+            break
+
+    top_id = app.db.session.query(app.func.max(app.WalletChange.id)).scalar() or 0
+    app.db.session.add(app.WalletChange(id=top_id + 100, user_id=1, wallet="game", delta=1, balance=1))
+    app.db.session.commit()
+    first = _feed(client, cursor)
+    # a transaction that took its id earlier commits after the store read past it
+    app.db.session.add(app.WalletChange(id=top_id + 50, user_id=2, wallet="game", delta=1, balance=1))
+    app.db.session.commit()
+    second = _feed(client, first["latest_seq"])
+
+    assert [c["userid"] for c in first["changes"]] == [1]
+    assert [c["userid"] for c in second["changes"]] == [2]
+    assert second["changes"][0]["seq"] > first["latest_seq"]